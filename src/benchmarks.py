@@ -0,0 +1,382 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+
+import numpy as np
+
+from parsing import *
+from estimation import *
+from kalman import *
+from replay import *
+from synthetic import *
+from orbit_table import *
+
+# Times a function call and returns (seconds, result)
+def timed(function, *args, **kwargs):
+    start = time.perf_counter()
+
+    result = function(*args, **kwargs)
+
+    return (time.perf_counter() - start, result)
+
+# Compares the batched solver with the per-epoch solver
+def benchmark_solvers(gps_list: list[GPSSatellite]) -> dict:
+    # the per-epoch solver uses every satellite at the reception time, so the batched solver does too
+    (batched_time, batched_positions) = timed(lambda: compute_fixes(gps_list, elevation_mask=None, raim=False, light_time=False).positions)
+    (per_epoch_time, per_epoch_positions) = timed(estimate_positions_per_epoch, gps_list)
+
+    difference = np.linalg.norm(batched_positions - per_epoch_positions, axis=1)
+
+    return {
+        "epochs": len(batched_positions),
+        "per_epoch_seconds": per_epoch_time,
+        "batched_seconds": batched_time,
+        "speedup": per_epoch_time / batched_time,
+        "max_difference_meters": float(np.max(difference, initial=0)),
+    }
+
+# Compares the batch solver with the warm-started sequential solver
+def benchmark_warm_start(gps_list: list[GPSSatellite]) -> dict:
+    (batch_time, batch) = timed(compute_fixes, gps_list, solver="batch")
+    (sequential_time, sequential) = timed(compute_fixes, gps_list, solver="sequential")
+
+    difference = np.linalg.norm(batch.positions - sequential.positions, axis=1)
+
+    return {
+        "epochs": len(batch.times),
+        "batch_seconds": batch_time,
+        "batch_iterations": int(np.sum(batch.iterations)),
+        "sequential_seconds": sequential_time,
+        "sequential_iterations": int(np.sum(sequential.iterations)),
+        "sequential_mean_iterations_per_epoch": float(np.mean(sequential.iterations)) if len(sequential.iterations) > 0 else 0.0,
+        "sequential_max_iterations_per_epoch": int(np.max(sequential.iterations, initial=0)),
+        "max_difference_meters": float(np.max(difference, initial=0)),
+    }
+
+# Kalman filter settings of the recorded data, passed to PositionKalmanFilter by benchmark_kalman
+# the pseudoranges are not corrected for the satellite clocks, which leaves post-fit residuals of about 60 km RMS,
+# and the recorded receiver is static, a filter free to move follows the slow drift of the clock errors instead
+RECORDING_KALMAN_OPTIONS = {
+    "measurement_noise": 60000.0,
+    "acceleration_noise": 1e-8,
+    "initial_velocity_sigma": 0.01,
+}
+
+# Compares the Kalman filter with the batch least squares solver
+# the epoch to epoch jump of the fixes measures how smooth they are
+def benchmark_kalman(gps_list: list[GPSSatellite], kalman_options: dict = RECORDING_KALMAN_OPTIONS) -> dict:
+    # the Kalman filter uses every satellite at the reception time without fault exclusion, so the batch fixes do too
+    (batch_time, batch) = timed(compute_fixes, gps_list, solver="batch", elevation_mask=None, raim=False, light_time=False)
+
+    kalman_filter = PositionKalmanFilter(max_satellites=len(gps_list) + 4, **kalman_options)
+    (kalman_time, kalman) = timed(filter_fixes, gps_list, kalman_filter=kalman_filter)
+
+    batch_jumps = np.linalg.norm(np.diff(batch.positions, axis=0), axis=1)
+    kalman_jumps = np.linalg.norm(np.diff(kalman.positions, axis=0), axis=1)
+
+    return {
+        "epochs": len(kalman.times),
+        "batch_seconds": batch_time,
+        "batch_microseconds_per_epoch": batch_time / max(len(batch.times), 1) * 1e6,
+        "batch_median_jump_meters": float(np.median(batch_jumps)) if len(batch_jumps) > 0 else 0.0,
+        "batch_p99_jump_meters": float(np.percentile(batch_jumps, 99)) if len(batch_jumps) > 0 else 0.0,
+        "kalman_seconds": kalman_time,
+        "kalman_microseconds_per_epoch": kalman_time / max(len(kalman.times), 1) * 1e6,
+        "kalman_median_jump_meters": float(np.median(kalman_jumps)) if len(kalman_jumps) > 0 else 0.0,
+        "kalman_p99_jump_meters": float(np.percentile(kalman_jumps, 99)) if len(kalman_jumps) > 0 else 0.0,
+        "kalman_resets": kalman_filter.resets,
+        "kalman_downweighted_measurements": kalman_filter.downweighted,
+    }
+
+# Decodes a parsed RTCM 1002 message the way RTCM1002 used to, with f-string attribute names and Python loops
+# kept as a reference for the decoder benchmark
+def legacy_decode_1002(message) -> list[float]:
+    svs = []
+    reminders = []
+    ambiguities = []
+    pseudoranges = []
+
+    for i in range(1, message.DF006 + 1):
+        if i < 10:
+            attribute: str = f"DF009_0{i}"
+        elif i >= 10:
+            attribute: str = f"DF009_{i}"
+
+        svs.append(message.__getattribute__(attribute))
+
+    for i in range(1, message.DF006 + 1):
+        if i < 10:
+            attribute: str = f"DF011_0{i}"
+        elif i >= 10:
+            attribute: str = f"DF011_{i}"
+
+        reminders.append(message.__getattribute__(attribute))
+
+    for i in range(1, message.DF006 + 1):
+        if i < 10:
+            attribute: str = f"DF014_0{i}"
+        elif i >= 10:
+            attribute: str = f"DF014_{i}"
+
+        ambiguities.append(message.__getattribute__(attribute))
+
+    for i in range(0, message.DF006):
+        pseudoranges.append(ambiguities[i] * 299792.458 + reminders[i])
+
+    return pseudoranges
+
+# Compares RTCM 1002 decoders in messages per second
+def benchmark_decoders(data_path: str) -> dict:
+    raw_messages = [raw_data for raw_data in read_frames(data_path) if message_type(raw_data) == 1002]
+    parsed_messages = [RTCMReader.parse(raw_data) for raw_data in raw_messages]
+
+    (legacy_time, legacy) = timed(lambda: [legacy_decode_1002(message) for message in parsed_messages])
+    (cached_time, cached) = timed(lambda: [RTCM1002(message) for message in parsed_messages])
+    (raw_time, raw) = timed(lambda: [RTCM1002.from_raw(raw_data) for raw_data in raw_messages])
+    (pyrtcm_time, parsed) = timed(lambda: [RTCM1002(RTCMReader.parse(raw_data)) for raw_data in raw_messages])
+
+    difference = max([np.max(np.abs(np.array(legacy[i]) - raw[i].pseudoranges), initial=0) for i in range(0, len(raw))], default=0)
+
+    return {
+        "messages": len(raw_messages),
+        "legacy_messages_per_second": len(raw_messages) / legacy_time,
+        "cached_names_messages_per_second": len(raw_messages) / cached_time,
+        "pyrtcm_parse_and_decode_messages_per_second": len(raw_messages) / pyrtcm_time,
+        "raw_bits_messages_per_second": len(raw_messages) / raw_time,
+        "max_difference_meters": float(difference),
+    }
+
+# Compares orbit propagation modes in positions per second and position error against the "full" mode
+def benchmark_orbits(gps_list: list[GPSSatellite], repeats: int = 5) -> dict:
+    results = {}
+
+    original_modes = [gps.orbit_mode for gps in gps_list]
+
+    positions = {}
+
+    for mode in ORBIT_MODES:
+        for gps in gps_list:
+            gps.orbit_mode = mode
+
+        # ecef_at does not go through POSITION_CACHE, so every repeat computes the positions again
+        (seconds, positions[mode]) = timed(lambda: [[gps.ecef_at(gps.times_of_pseudoranges, gps.ephemeris_indices(gps.times_of_pseudoranges)) for gps in gps_list] for i in range(0, repeats)])
+
+        positions[mode] = np.concatenate(positions[mode][0])
+
+        results[f"{mode}_positions_per_second"] = repeats * len(positions[mode]) / seconds
+
+    for mode in ORBIT_MODES:
+        error = np.linalg.norm(positions[mode] - positions["full"], axis=1)
+
+        results[f"{mode}_mean_error_meters"] = float(np.mean(error))
+        results[f"{mode}_max_error_meters"] = float(np.max(error))
+
+    for i in range(0, len(gps_list)):
+        gps_list[i].orbit_mode = original_modes[i]
+
+    # anomaly error of the series expansion along the orbit, and iterations of the Kepler solvers
+    mean_anomalies = np.linspace(-np.pi, np.pi, 100000)
+    eccentricities = np.full(len(mean_anomalies), max([np.max(gps.eccentricities) for gps in gps_list], default=0.02))
+
+    (series_time, series) = timed(true_anomaly_series, mean_anomalies, eccentricities)
+    (newton_time, (newton, newton_iterations)) = timed(eccentric_anomaly, mean_anomalies, eccentricities, method="newton")
+    (halley_time, (halley, halley_iterations)) = timed(eccentric_anomaly, mean_anomalies, eccentricities, method="halley")
+
+    exact = true_anomaly_from_eccentric(newton, eccentricities)
+    semi_major_axis = max([np.max(gps.semi_major_axes) for gps in gps_list], default=26560000)
+
+    results["eccentricity"] = float(eccentricities[0])
+    results["series_max_anomaly_error_meters"] = float(np.max(np.abs(np.angle(np.exp(1j * (series - exact))))) * semi_major_axis)
+    results["series_anomalies_per_second"] = len(mean_anomalies) / series_time
+    results["newton_iterations"] = newton_iterations
+    results["newton_anomalies_per_second"] = len(mean_anomalies) / newton_time
+    results["halley_iterations"] = halley_iterations
+    results["halley_anomalies_per_second"] = len(mean_anomalies) / halley_time
+
+    return results
+
+# Compares orbit table queries with direct orbit evaluation at a high observation rate over the measurements of every satellite
+def benchmark_orbit_table(gps_list: list[GPSSatellite], rate: float = 20.0, orbit_mode: str = "full") -> dict:
+    original_modes = [gps.orbit_mode for gps in gps_list]
+
+    build_seconds = 0.0
+    table_seconds = 0.0
+    direct_seconds = 0.0
+    queries = 0
+    evaluations = 0
+    table_bytes = 0
+    max_error = 0.0
+
+    for gps in gps_list:
+        gps.orbit_mode = orbit_mode
+
+        if len(gps.times_of_pseudoranges) < 2:
+            continue
+
+        (start, end) = (np.min(gps.times_of_pseudoranges), np.max(gps.times_of_pseudoranges))
+
+        times = np.arange(start, end, 1 / rate)
+
+        (seconds, table) = timed(OrbitTable, gps, start, end)
+        build_seconds += seconds
+
+        (seconds, table_positions) = timed(table.position_ecef, times)
+        table_seconds += seconds
+
+        # ecef_at does not go through POSITION_CACHE, so the direct positions are computed and not cached
+        (seconds, direct_positions) = timed(lambda: gps.ecef_at(times, gps.ephemeris_indices(times)))
+        direct_seconds += seconds
+
+        queries += len(times)
+        evaluations += table.evaluations
+        table_bytes += table.nbytes()
+        max_error = max(max_error, float(np.max(np.linalg.norm(table_positions - direct_positions, axis=1), initial=0)))
+
+    for i in range(0, len(gps_list)):
+        gps_list[i].orbit_mode = original_modes[i]
+
+    return {
+        "rate": rate,
+        "orbit_mode": orbit_mode,
+        "queries": queries,
+        "build_seconds": build_seconds,
+        "build_evaluations": evaluations,
+        "table_bytes": table_bytes,
+        "table_positions_per_second": queries / table_seconds if table_seconds > 0 else None,
+        "direct_positions_per_second": queries / direct_seconds if direct_seconds > 0 else None,
+        "speedup": direct_seconds / table_seconds if table_seconds > 0 else None,
+        "max_error_meters": max_error,
+    }
+
+# Generates a synthetic session, times every stage of the pipeline on it and checks the fixes against the ground truth
+def benchmark_synthetic(folder: str, num_satellites: int, duration: float, rate: float, orbit_mode: str = "full", seed: int = 0) -> dict:
+    data_path = os.path.join(folder, f"synthetic_{num_satellites}_{duration:g}_{rate:g}.rtcm3")
+
+    (generate_time, truth) = timed(generate_session, data_path, num_satellites, duration, rate, seed=seed)
+
+    (parse_time, (messages1002, messages1019)) = timed(parse_data, data_path)
+    (sort_time, gps_list) = timed(sort_gps, messages1002, messages1019)
+
+    for gps in gps_list:
+        gps.orbit_mode = orbit_mode
+
+    # time uncached computations only
+    POSITION_CACHE.clear()
+    FIX_CACHE.clear()
+
+    (orbit_time, _) = timed(lambda: [gps.position_ecef() for gps in gps_list])
+    # synthetic satellites are observed even below the horizon, so none are masked
+    (solve_time, fixes) = timed(estimate_fixes, gps_list, elevation_mask=None)
+
+    errors = np.linalg.norm(fixes.positions - truth["position"], axis=1)
+    clock_errors = np.abs(fixes.clock_biases - np.interp(fixes.times, truth["times"], truth["clock_biases"]))
+
+    return {
+        "satellites": num_satellites,
+        "duration_seconds": duration,
+        "rate_hz": rate,
+        "orbit_mode": orbit_mode,
+        "file_bytes": os.path.getsize(data_path),
+        "messages": len(messages1002) + len(messages1019),
+        "epochs": len(truth["times"]),
+        "fixes": len(fixes.times),
+        "generate_seconds": generate_time,
+        "parse_seconds": parse_time,
+        "sort_seconds": sort_time,
+        "orbit_seconds": orbit_time,
+        "solve_seconds": solve_time,
+        "rms_error_meters": float(np.sqrt(np.mean(errors ** 2))) if len(errors) > 0 else None,
+        "max_error_meters": float(np.max(errors, initial=0)),
+        "max_clock_error_meters": float(np.max(clock_errors, initial=0)),
+    }
+
+# Runs benchmark_synthetic while growing one dimension at a time from a base case
+def benchmark_scaling(satellite_counts: list[int], durations: list[float], rates: list[float], base: tuple = (8, 600, 1), orbit_mode: str = "full") -> list[dict]:
+    (base_satellites, base_duration, base_rate) = base
+
+    cases = [(base_satellites, base_duration, base_rate)]
+    cases += [(count, base_duration, base_rate) for count in satellite_counts]
+    cases += [(base_satellites, duration, base_rate) for duration in durations]
+    cases += [(base_satellites, base_duration, rate) for rate in rates]
+
+    # keep the order but run every case once
+    cases = list(dict.fromkeys(cases))
+
+    results = []
+
+    with tempfile.TemporaryDirectory() as folder:
+        for (num_satellites, duration, rate) in cases:
+            results.append(benchmark_synthetic(folder, num_satellites, duration, rate, orbit_mode))
+
+            print_results("synthetic", results[-1])
+
+    return results
+
+# Describes the code and machine that produced benchmark results
+def environment() -> dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+
+    return {
+        "commit": commit,
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+    }
+
+# Prints benchmark results
+def print_results(name: str, results: dict):
+    print(f"{name}:")
+
+    for (key, value) in results.items():
+        print(f"    {key}: {value}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks for GPS-From-Scratch")
+    parser.add_argument("data_path", nargs="?", help="path to RTCM file")
+    parser.add_argument("--synthetic", action="store_true", help="run the scaling benchmarks on generated RTCM data")
+    parser.add_argument("--satellites", default="4,8,16,31", help="comma separated satellite counts of the synthetic benchmarks")
+    parser.add_argument("--durations", default="600,3600,14400", help="comma separated durations of the synthetic benchmarks (seconds)")
+    parser.add_argument("--rates", default="1,5,10", help="comma separated epoch rates of the synthetic benchmarks (Hz)")
+    parser.add_argument("--orbit-mode", choices=ORBIT_MODES, default="full", help="orbit propagation of the synthetic benchmarks")
+    parser.add_argument("--output", metavar="PATH", help="write the results as JSON")
+    args = parser.parse_args()
+
+    if args.data_path is None and not args.synthetic:
+        parser.error("give a RTCM file or --synthetic")
+
+    results = {"environment": environment()}
+
+    if args.data_path is not None:
+        results["decoders"] = benchmark_decoders(args.data_path)
+        print_results("decoders", results["decoders"])
+
+        (messages1002, messages1019) = parse_data(args.data_path)
+
+        gps_list = sort_gps(messages1002, messages1019)
+
+        for (name, benchmark) in (("solvers", benchmark_solvers), ("warm start", benchmark_warm_start), ("kalman", benchmark_kalman), ("orbits", benchmark_orbits), ("orbit table", benchmark_orbit_table)):
+            results[name] = benchmark(gps_list)
+            print_results(name, results[name])
+
+    if args.synthetic:
+        satellite_counts = [int(count) for count in args.satellites.split(",")]
+        durations = [float(duration) for duration in args.durations.split(",")]
+        rates = [float(rate) for rate in args.rates.split(",")]
+
+        results["synthetic"] = benchmark_scaling(satellite_counts, durations, rates, orbit_mode=args.orbit_mode)
+
+    if args.output is not None:
+        with open(args.output, "w") as output_file:
+            json.dump(results, output_file, indent=4)
+
+if __name__ == "__main__":
+    main()
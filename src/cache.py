@@ -0,0 +1,76 @@
+import hashlib
+from collections import OrderedDict
+from typing import Callable
+
+import numpy as np
+
+# Least recently used cache with hit and miss counters
+class LRUCache:
+    # Constructor
+    def __init__(self, max_size: int = 128) -> None:
+        # Maximum number of cached values
+        self.max_size: int = max_size
+
+        # Cached values from least to most recently used
+        self.values: OrderedDict = OrderedDict()
+
+        # Statistics
+        self.hits: int = 0
+        self.misses: int = 0
+        self.evictions: int = 0
+
+    # Number of cached values
+    def __len__(self) -> int:
+        return len(self.values)
+
+    # Returns the cached value of a key, or computes, caches and returns it
+    def get_or_compute(self, key, compute: Callable):
+        if key in self.values:
+            self.hits += 1
+            self.values.move_to_end(key)
+
+            return self.values[key]
+
+        self.misses += 1
+
+        value = compute()
+
+        self.put(key, value)
+
+        return value
+
+    # Caches a value, evicting the least recently used value when the cache is full
+    def put(self, key, value):
+        self.values[key] = value
+        self.values.move_to_end(key)
+
+        while len(self.values) > self.max_size:
+            self.values.popitem(last=False)
+            self.evictions += 1
+
+    # Removes all cached values and resets the statistics
+    def clear(self):
+        self.values.clear()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    # Returns the statistics of the cache
+    def info(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "size": len(self.values),
+            "max_size": self.max_size,
+        }
+
+# Returns a short digest of the contents of an array to use in cache keys
+def array_digest(array: np.ndarray) -> bytes:
+    return hashlib.blake2b(np.ascontiguousarray(array).tobytes(), digest_size=16).digest()
+
+# Marks arrays as read-only so cached values cannot be changed by callers
+def freeze(*arrays: np.ndarray):
+    for array in arrays:
+        array.flags.writeable = False
@@ -3,3 +3,54 @@ EARTH_MASS = 5.9722 * 10 ** 24
 GRAVITATIONAL_CONSTANT = 6.67430_15 * 10 ** -11
 
 MU = EARTH_MASS * GRAVITATIONAL_CONSTANT
+
+# Satellite systems as RINEX system letters, in the order their clock biases are solved
+# "G": GPS, "R": GLONASS, "E": Galileo
+SYSTEMS = ("G", "R", "E")
+
+# Constants of the GPS interface specification (IS-GPS-200)
+MU_GPS = 3.986005 * 10 ** 14
+EARTH_ROTATION_RATE = 7.2921151467 * 10 ** -5
+
+# Constants of the Galileo interface control document
+MU_GALILEO = 3.986004418 * 10 ** 14
+
+# Constants of the GLONASS interface control document (PZ-90)
+MU_GLONASS = 3.9860044 * 10 ** 14
+EARTH_ROTATION_RATE_GLONASS = 7.292115 * 10 ** -5
+EARTH_RADIUS_GLONASS = 6378136
+J2_GLONASS = 1.08262575 * 10 ** -3
+
+# GLONASS time is UTC(SU) which is three hours ahead of UTC
+GLONASS_UTC_OFFSET = 10800
+
+# Leap seconds between GPS time and UTC since 2017
+GPS_UTC_LEAP_SECONDS = 18
+
+# Speed of light in vacuum (m / s)
+SPEED_OF_LIGHT = 299792458
+
+# Seconds in a GPS week
+SECONDS_PER_WEEK = 604800
+
+# Seconds in a day
+SECONDS_PER_DAY = 86400
+
+# Week numbers of RTCM ephemerides roll over after 1024 (GPS, 10 bits) or 4096 (Galileo, 12 bits) weeks
+GPS_WEEK_ROLLOVER = 1024
+GALILEO_WEEK_ROLLOVER = 4096
+
+# The Galileo week number started 1024 weeks after the GPS week number
+GALILEO_WEEK_OFFSET = 1024
+
+# Unix time of the GPS epoch (1980-01-06 00:00:00 UTC)
+GPS_EPOCH_UNIX = 315964800
+
+# WGS-84 ellipsoid (meters)
+WGS84_SEMI_MAJOR_AXIS = 6378137.0
+WGS84_FLATTENING = 1 / 298.257223563
+WGS84_SEMI_MINOR_AXIS = WGS84_SEMI_MAJOR_AXIS * (1 - WGS84_FLATTENING)
+
+# First and second eccentricities of the WGS-84 ellipsoid squared
+WGS84_ECCENTRICITY_SQUARED = WGS84_FLATTENING * (2 - WGS84_FLATTENING)
+WGS84_SECOND_ECCENTRICITY_SQUARED = WGS84_ECCENTRICITY_SQUARED / (1 - WGS84_ECCENTRICITY_SQUARED)
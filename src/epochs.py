@@ -0,0 +1,87 @@
+import numpy as np
+from satellites import *
+
+# Epoch-major index of the pseudorange measurements of a list of GPS satellites
+# Measurements are stored in compressed sparse row layout, so the measurements of epoch i are
+# the entries offsets[i]:offsets[i + 1] of satellites and samples
+class EpochIndex:
+    # Constructor
+    def __init__(self, gps_list: list[GPSSatellite]) -> None:
+        counts = np.array([len(gps.times_of_pseudoranges) for gps in gps_list], dtype=np.int64)
+
+        # satellite and sample of every measurement in the order of the satellite list
+        satellites = np.repeat(np.arange(len(gps_list)), counts)
+        samples = np.arange(np.sum(counts)) - np.repeat(np.cumsum(counts) - counts, counts)
+
+        times = np.concatenate([gps.times_of_pseudoranges for gps in gps_list] + [np.zeros(0)])
+
+        # stable sort keeps the satellites of an epoch in the order of the satellite list
+        entries = np.argsort(times, kind="stable")
+
+        times = times[entries]
+        satellites = satellites[entries]
+
+        new_epoch = np.ones(len(times), dtype=bool)
+        new_epoch[1:] = times[1:] != times[:-1]
+
+        # only keep the first measurement of a satellite in an epoch
+        keep = np.ones(len(times), dtype=bool)
+        keep[1:] = new_epoch[1:] | (satellites[1:] != satellites[:-1])
+
+        new_epoch = new_epoch[keep]
+
+        # Time of every epoch
+        self.times: np.ndarray = times[keep][new_epoch]
+
+        # Number of satellites in the list
+        self.num_satellites: int = len(gps_list)
+
+        # Flat measurement indices into the concatenated satellite arrays
+        self.entries: np.ndarray = entries[keep]
+
+        # Satellite index of every measurement
+        self.satellites: np.ndarray = satellites[keep]
+
+        # Sample index of every measurement within its satellite
+        self.samples: np.ndarray = samples[self.entries]
+
+        # Epoch index of every measurement
+        self.epoch_ids: np.ndarray = np.cumsum(new_epoch) - 1
+
+        # Start of every epoch in the measurement arrays
+        self.offsets: np.ndarray = np.append(np.flatnonzero(new_epoch), len(self.entries))
+
+    # Number of epochs
+    def __len__(self) -> int:
+        return len(self.times)
+
+    # Returns the (satellites, samples) of the measurements in an epoch
+    def epoch(self, i: int) -> tuple[np.ndarray, np.ndarray]:
+        start = self.offsets[i]
+        end = self.offsets[i + 1]
+
+        return (self.satellites[start:end], self.samples[start:end])
+
+    # Number of satellites in every epoch
+    def satellite_counts(self) -> np.ndarray:
+        return np.diff(self.offsets)
+
+    # Gathers per satellite arrays into one array in epoch-major order
+    def gather(self, arrays: list[np.ndarray]) -> np.ndarray:
+        return np.concatenate(arrays)[self.entries]
+
+    # Scatters per satellite arrays into a padded (epochs, satellites, ...) array
+    def scatter(self, arrays: list[np.ndarray]) -> np.ndarray:
+        values = self.gather(arrays)
+
+        padded = np.zeros((len(self), self.num_satellites) + values.shape[1:], dtype=values.dtype)
+        padded[self.epoch_ids, self.satellites] = values
+
+        return padded
+
+    # Validity mask of the padded (epochs, satellites) arrays
+    def mask(self) -> np.ndarray:
+        mask = np.zeros((len(self), self.num_satellites), dtype=bool)
+        mask[self.epoch_ids, self.satellites] = True
+
+        return mask
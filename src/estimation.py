@@ -1,5 +1,56 @@
 import numpy as np
 from satellites import *
+from epochs import *
+from instrumentation import *
+from visibility import *
+from raim import *
+from light_time import *
+
+# Cache of solved fixes keyed by the satellites, pseudoranges and solver settings
+FIX_CACHE = LRUCache(16)
+
+# Solvers of estimate_fixes
+# "batch": all epochs at once with a fixed number of iterations starting from the center of the earth
+# "sequential": one epoch at a time starting from the previous fix until the update is below a tolerance
+SOLVERS = ("batch", "sequential")
+
+# Update norm below which the sequential solver stops iterating (meters)
+SEQUENTIAL_TOLERANCE = 1e-4
+
+# Epochs between the epochs solved for approximate receiver positions before the satellite elevations are known
+APPROXIMATE_STRIDE = 60
+
+# Estimated receiver fixes for every epoch with enough satellites
+class Fixes:
+    # Constructor
+    def __init__(self, times: np.ndarray, positions: np.ndarray, clock_biases: np.ndarray, iterations: np.ndarray = None, system_clock_biases: np.ndarray = None, systems: list[str] = None, dops: np.ndarray = None, faults: np.ndarray = None, exclusions: dict[str, int] = None) -> None:
+        # Time of each fix (seconds)
+        self.times: np.ndarray = times
+
+        # Estimated receiver ECEF positions (meters)
+        self.positions: np.ndarray = positions
+
+        # Estimated receiver clock biases (meters) against the first satellite system of each fix
+        self.clock_biases: np.ndarray = clock_biases
+
+        # Solver iterations of each fix
+        self.iterations: np.ndarray = iterations
+
+        # Receiver clock bias against every satellite system (meters), NaN where a system was not observed
+        # differences between the columns are the inter-system biases
+        self.system_clock_biases: np.ndarray = system_clock_biases
+
+        # Satellite system of every column of system_clock_biases
+        self.systems: list[str] = systems
+
+        # Dilutions of precision of each fix at its approximate position, columns are DOP_COLUMNS
+        self.dops: np.ndarray = dops
+
+        # Fixes whose residuals failed the fault detection test and could not be repaired by excluding one satellite
+        self.faults: np.ndarray = faults
+
+        # Number of fixes each satellite was excluded from by fault detection, keyed by satellite name like "G05"
+        self.exclusions: dict[str, int] = exclusions if exclusions is not None else {}
 
 # returns a list of all times where GPS signals were received
 def pseudorange_times(gps_list: list[GPSSatellite]) -> np.ndarray:
@@ -12,8 +63,344 @@ def pseudorange_times(gps_list: list[GPSSatellite]) -> np.ndarray:
 
     return all_times
 
+# Returns the satellite systems in a satellite list and the system index of every satellite as (systems, columns)
+def system_columns(gps_list: list[GPSSatellite]) -> tuple[list[str], np.ndarray]:
+    systems = sorted({gps.system for gps in gps_list}, key=SYSTEMS.index)
+
+    columns = np.array([systems.index(gps.system) for gps in gps_list], dtype=int)
+
+    return (systems, columns)
+
+# Stacks satellite positions and pseudoranges of every epoch into padded arrays
+# returns (times, ecefs, pseudoranges, mask) with shapes (E,), (E, S, 3), (E, S) and (E, S)
+def stack_epochs(gps_list: list[GPSSatellite], epoch_index: EpochIndex = None) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    if epoch_index is None:
+        epoch_index = EpochIndex(gps_list)
+
+    ecefs = epoch_index.scatter([gps.position_ecef() for gps in gps_list] + [np.zeros((0, 3))])
+    pseudoranges = epoch_index.scatter([gps.pseudoranges for gps in gps_list] + [np.zeros(0)])
+    mask = epoch_index.mask()
+
+    return (epoch_index.times, ecefs, pseudoranges, mask)
+
+# Solves receiver positions and clock biases for all epochs at once with the Gauss-Newton method
+# systems gives the system index of every satellite, every system gets its own clock bias column (E, K)
+def solve_epochs(ecefs: np.ndarray, pseudoranges: np.ndarray, mask: np.ndarray, iterations: int = 10, systems: np.ndarray = None) -> tuple[np.ndarray, np.ndarray]:
+    (positions, clock_biases, residuals) = solve_epochs_residuals(ecefs, pseudoranges, mask, iterations, systems)
+
+    return (positions, clock_biases)
+
+# solve_epochs that also returns the post-fit pseudorange residuals (E, S) of the last iteration, zero for missing satellites
+# the residuals reuse the geometry of the last iteration, so they cost no extra ranges
+# iterations start from the center of the earth unless start positions (E, 3) and clock biases (E, K) are given
+# systems may also give the system of every satellite of every epoch (E, S) when the satellite columns differ between epochs
+def solve_epochs_residuals(ecefs: np.ndarray, pseudoranges: np.ndarray, mask: np.ndarray, iterations: int = 10, systems: np.ndarray = None, positions: np.ndarray = None, clock_biases: np.ndarray = None, num_systems: int = None) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    if systems is None:
+        systems = np.zeros(mask.shape[1], dtype=int)
+
+    if num_systems is None:
+        num_systems = int(np.max(systems, initial=0)) + 1
+
+    systems = np.broadcast_to(systems, mask.shape)
+
+    if positions is None:
+        positions = np.zeros((mask.shape[0], 3))
+
+    if clock_biases is None:
+        clock_biases = np.zeros((mask.shape[0], num_systems))
+
+    residuals = np.zeros(mask.shape)
+
+    # geometry matrices of all epochs, rows of missing satellites stay zero
+    geometry_matrices = np.zeros(mask.shape + (3 + num_systems,))
+
+    # clock bias column of every satellite
+    clock_columns = np.eye(num_systems)[systems]
+
+    for iteration in range(0, iterations):
+        line_of_sight_vectors = ecefs - positions[:, np.newaxis, :]
+
+        assumed_ranges = np.linalg.norm(line_of_sight_vectors, axis=2)
+
+        # padded satellites get a unit range to avoid division by zero
+        assumed_ranges[~mask] = 1
+
+        geometry_matrices[:, :, 0:3] = -line_of_sight_vectors / assumed_ranges[:, :, np.newaxis]
+        geometry_matrices[:, :, 3:] = clock_columns
+        geometry_matrices[~mask] = 0
+
+        delta_tau = np.where(mask, pseudoranges - assumed_ranges - np.take_along_axis(clock_biases, systems, axis=1), 0)
+
+        # batched least squares, zero rows and the zero columns of unobserved systems do not affect the pseudo inverse
+        geometry_matrices_pseudo_inverse = np.linalg.pinv(geometry_matrices)
+
+        delta_pos_time = np.matmul(geometry_matrices_pseudo_inverse, delta_tau[:, :, np.newaxis])[:, :, 0]
+
+        positions = positions + delta_pos_time[:, 0:3]
+        clock_biases = clock_biases + delta_pos_time[:, 3:]
+
+    # residuals of the last iteration after its update, linearized with its geometry
+    if iterations > 0:
+        residuals = delta_tau - np.matmul(geometry_matrices, delta_pos_time[:, :, np.newaxis])[:, :, 0]
+
+    return (positions, clock_biases, residuals)
+
+# Solves epochs one after another with the Gauss-Newton method, starting each epoch from the previous fix
+# iterations stop once the norm of the update is below the tolerance, returns (positions, clock_biases, iterations)
+# systems gives the system index of every satellite like in solve_epochs
+def solve_sequential(ecefs: np.ndarray, pseudoranges: np.ndarray, mask: np.ndarray, tolerance: float = SEQUENTIAL_TOLERANCE, max_iterations: int = 10, systems: np.ndarray = None) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    if systems is None:
+        systems = np.zeros(mask.shape[1], dtype=int)
+
+    num_systems = int(np.max(systems, initial=0)) + 1
+
+    positions = np.zeros((mask.shape[0], 3))
+    clock_biases = np.zeros((mask.shape[0], num_systems))
+    iterations = np.zeros(mask.shape[0], dtype=int)
+
+    # start of the first epoch
+    assumed_pos = np.zeros(3)
+    clock_bias = np.zeros(num_systems)
+
+    for i in range(0, mask.shape[0]):
+        satellite_ecefs = ecefs[i][mask[i]]
+        satellite_pseudoranges = pseudoranges[i][mask[i]]
+        satellite_systems = systems[mask[i]]
+
+        # unobserved systems get zero columns which lstsq leaves unchanged
+        geometry_matrix = np.zeros((len(satellite_pseudoranges), 3 + num_systems))
+        geometry_matrix[np.arange(len(satellite_pseudoranges)), 3 + satellite_systems] = 1
+
+        converged = False
+
+        while iterations[i] < max_iterations and not converged:
+            iterations[i] += 1
+
+            line_of_sight_vectors = satellite_ecefs - assumed_pos
+
+            assumed_ranges = np.linalg.norm(line_of_sight_vectors, axis=1)
+
+            geometry_matrix[:, 0:3] = -line_of_sight_vectors / assumed_ranges[:, np.newaxis]
+
+            delta_tau = satellite_pseudoranges - assumed_ranges - clock_bias[satellite_systems]
+
+            delta_pos_time = np.linalg.lstsq(geometry_matrix, delta_tau, rcond=None)[0]
+
+            assumed_pos = assumed_pos + delta_pos_time[0:3]
+            clock_bias = clock_bias + delta_pos_time[3:]
+
+            converged = np.linalg.norm(delta_pos_time) < tolerance
+
+        positions[i] = assumed_pos
+        clock_biases[i] = clock_bias
+
+        # a fix that did not converge is a bad start for the next epoch
+        if not converged:
+            assumed_pos = np.zeros(3)
+            clock_bias = np.zeros(num_systems)
+
+    return (positions, clock_biases, iterations)
+
+# Returns the satellite systems observed in every epoch, shape (E, number of systems)
+def observed_systems(mask: np.ndarray, columns: np.ndarray, num_systems: int) -> np.ndarray:
+    observed = np.zeros((mask.shape[0], num_systems), dtype=bool)
+
+    for k in range(0, num_systems):
+        observed[:, k] = np.any(mask[:, columns == k], axis=1)
+
+    return observed
+
+# Approximate receiver position of every epoch, used for satellite elevations and dilutions of precision before solving
+# every stride-th valid epoch is solved and the other epochs take the position of the nearest solved epoch
+def approximate_positions(ecefs: np.ndarray, pseudoranges: np.ndarray, mask: np.ndarray, valid: np.ndarray, systems: np.ndarray = None, stride: int = APPROXIMATE_STRIDE) -> np.ndarray:
+    solved = np.flatnonzero(valid)[::stride]
+
+    if len(solved) == 0:
+        return np.zeros((mask.shape[0], 3))
+
+    (positions, clock_biases) = solve_epochs(ecefs[solved], pseudoranges[solved], mask[solved], systems=systems)
+
+    epochs = np.arange(mask.shape[0])
+
+    after = np.clip(np.searchsorted(solved, epochs), 0, len(solved) - 1)
+    before = np.clip(after - 1, 0, len(solved) - 1)
+
+    nearest = np.where(solved[after] - epochs < epochs - solved[before], after, before)
+
+    return positions[nearest]
+
+# Post-fit pseudorange residuals (E, S) of solved epochs, zero for missing satellites
+def pseudorange_residuals(ecefs: np.ndarray, pseudoranges: np.ndarray, mask: np.ndarray, systems: np.ndarray, positions: np.ndarray, clock_biases: np.ndarray) -> np.ndarray:
+    assumed_ranges = np.linalg.norm(ecefs - positions[:, np.newaxis, :], axis=2)
+
+    return np.where(mask, pseudoranges - assumed_ranges - clock_biases[:, systems], 0)
+
+# Receiver autonomous integrity monitoring of solved epochs, using the residuals of the solution with every satellite
+# epochs failing the chi-square test are solved again without each of their satellites in turn, starting from their solution,
+# and the exclusion with the smallest test statistic replaces the solution if it passes the test
+# returns (mask, positions, clock_biases, excluded satellite of every epoch or -1, epochs with a fault that was not excluded)
+def exclude_faults(ecefs: np.ndarray, pseudoranges: np.ndarray, mask: np.ndarray, systems: np.ndarray, positions: np.ndarray, clock_biases: np.ndarray, residuals: np.ndarray, sigma: float = PSEUDORANGE_SIGMA) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    num_systems = clock_biases.shape[1]
+
+    degrees = degrees_of_freedom(mask, observed_systems(mask, systems, num_systems))
+
+    faults = detect_faults(chi_square_statistics(residuals, mask, sigma), degrees)
+
+    excluded = np.full(mask.shape[0], -1)
+
+    # an exclusion can only be tested if a redundant measurement is left without the satellite
+    epochs = np.flatnonzero(faults & (degrees >= 2))
+
+    if len(epochs) > 0:
+        # satellites of the faulty epochs are packed to the front, so the candidates only carry as many columns as the fullest epoch
+        width = int(np.max(np.count_nonzero(mask[epochs], axis=1)))
+
+        packing = np.argsort(~mask[epochs], axis=1, kind="stable")[:, 0:width]
+
+        packed_mask = np.take_along_axis(mask[epochs], packing, axis=1)
+
+        (candidate_rows, candidate_satellites, candidate_masks) = exclusion_candidates(packed_mask, np.arange(len(epochs)))
+
+        candidate_epochs = epochs[candidate_rows]
+        candidate_packing = packing[candidate_rows]
+        candidate_systems = systems[candidate_packing]
+
+        (candidate_positions, candidate_clock_biases, candidate_residuals) = solve_epochs_residuals(np.take_along_axis(ecefs[candidate_epochs], candidate_packing[:, :, np.newaxis], axis=1), np.take_along_axis(pseudoranges[candidate_epochs], candidate_packing, axis=1), candidate_masks, EXCLUSION_ITERATIONS, candidate_systems, positions[candidate_epochs], clock_biases[candidate_epochs], num_systems)
+
+        candidate_observed = np.zeros((len(candidate_rows), num_systems), dtype=bool)
+        candidate_observed[np.nonzero(candidate_masks)[0], candidate_systems[candidate_masks]] = True
+
+        (chosen_rows, chosen) = choose_exclusions(candidate_rows, chi_square_statistics(candidate_residuals, candidate_masks, sigma), degrees_of_freedom(candidate_masks, candidate_observed))
+
+        chosen = chosen[chosen >= 0]
+
+        repaired = candidate_epochs[chosen]
+
+        excluded[repaired] = candidate_packing[chosen, candidate_satellites[chosen]]
+
+        mask = mask.copy()
+        mask[repaired, excluded[repaired]] = False
+
+        positions[repaired] = candidate_positions[chosen]
+        clock_biases[repaired] = candidate_clock_biases[chosen]
+
+    return (mask, positions, clock_biases, excluded, faults & (excluded < 0))
+
+# calculate fixes for every epoch with enough satellites, results are cached in FIX_CACHE
+def estimate_fixes(gps_list: list[GPSSatellite], epoch_index: EpochIndex = None, iterations: int = 10, solver: str = "batch", elevation_mask: float = ELEVATION_MASK, max_pdop: float = MAX_PDOP, raim: bool = False, light_time: bool = True) -> Fixes:
+    key = tuple(gps.cache_key() + (array_digest(gps.pseudoranges),) for gps in gps_list) + (iterations, solver, elevation_mask, max_pdop, raim, light_time)
+
+    return FIX_CACHE.get_or_compute(key, lambda: compute_fixes(gps_list, epoch_index, iterations, solver, elevation_mask, max_pdop, raim=raim, light_time=light_time))
+
+# calculate fixes for every epoch with enough satellites
+# iterations is the number of batch iterations, or the maximum number of sequential iterations per epoch
+# before solving, satellites below the elevation mask (degrees, None to keep all) are dropped and epochs above max_pdop are skipped
+# the elevations are seen from receiver_position, or from approximate positions solved from every APPROXIMATE_STRIDE-th epoch
+# the satellite positions are moved to the transmission of every signal by correct_light_time unless light_time is False
+# after solving, epochs failing the fault detection test get one satellite excluded by exclude_faults when raim is True
+# raim is off by default: the pseudoranges are not corrected for the satellite clocks, so nearly every epoch fails the test
+def compute_fixes(gps_list: list[GPSSatellite], epoch_index: EpochIndex = None, iterations: int = 10, solver: str = "batch", elevation_mask: float = ELEVATION_MASK, max_pdop: float = MAX_PDOP, receiver_position: np.ndarray = None, raim: bool = False, light_time: bool = True) -> Fixes:
+    (all_times, ecefs, pseudoranges, mask) = stack_epochs(gps_list, epoch_index)
+
+    (systems, columns) = system_columns(gps_list)
+
+    # Satellite systems observed in every epoch
+    observed = observed_systems(mask, columns, len(systems))
+
+    # Choose at least 3 satellites plus one per observed system at same time, 4 satellites for a single system
+    valid = np.count_nonzero(mask, axis=1) >= 3 + np.count_nonzero(observed, axis=1)
+
+    if receiver_position is None:
+        receiver_positions = approximate_positions(ecefs, pseudoranges, mask, valid, columns)
+    else:
+        receiver_positions = np.broadcast_to(receiver_position, (mask.shape[0], 3))
+
+    if light_time:
+        ecefs = correct_light_time(gps_list, all_times, pseudoranges, mask, receiver_positions)
+
+    if elevation_mask is not None and np.any(valid):
+        elevations = satellite_directions(ecefs, mask, receiver_positions)[:, :, 1]
+
+        visible = mask_elevations(mask, elevations, elevation_mask)
+
+        INSTRUMENTATION.count("satellites_below_elevation_mask", int(np.count_nonzero(mask & ~visible)))
+
+        mask = visible
+        observed = observed_systems(mask, columns, len(systems))
+        valid = np.count_nonzero(mask, axis=1) >= 3 + np.count_nonzero(observed, axis=1)
+
+    INSTRUMENTATION.count("epochs_skipped_too_few_satellites", int(len(valid) - np.count_nonzero(valid)))
+
+    dops = dilution_of_precision(ecefs, mask, receiver_positions, columns)
+
+    # epochs with bad geometry are skipped before solving
+    if max_pdop is not None:
+        good_geometry = dops[:, 1] <= max_pdop
+
+        INSTRUMENTATION.count("epochs_skipped_high_dop", int(np.count_nonzero(valid & ~good_geometry)))
+
+        valid = valid & good_geometry
+
+    INSTRUMENTATION.count("epochs_solved", int(np.count_nonzero(valid)))
+
+    (ecefs, pseudoranges, mask, receiver_positions, dops) = (ecefs[valid], pseudoranges[valid], mask[valid], receiver_positions[valid], dops[valid])
+
+    if solver == "batch":
+        (positions, system_clock_biases, residuals) = solve_epochs_residuals(ecefs, pseudoranges, mask, iterations, columns)
+
+        epoch_iterations = np.full(len(positions), iterations)
+    elif solver == "sequential":
+        (positions, system_clock_biases, epoch_iterations) = solve_sequential(ecefs, pseudoranges, mask, max_iterations=iterations, systems=columns)
+
+        residuals = pseudorange_residuals(ecefs, pseudoranges, mask, columns, positions, system_clock_biases) if raim else None
+    else:
+        raise ValueError(f"Unknown solver \"{solver}\", choose from: {', '.join(SOLVERS)}")
+
+    faults = np.zeros(len(positions), dtype=bool)
+    exclusions = {}
+
+    if raim and len(positions) > 0:
+        (mask, positions, system_clock_biases, excluded, faults) = exclude_faults(ecefs, pseudoranges, mask, columns, positions, system_clock_biases, residuals)
+
+        INSTRUMENTATION.count("raim_faults_detected", int(np.count_nonzero(faults | (excluded >= 0))))
+        INSTRUMENTATION.count("raim_faults_excluded", int(np.count_nonzero(excluded >= 0)))
+        INSTRUMENTATION.count("raim_faults_unresolved", int(np.count_nonzero(faults)))
+
+        (satellites, counts) = np.unique(excluded[excluded >= 0], return_counts=True)
+
+        for (satellite, count) in zip(satellites, counts):
+            name = f"{gps_list[satellite].system}{gps_list[satellite].sv:02d}"
+
+            # the same satellite may appear in several entries of gps_list, e.g. one per signal
+            exclusions[name] = exclusions.get(name, 0) + int(count)
+
+            INSTRUMENTATION.count(f"raim_excluded_{name}", int(count))
+
+        # the geometry of epochs with an excluded satellite changed
+        repaired = np.flatnonzero(excluded >= 0)
+
+        dops[repaired] = dilution_of_precision(ecefs[repaired], mask[repaired], receiver_positions[repaired], columns)
+
+    observed = observed_systems(mask, columns, len(systems))
+
+    system_clock_biases = np.where(observed, system_clock_biases, np.nan)
+
+    # clock bias against the first observed system, which is GPS whenever GPS is tracked
+    clock_biases = system_clock_biases[np.arange(len(positions)), np.argmax(observed, axis=1)] if len(systems) > 0 else np.zeros(len(positions))
+
+    fixes = Fixes(all_times[valid], positions, clock_biases, epoch_iterations, system_clock_biases, systems, dops, faults, exclusions)
+
+    freeze(fixes.times, fixes.positions, fixes.clock_biases, fixes.iterations, fixes.system_clock_biases, fixes.dops, fixes.faults)
+
+    return fixes
+
 # calculate positions from list og GPS signals
-def estimate_positions(gps_list: list[GPSSatellite]) -> np.ndarray:
+def estimate_positions(gps_list: list[GPSSatellite], epoch_index: EpochIndex = None) -> np.ndarray:
+    return estimate_fixes(gps_list, epoch_index).positions
+
+# calculate positions from list og GPS signals one epoch at a time
+# kept as a reference implementation for the batched solver
+def estimate_positions_per_epoch(gps_list: list[GPSSatellite]) -> np.ndarray:
     # iterations for Newton-Raphson method
     iterations = 10
 
@@ -0,0 +1,81 @@
+import numpy as np
+
+# Rotation matrices about the z-axis for an array of angles, shape (..., 3, 3)
+def rotation_z(angles: np.ndarray) -> np.ndarray:
+    angles = np.asarray(angles)
+
+    matrices = np.zeros(angles.shape + (3, 3))
+
+    matrices[..., 0, 0] = np.cos(angles)
+    matrices[..., 0, 1] = -np.sin(angles)
+    matrices[..., 1, 0] = np.sin(angles)
+    matrices[..., 1, 1] = np.cos(angles)
+    matrices[..., 2, 2] = 1
+
+    return matrices
+
+# Rotation matrices about the x-axis for an array of angles, shape (..., 3, 3)
+def rotation_x(angles: np.ndarray) -> np.ndarray:
+    angles = np.asarray(angles)
+
+    matrices = np.zeros(angles.shape + (3, 3))
+
+    matrices[..., 0, 0] = 1
+    matrices[..., 1, 1] = np.cos(angles)
+    matrices[..., 1, 2] = -np.sin(angles)
+    matrices[..., 2, 1] = np.sin(angles)
+    matrices[..., 2, 2] = np.cos(angles)
+
+    return matrices
+
+# Combined rotation from perifocal to earth centered inertial coordinates for arrays of orbital elements
+# coordinates are row vectors, so eci = pqw @ matrix
+def perifocal_to_eci_matrices(arguments_of_periapsis: np.ndarray, inclinations: np.ndarray, right_ascension_of_ascending_node: np.ndarray) -> np.ndarray:
+    return rotation_z(-np.asarray(arguments_of_periapsis)) @ rotation_x(-np.asarray(inclinations)) @ rotation_z(-np.asarray(right_ascension_of_ascending_node))
+
+# Rotates row vectors (N, 3) by one matrix (3, 3), or by the matrices (K, 3, 3) chosen by per-vector indices (N,)
+# the vectors are grouped by index and every group is rotated by its matrix, so no matrix is built per vector
+def rotate_rows(vectors: np.ndarray, matrices: np.ndarray, indices: np.ndarray = None) -> np.ndarray:
+    if matrices.ndim == 2:
+        return vectors @ matrices
+
+    if np.ndim(indices) == 0:
+        return vectors @ matrices[indices]
+
+    order = np.argsort(indices, kind="stable")
+    sorted_indices = np.asarray(indices)[order]
+
+    starts = np.flatnonzero(np.diff(sorted_indices, prepend=-1))
+    ends = np.append(starts[1:], len(order))
+
+    rotated = np.empty(vectors.shape)
+
+    for (start, end) in zip(starts, ends):
+        rows = order[start:end]
+
+        rotated[rows] = vectors[rows] @ matrices[sorted_indices[start]]
+
+    return rotated
+
+# Angle of the earth rotation at some times (radians)
+# calculates angle based on solar day (not sidereal day), needs to be fixed in the future
+def earth_rotation_angles(times: np.ndarray) -> np.ndarray:
+    return np.asarray(times) / 86400 % 1 * 2 * np.pi
+
+# Rotates row vectors (N, 3) about the z-axis by per-vector angles (N,), the same as multiplying each row by rotation_z(angle)
+# which turns the coordinate frame by the angle
+def rotate_about_z(vectors: np.ndarray, angles: np.ndarray) -> np.ndarray:
+    cos_angles = np.cos(angles)
+    sin_angles = np.sin(angles)
+
+    rotated = np.empty(vectors.shape)
+
+    rotated[:, 0] = vectors[:, 0] * cos_angles + vectors[:, 1] * sin_angles
+    rotated[:, 1] = vectors[:, 1] * cos_angles - vectors[:, 0] * sin_angles
+    rotated[:, 2] = vectors[:, 2]
+
+    return rotated
+
+# Converts earth centered inertial coordinates (N, 3) to earth centered earth fixed coordinates at some times (N,)
+def eci_to_ecef(eci: np.ndarray, times: np.ndarray) -> np.ndarray:
+    return rotate_about_z(eci, earth_rotation_angles(times))
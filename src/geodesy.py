@@ -0,0 +1,151 @@
+import numpy as np
+
+from constants import *
+
+# Coordinates are row vectors in the last axis, so any leading shape works: (3,), (N, 3) or (E, S, 3)
+# every conversion writes into out when it is given, out may be the input array to convert in place
+
+# Returns out, or a new array of some shape if out is None
+def output_array(shape: tuple, out: np.ndarray = None) -> np.ndarray:
+    if out is None:
+        return np.empty(shape)
+
+    return out
+
+# Converts ECEF coordinates to WGS-84 geodetic latitude (radians), longitude (radians) and ellipsoidal height (meters)
+# closed form solution of Heikkinen (1982), accurate to well below a millimeter from the surface to beyond GNSS orbits
+def ecef_to_geodetic(ecef: np.ndarray, out: np.ndarray = None) -> np.ndarray:
+    ecef = np.asarray(ecef)
+    out = output_array(ecef.shape, out)
+
+    a = WGS84_SEMI_MAJOR_AXIS
+    b = WGS84_SEMI_MINOR_AXIS
+    e2 = WGS84_ECCENTRICITY_SQUARED
+
+    x = ecef[..., 0]
+    y = ecef[..., 1]
+    z = ecef[..., 2]
+
+    p_squared = x ** 2 + y ** 2
+    p = np.sqrt(p_squared)
+    z_squared = z ** 2
+
+    f = 54 * b ** 2 * z_squared
+    g = p_squared + (1 - e2) * z_squared - e2 * (a ** 2 - b ** 2)
+    c = e2 ** 2 * f * p_squared / g ** 3
+    s = np.cbrt(1 + c + np.sqrt(c ** 2 + 2 * c))
+    k = s + 1 + 1 / s
+    big_p = f / (3 * k ** 2 * g ** 2)
+    q = np.sqrt(1 + 2 * e2 ** 2 * big_p)
+
+    r0 = -big_p * e2 * p / (1 + q) + np.sqrt(a ** 2 / 2 * (1 + 1 / q) - big_p * (1 - e2) * z_squared / (q * (1 + q)) - big_p * p_squared / 2)
+
+    u = np.hypot(p - e2 * r0, z)
+    v = np.sqrt((p - e2 * r0) ** 2 + (1 - e2) * z_squared)
+    z0 = b ** 2 * z / (a * v)
+
+    longitudes = np.arctan2(y, x)
+
+    np.arctan2(z + WGS84_SECOND_ECCENTRICITY_SQUARED * z0, p, out=out[..., 0])
+    out[..., 1] = longitudes
+    np.multiply(u, 1 - b ** 2 / (a * v), out=out[..., 2])
+
+    return out
+
+# Converts WGS-84 geodetic latitude (radians), longitude (radians) and ellipsoidal height (meters) to ECEF coordinates
+def geodetic_to_ecef(geodetic: np.ndarray, out: np.ndarray = None) -> np.ndarray:
+    geodetic = np.asarray(geodetic)
+    out = output_array(geodetic.shape, out)
+
+    latitudes = geodetic[..., 0]
+    longitudes = geodetic[..., 1]
+    heights = geodetic[..., 2]
+
+    sin_latitudes = np.sin(latitudes)
+    cos_latitudes = np.cos(latitudes)
+
+    # radius of curvature in the prime vertical
+    normal_radii = WGS84_SEMI_MAJOR_AXIS / np.sqrt(1 - WGS84_ECCENTRICITY_SQUARED * sin_latitudes ** 2)
+
+    horizontal = (normal_radii + heights) * cos_latitudes
+
+    np.multiply(horizontal, np.cos(longitudes), out=out[..., 0])
+    np.multiply(horizontal, np.sin(longitudes), out=out[..., 1])
+    np.multiply(normal_radii * (1 - WGS84_ECCENTRICITY_SQUARED) + heights, sin_latitudes, out=out[..., 2])
+
+    return out
+
+# Rotation matrices from ECEF to local east, north, up coordinates at geodetic latitudes and longitudes, shape (..., 3, 3)
+# the rows of a matrix are the east, north and up unit vectors, so enu = matrix @ ecef
+def enu_rotation(latitudes: np.ndarray, longitudes: np.ndarray) -> np.ndarray:
+    latitudes = np.asarray(latitudes)
+    longitudes = np.asarray(longitudes)
+
+    sin_latitudes = np.sin(latitudes)
+    cos_latitudes = np.cos(latitudes)
+    sin_longitudes = np.sin(longitudes)
+    cos_longitudes = np.cos(longitudes)
+
+    matrices = np.zeros(np.broadcast_shapes(latitudes.shape, longitudes.shape) + (3, 3))
+
+    matrices[..., 0, 0] = -sin_longitudes
+    matrices[..., 0, 1] = cos_longitudes
+
+    matrices[..., 1, 0] = -sin_latitudes * cos_longitudes
+    matrices[..., 1, 1] = -sin_latitudes * sin_longitudes
+    matrices[..., 1, 2] = cos_latitudes
+
+    matrices[..., 2, 0] = cos_latitudes * cos_longitudes
+    matrices[..., 2, 1] = cos_latitudes * sin_longitudes
+    matrices[..., 2, 2] = sin_latitudes
+
+    return matrices
+
+# Rotates ECEF difference vectors to east, north, up at geodetic latitudes and longitudes broadcasting against them
+def rotate_to_enu(differences: np.ndarray, latitudes: np.ndarray, longitudes: np.ndarray, out: np.ndarray = None) -> np.ndarray:
+    out = output_array(np.broadcast_shapes(differences.shape, np.shape(latitudes) + (1,)), out)
+
+    dx = differences[..., 0]
+    dy = differences[..., 1]
+    dz = differences[..., 2]
+
+    sin_latitudes = np.sin(latitudes)
+    cos_latitudes = np.cos(latitudes)
+    sin_longitudes = np.sin(longitudes)
+    cos_longitudes = np.cos(longitudes)
+
+    horizontal = cos_longitudes * dx + sin_longitudes * dy
+
+    np.subtract(cos_longitudes * dy, sin_longitudes * dx, out=out[..., 0])
+    np.subtract(cos_latitudes * dz, sin_latitudes * horizontal, out=out[..., 1])
+    np.add(cos_latitudes * horizontal, sin_latitudes * dz, out=out[..., 2])
+
+    return out
+
+# Converts ECEF coordinates to east, north, up coordinates (meters) relative to reference ECEF positions
+# the references broadcast against the coordinates, e.g. one reference (3,) for fixes (N, 3)
+def ecef_to_enu(ecef: np.ndarray, reference: np.ndarray, out: np.ndarray = None) -> np.ndarray:
+    reference = np.asarray(reference)
+
+    reference_geodetic = ecef_to_geodetic(reference)
+
+    differences = np.subtract(ecef, reference)
+
+    # the differences are a new array, so they are rotated in place unless out is given
+    return rotate_to_enu(differences, reference_geodetic[..., 0], reference_geodetic[..., 1], out=differences if out is None else out)
+
+# Azimuths (radians clockwise from north, 0 to 2 pi) and elevations (radians) of satellites seen from receivers, shape (..., 2)
+# receiver positions broadcast against satellite positions, e.g. (E, 1, 3) receivers against (E, S, 3) satellites
+def azimuth_elevation(satellite_ecef: np.ndarray, receiver_ecef: np.ndarray, out: np.ndarray = None) -> np.ndarray:
+    enu = ecef_to_enu(satellite_ecef, receiver_ecef)
+
+    out = output_array(enu.shape[:-1] + (2,), out)
+
+    east = enu[..., 0]
+    north = enu[..., 1]
+
+    np.arctan2(east, north, out=out[..., 0])
+    np.mod(out[..., 0], 2 * np.pi, out=out[..., 0])
+    np.arctan2(enu[..., 2], np.hypot(east, north), out=out[..., 1])
+
+    return out
@@ -1,9 +1,150 @@
+import argparse
+import json
 import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 from parsing import *
 from plotting import *
+from streaming import *
+from session_cache import *
+from instrumentation import *
+from resampling import *
 
-def run():
+# Solves fixes of a RTCM file epoch by epoch, writes them to a CSV file in the plots folder and returns the number of fixes
+def run_streaming(data_path: str, file_name: str, solve_options: dict = None) -> int:
+    save_path = os.path.join("plots", file_name)
+
+    if not os.path.exists(save_path):
+        os.makedirs(save_path)
+
+    csv_path = os.path.join(save_path, "fixes.csv")
+
+    with INSTRUMENTATION.stage("stream"):
+        count = save_fixes(solve_stream(stream_epochs(data_path), **(solve_options or {})), csv_path)
+
+    print(f"Saved {count} fixes to \"{csv_path}\"")
+
+    return count
+
+# Processes one RTCM file in the data directory and returns a summary of the result
+# errors are caught and reported in the summary so one bad file does not stop the others
+# instrumentation_options are passed on to Instrumentation.reset (memory and profile_folder)
+# solve_options are passed on to estimate_fixes (elevation_mask, max_pdop, raim and light_time)
+# resample_options are passed on to resample_satellites (interval, window and degree), None keeps the raw pseudoranges
+def process_file(file_name: str, plot: bool = True, streaming: bool = False, plot_options: dict = None, use_cache: bool = True, orbit_mode: str = "series", instrumentation_options: dict = None, solve_options: dict = None, resample_options: dict = None) -> dict:
+    print(f"Processing file: \"{file_name}\"")
+
+    instrumentation_options = dict(instrumentation_options or {})
+
+    # profiles of each file go to their own folder
+    if instrumentation_options.get("profile_folder") is not None:
+        instrumentation_options["profile_folder"] = os.path.join(instrumentation_options["profile_folder"], file_name)
+
+    INSTRUMENTATION.reset(**instrumentation_options)
+
+    start = time.perf_counter()
+
+    summary = {
+        "file": file_name,
+        "status": "ok",
+        "fixes": 0,
+        "mean_pdop": None,
+        "exclusions": {},
+        "seconds": 0.0,
+        "error": None,
+        "plots": [],
+        "instrumentation": None,
+    }
+
+    try:
+        # Path to RTCM data
+        data_path = os.path.join("data", file_name)
+
+        # Solve fixes with bounded memory instead of plotting
+        if streaming:
+            summary["fixes"] = run_streaming(data_path, file_name, solve_options)
+        else:
+            # Reads and parses RTCM data, or opens the parsed data cached by an earlier run
+            if use_cache:
+                with INSTRUMENTATION.stage("load"):
+                    gps_list = load_gps(data_path, file_name)
+            else:
+                with INSTRUMENTATION.stage("parse"):
+                    (messages1002, messages1019) = parse_data(data_path)
+
+                with INSTRUMENTATION.stage("sort"):
+                    gps_list = sort_gps(messages1002, messages1019)
+
+            # Pseudoranges are smoothed onto a common epoch grid before the estimator and plots use them
+            if resample_options is not None:
+                with INSTRUMENTATION.stage("resample"):
+                    gps_list = resample_satellites(gps_list, **resample_options)
+
+            # Satellite positions are cached for the estimator and plots
+            with INSTRUMENTATION.stage("orbit"):
+                for gps in gps_list:
+                    gps.orbit_mode = orbit_mode
+                    gps.position_ecef()
+
+            with INSTRUMENTATION.stage("solve"):
+                # Index measurements by epoch once for the estimator and plots
+                epoch_index = EpochIndex(gps_list)
+
+                fixes = estimate_fixes(gps_list, epoch_index, **(solve_options or {}))
+
+                summary["fixes"] = len(fixes.times)
+                summary["mean_pdop"] = float(np.mean(fixes.dops[:, 1])) if len(fixes.times) > 0 else None
+                summary["exclusions"] = fixes.exclusions
+
+            if plot:
+                with INSTRUMENTATION.stage("plot"):
+                    summary["plots"] = plot_everything(gps_list, file_name, epoch_index, solve_options=solve_options, **(plot_options or {}))
+
+            print(f"Position cache: {POSITION_CACHE.info()}")
+            print(f"Fix cache: {FIX_CACHE.info()}")
+    except Exception as error:
+        summary["status"] = "failed"
+        summary["error"] = f"{type(error).__name__}: {error}"
+
+    summary["seconds"] = time.perf_counter() - start
+    summary["instrumentation"] = INSTRUMENTATION.report()
+
+    return summary
+
+# Prints a summary of all processed files
+def print_summary(summaries: list[dict]):
+    print("Summary:")
+
+    for summary in summaries:
+        line = f"    {summary['file']}: {summary['status']}, {summary['fixes']} fixes in {summary['seconds']:.2f} s"
+
+        if summary["error"] is not None:
+            line += f" ({summary['error']})"
+
+        print(line)
+
+        if summary.get("instrumentation") is not None:
+            for (name, statistics) in summary["instrumentation"]["stages"].items():
+                line = f"        {name}: {statistics['seconds']:.2f} s"
+
+                if statistics["peak_memory_bytes"] is not None:
+                    line += f", peak memory {statistics['peak_memory_bytes'] / 2 ** 20:.1f} MiB"
+
+                print(line)
+
+        for result in summary["plots"]:
+            if result["error"] is not None:
+                print(f"        could not draw plot \"{result['plot']}\"")
+
+    failed = len([summary for summary in summaries if summary["status"] != "ok"])
+
+    print(f"Processed {len(summaries)} files, {failed} failed")
+
+# Processes every RTCM file in the data directory, in parallel worker processes when workers > 1
+# plot_options are passed on to plot_everything (plots, dpi and workers)
+# instrumentation_path is a JSON file for the stage timers and counters of every file
+def run(streaming: bool = False, plot: bool = True, workers: int = 1, report_path: str = None, plot_options: dict = None, use_cache: bool = True, orbit_mode: str = "series", instrumentation_path: str = None, instrumentation_options: dict = None, solve_options: dict = None, resample_options: dict = None) -> list[dict]:
     # Create data directory
     data_path = "data"
 
@@ -11,21 +152,82 @@ def run():
         os.mkdir(data_path)
 
     # List RTCM files in data directory
-    data_files = os.listdir("data")
+    data_files = sorted(os.listdir("data"))
 
-    # Draw plots for every RTCM file
-    for file_name in data_files:
-        print(f"Processing file: \"{file_name}\"")
+    summaries: list[dict] = []
 
-        # Path to RTCM data
-        data_path = os.path.join("data", file_name)
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(process_file, file_name, plot, streaming, plot_options, use_cache, orbit_mode, instrumentation_options, solve_options, resample_options): file_name for file_name in data_files}
 
-        # Reads and parses RTCM data
-        (messages1002, messages1019) = parse_data(data_path)
+            for future in as_completed(futures):
+                try:
+                    summaries.append(future.result())
+                except Exception as error:
+                    # the worker process itself failed
+                    summaries.append({"file": futures[future], "status": "failed", "fixes": 0, "mean_pdop": None, "exclusions": {}, "seconds": 0.0, "error": f"{type(error).__name__}: {error}", "plots": [], "instrumentation": None})
 
-        gps_list = sort_gps(messages1002, messages1019)
+        summaries.sort(key=lambda summary: summary["file"])
+    else:
+        # Draw plots for every RTCM file
+        for file_name in data_files:
+            summaries.append(process_file(file_name, plot, streaming, plot_options, use_cache, orbit_mode, instrumentation_options, solve_options, resample_options))
 
-        plot_everything(gps_list, file_name)
+    print_summary(summaries)
+
+    if report_path is not None:
+        with open(report_path, "w") as report_file:
+            json.dump(summaries, report_file, indent=4)
+
+    if instrumentation_path is not None:
+        with open(instrumentation_path, "w") as instrumentation_file:
+            json.dump({summary["file"]: summary["instrumentation"] for summary in summaries}, instrumentation_file, indent=4)
+
+    return summaries
 
 if __name__ == "__main__":
-    run()
+    parser = argparse.ArgumentParser(description="GPS positioning from RTCM files in the data directory")
+    parser.add_argument("--stream", action="store_true", help="solve fixes epoch by epoch with bounded memory and save them as CSV instead of plotting")
+    parser.add_argument("--no-plot", action="store_true", help="only solve fixes, do not draw plots")
+    parser.add_argument("--workers", type=int, default=1, help="number of files processed in parallel, 0 for one per CPU")
+    parser.add_argument("--report", metavar="PATH", help="write a JSON summary of all processed files")
+    parser.add_argument("--no-cache", action="store_true", help="always parse the RTCM files instead of using the parsed data cached by earlier runs")
+    parser.add_argument("--orbit-mode", choices=ORBIT_MODES, default="series", help="orbit propagation: fast series expansion, Kepler's equation or full IS-GPS-200 propagation")
+    parser.add_argument("--plots", help=f"comma separated plots to draw, from: {', '.join(PLOTS)}")
+    parser.add_argument("--dpi", type=int, default=600, help="resolution of saved plots")
+    parser.add_argument("--plot-workers", type=int, default=1, help="number of plots of a file rendered in parallel")
+    parser.add_argument("--instrument", metavar="PATH", help="write stage timers, counters and peak memory of every file as JSON")
+    parser.add_argument("--memory", action="store_true", help="measure peak memory of every stage, slows down the run")
+    parser.add_argument("--profile", metavar="FOLDER", help="write a cProfile dump of every stage to a folder per file")
+    parser.add_argument("--elevation-mask", type=float, default=ELEVATION_MASK, metavar="DEGREES", help="drop satellites below this elevation before solving")
+    parser.add_argument("--no-elevation-mask", action="store_true", help="use satellites at every elevation")
+    parser.add_argument("--max-pdop", type=float, default=MAX_PDOP, help="skip epochs whose position dilution of precision is above this")
+    parser.add_argument("--raim", action="store_true", help="exclude one satellite from epochs whose residuals fail the fault detection test, needs pseudoranges corrected for the satellite clocks")
+    parser.add_argument("--no-light-time", action="store_true", help="use satellite positions at the reception instead of the transmission of the signals")
+    parser.add_argument("--resample", action="store_true", help="smooth the pseudoranges onto a common epoch grid before solving, not used with --stream")
+    parser.add_argument("--resample-interval", type=float, default=RESAMPLE_INTERVAL, metavar="SECONDS", help="spacing of the resampled epoch grid")
+    parser.add_argument("--smoothing-window", type=int, default=SMOOTHING_WINDOW, metavar="MEASUREMENTS", help="measurements in every polynomial fit of the resampling")
+    parser.add_argument("--smoothing-degree", type=int, default=SMOOTHING_DEGREE, help="degree of the polynomial fits of the resampling")
+    args = parser.parse_args()
+
+    workers = args.workers if args.workers > 0 else os.cpu_count()
+
+    plot_options = {"dpi": args.dpi, "workers": args.plot_workers}
+
+    if args.plots is not None:
+        plot_options["plots"] = args.plots.split(",")
+
+        for name in plot_options["plots"]:
+            if name not in PLOTS:
+                parser.error(f"unknown plot \"{name}\"")
+
+    instrumentation_options = {"memory": args.memory, "profile_folder": args.profile}
+
+    solve_options = {"elevation_mask": None if args.no_elevation_mask else args.elevation_mask, "max_pdop": args.max_pdop, "raim": args.raim, "light_time": not args.no_light_time}
+
+    resample_options = {"interval": args.resample_interval, "window": args.smoothing_window, "degree": args.smoothing_degree} if args.resample else None
+
+    if resample_options is not None and args.smoothing_window < args.smoothing_degree + 1:
+        parser.error("the smoothing window needs more measurements than the smoothing degree")
+
+    run(streaming=args.stream, plot=not args.no_plot, workers=workers, report_path=args.report, plot_options=plot_options, use_cache=not args.no_cache, orbit_mode=args.orbit_mode, instrumentation_path=args.instrument, instrumentation_options=instrumentation_options, solve_options=solve_options, resample_options=resample_options)
@@ -0,0 +1,92 @@
+import cProfile
+import os
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+# Stage timers, counters, peak memory and optional cProfile dumps for a run
+class Instrumentation:
+    # Constructor
+    def __init__(self) -> None:
+        # Measure peak memory of each stage with tracemalloc, slows down allocations
+        self.memory: bool = False
+
+        # Folder for cProfile dumps of each stage, None to disable profiling
+        self.profile_folder: str = None
+
+        # Statistics of each stage by name: calls, seconds and peak memory
+        self.stages: dict[str, dict] = {}
+
+        # Counters by name
+        self.counters: dict[str, int] = {}
+
+    # Removes all statistics and sets what is measured
+    def reset(self, memory: bool = False, profile_folder: str = None):
+        self.memory = memory
+        self.profile_folder = profile_folder
+
+        self.stages = {}
+        self.counters = {}
+
+    # Adds to a counter
+    def count(self, name: str, amount: int = 1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    # Measures the code run inside a with block as a stage
+    # stages should not be nested when memory is measured since tracemalloc has a single peak
+    @contextmanager
+    def stage(self, name: str):
+        profiler = None
+
+        if self.profile_folder is not None:
+            profiler = cProfile.Profile()
+
+        started_tracing = False
+
+        if self.memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                started_tracing = True
+
+            tracemalloc.reset_peak()
+
+        start = time.perf_counter()
+
+        if profiler is not None:
+            profiler.enable()
+
+        try:
+            yield
+        finally:
+            if profiler is not None:
+                profiler.disable()
+
+            seconds = time.perf_counter() - start
+
+            statistics = self.stages.setdefault(name, {"calls": 0, "seconds": 0.0, "peak_memory_bytes": None})
+
+            statistics["calls"] += 1
+            statistics["seconds"] += seconds
+
+            if self.memory:
+                peak = tracemalloc.get_traced_memory()[1]
+
+                statistics["peak_memory_bytes"] = max(statistics["peak_memory_bytes"] or 0, peak)
+
+                if started_tracing:
+                    tracemalloc.stop()
+
+            if profiler is not None:
+                os.makedirs(self.profile_folder, exist_ok=True)
+
+                profiler.dump_stats(os.path.join(self.profile_folder, f"{name}.prof"))
+
+    # Returns the statistics as a JSON serializable dictionary
+    def report(self) -> dict:
+        return {
+            "stages": {name: dict(statistics) for (name, statistics) in self.stages.items()},
+            "counters": dict(self.counters),
+        }
+
+# Instrumentation shared by all stages of the current process
+INSTRUMENTATION = Instrumentation()
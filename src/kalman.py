@@ -0,0 +1,207 @@
+import numpy as np
+
+from estimation import *
+
+# Standard deviation of the pseudoranges assumed by the filter (meters)
+KALMAN_MEASUREMENT_NOISE = 10.0
+
+# Spectral density of the receiver acceleration (m^2/s^3) and standard deviation of the initial velocity (meters per second)
+KALMAN_ACCELERATION_NOISE = 1.0
+KALMAN_INITIAL_VELOCITY_SIGMA = 1000.0
+
+# Standard deviation of the initial clock drift (meters per second)
+KALMAN_INITIAL_DRIFT_SIGMA = 1000.0
+
+# Normalized innovation (standard deviations) above which a satellite is down-weighted onto the gate
+KALMAN_INNOVATION_GATE = 3.0
+
+# Median normalized squared innovation of an epoch above which the prediction is wrong rather than some satellites
+# 25 is a median innovation of 5 standard deviations
+KALMAN_RESET_THRESHOLD = 25.0
+
+# Extended Kalman filter estimating receiver position, velocity, clock bias and clock drift from pseudoranges
+# state: [x, y, z, vx, vy, vz, clock bias, clock drift] in meters and meters per second
+class PositionKalmanFilter:
+    # Constructor
+    # acceleration_noise: spectral density of the receiver acceleration (m^2/s^3)
+    # clock_bias_noise, clock_drift_noise: spectral densities of the clock random walks (m^2/s and m^2/s^3)
+    # measurement_noise: standard deviation of the pseudoranges (meters)
+    # initial_velocity_sigma, initial_drift_sigma: standard deviations of the initial velocity and clock drift (meters per second)
+    # innovation_gate: normalized innovation above which the variance of a satellite is inflated to put it on the gate
+    # reset_threshold: median normalized squared innovation above which the filter restarts from a least squares fix
+    def __init__(self, max_satellites: int = 32, acceleration_noise: float = KALMAN_ACCELERATION_NOISE, clock_bias_noise: float = 1.0, clock_drift_noise: float = 1.0, measurement_noise: float = KALMAN_MEASUREMENT_NOISE, initial_velocity_sigma: float = KALMAN_INITIAL_VELOCITY_SIGMA, initial_drift_sigma: float = KALMAN_INITIAL_DRIFT_SIGMA, innovation_gate: float = KALMAN_INNOVATION_GATE, reset_threshold: float = KALMAN_RESET_THRESHOLD) -> None:
+        self.acceleration_noise: float = acceleration_noise
+        self.clock_bias_noise: float = clock_bias_noise
+        self.clock_drift_noise: float = clock_drift_noise
+        self.measurement_noise: float = measurement_noise
+        self.initial_velocity_sigma: float = initial_velocity_sigma
+        self.initial_drift_sigma: float = initial_drift_sigma
+        self.innovation_gate: float = innovation_gate
+        self.reset_threshold: float = reset_threshold
+
+        # Number of restarts caused by inconsistent measurements
+        self.resets: int = 0
+
+        # Number of measurements down-weighted by the innovation gate
+        self.downweighted: int = 0
+
+        # State and state covariance
+        self.state: np.ndarray = np.zeros(8)
+        self.covariance: np.ndarray = np.zeros((8, 8))
+
+        # Time of the state (seconds), None until the filter is initialized
+        self.time: float = None
+
+        # Preallocated state transition and process noise matrices, rebuilt only when the time step changes
+        self.transition: np.ndarray = np.eye(8)
+        self.process_noise: np.ndarray = np.zeros((8, 8))
+        self.time_step: float = None
+
+        # Preallocated measurement matrices, only the first rows are used when fewer satellites are tracked
+        self.observation: np.ndarray = np.zeros((max_satellites, 8))
+        self.observation[:, 6] = 1
+        self.innovation: np.ndarray = np.zeros(max_satellites)
+        self.variances: np.ndarray = np.zeros(max_satellites)
+        self.innovation_covariance: np.ndarray = np.zeros((max_satellites, max_satellites))
+        self.gain: np.ndarray = np.zeros((8, max_satellites))
+        self.identity: np.ndarray = np.eye(8)
+
+    # Starts the filter from a least squares fix
+    def initialize(self, time: float, satellite_ecefs: np.ndarray, pseudoranges: np.ndarray):
+        mask = np.ones((1, len(pseudoranges)), dtype=bool)
+
+        (positions, clock_biases) = solve_epochs(satellite_ecefs[np.newaxis], pseudoranges[np.newaxis], mask)
+
+        self.state[:] = 0
+        self.state[0:3] = positions[0]
+        self.state[6] = clock_biases[0, 0]
+
+        # large initial uncertainty of the position and clock bias of the least squares fix
+        fix_variance = 100 * self.measurement_noise ** 2
+        velocity_variance = self.initial_velocity_sigma ** 2
+
+        self.covariance[:] = np.diag([fix_variance, fix_variance, fix_variance, velocity_variance, velocity_variance, velocity_variance, fix_variance, self.initial_drift_sigma ** 2])
+
+        self.time = time
+
+    # Propagates the state to a later time with a constant velocity and constant drift model
+    def predict(self, time: float):
+        dt = time - self.time
+
+        if dt <= 0:
+            return
+
+        if dt != self.time_step:
+            self.build_process(dt)
+
+        self.state = self.transition @ self.state
+        self.covariance = self.transition @ self.covariance @ self.transition.T + self.process_noise
+
+        self.time = time
+
+    # Builds the state transition and process noise matrices of a time step
+    def build_process(self, dt: float):
+        self.transition[0:3, 3:6] = np.eye(3) * dt
+        self.transition[6, 7] = dt
+
+        # white noise acceleration and clock random walk process noise
+        self.process_noise[:] = 0
+
+        for axis in range(0, 3):
+            self.process_noise[axis, axis] = self.acceleration_noise * dt ** 3 / 3
+            self.process_noise[axis, axis + 3] = self.acceleration_noise * dt ** 2 / 2
+            self.process_noise[axis + 3, axis] = self.acceleration_noise * dt ** 2 / 2
+            self.process_noise[axis + 3, axis + 3] = self.acceleration_noise * dt
+
+        self.process_noise[6, 6] = self.clock_bias_noise * dt + self.clock_drift_noise * dt ** 3 / 3
+        self.process_noise[6, 7] = self.clock_drift_noise * dt ** 2 / 2
+        self.process_noise[7, 6] = self.clock_drift_noise * dt ** 2 / 2
+        self.process_noise[7, 7] = self.clock_drift_noise * dt
+
+        self.time_step = dt
+
+    # Corrects the state with the pseudoranges of the satellites at some ECEF positions
+    # satellites whose innovation is outside the gate are down-weighted instead of being trusted or dropped
+    # returns False without changing the state if most measurements are inconsistent with the prediction
+    def update(self, satellite_ecefs: np.ndarray, pseudoranges: np.ndarray) -> bool:
+        n = len(pseudoranges)
+
+        observation = self.observation[:n]
+
+        line_of_sight_vectors = satellite_ecefs - self.state[0:3]
+
+        assumed_ranges = np.sqrt(np.einsum("ij,ij->i", line_of_sight_vectors, line_of_sight_vectors))
+
+        observation[:, 0:3] = -line_of_sight_vectors / assumed_ranges[:, np.newaxis]
+
+        innovation = self.innovation[:n]
+        np.subtract(pseudoranges, assumed_ranges + self.state[6], out=innovation)
+
+        observation_covariance = observation @ self.covariance
+
+        innovation_covariance = self.innovation_covariance[:n, :n]
+        np.matmul(observation_covariance, observation.T, out=innovation_covariance)
+
+        variances = self.variances[:n]
+        variances[:] = self.measurement_noise ** 2
+
+        # normalized innovation squared per satellite
+        normalized = innovation ** 2 / (np.diagonal(innovation_covariance) + variances)
+
+        # the median is above the threshold when more than half of the satellites are
+        if 2 * np.count_nonzero(normalized > self.reset_threshold) > n:
+            return False
+
+        # the variances of satellites outside the gate grow until their normalized innovation is on the gate
+        outside = normalized > self.innovation_gate ** 2
+
+        if np.any(outside):
+            variances[outside] *= normalized[outside] / self.innovation_gate ** 2
+
+            self.downweighted += int(np.count_nonzero(outside))
+
+        innovation_covariance[np.diag_indices(n)] += variances
+
+        gain = self.gain[:, :n]
+        gain[:] = np.linalg.solve(innovation_covariance, observation_covariance).T
+
+        self.state = self.state + gain @ innovation
+
+        # Joseph form keeps the covariance symmetric and positive definite
+        correction = self.identity - gain @ observation
+        self.covariance = correction @ self.covariance @ correction.T + (gain * variances) @ gain.T
+
+        return True
+
+    # Processes one epoch and returns the filtered (position, clock bias)
+    def step(self, time: float, satellite_ecefs: np.ndarray, pseudoranges: np.ndarray) -> tuple[np.ndarray, float]:
+        if self.time is None:
+            self.initialize(time, satellite_ecefs, pseudoranges)
+        else:
+            self.predict(time)
+
+            if not self.update(satellite_ecefs, pseudoranges):
+                self.resets += 1
+                self.initialize(time, satellite_ecefs, pseudoranges)
+
+        return (self.state[0:3].copy(), self.state[6])
+
+# calculate filtered fixes for every epoch with at least 4 satellites
+def filter_fixes(gps_list: list[GPSSatellite], epoch_index: EpochIndex = None, kalman_filter: PositionKalmanFilter = None) -> Fixes:
+    (all_times, ecefs, pseudoranges, mask) = stack_epochs(gps_list, epoch_index)
+
+    if kalman_filter is None:
+        kalman_filter = PositionKalmanFilter(max_satellites=max(mask.shape[1], 4))
+
+    # Choose at least 4 satellites at same time
+    valid = np.flatnonzero(np.count_nonzero(mask, axis=1) >= 4)
+
+    positions = np.zeros((len(valid), 3))
+    clock_biases = np.zeros(len(valid))
+
+    for i in range(0, len(valid)):
+        epoch = valid[i]
+
+        (positions[i], clock_biases[i]) = kalman_filter.step(all_times[epoch], ecefs[epoch][mask[epoch]], pseudoranges[epoch][mask[epoch]])
+
+    return Fixes(all_times[valid], positions, clock_biases)
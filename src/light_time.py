@@ -0,0 +1,121 @@
+import numpy as np
+
+from satellites import *
+from instrumentation import *
+
+# Change of the travel times below which the light-time iteration stops (seconds), a picosecond is 0.3 mm of range
+LIGHT_TIME_TOLERANCE = 1e-12
+
+# Most iterations of the light-time correction, it normally converges in three
+LIGHT_TIME_MAX_ITERATIONS = 10
+
+# Signal travel time from GNSS orbits to the ground, used to start the iteration without pseudoranges (seconds)
+NOMINAL_TRAVEL_TIME = 0.075
+
+# Rotates ECEF positions at the transmission of signals into the ECEF frame at their reception (Sagnac correction)
+# the earth turns by its rotation rate times the travel time while the signals travel
+def sagnac_rotation(positions: np.ndarray, travel_times: np.ndarray) -> np.ndarray:
+    return rotate_about_z(positions, EARTH_ROTATION_RATE * travel_times)
+
+# Satellite ECEF positions at the transmission of signals received at some times, in the ECEF frame of the reception
+# positions_at gives ECEF positions (N, 3) at times (N,) and is called once per iteration for all signals at once
+# travel times start from travel_times and are iterated on the range to the receivers until they change less than the tolerance
+# returns (positions, travel times, iterations)
+def transmitted_positions(positions_at, times: np.ndarray, receiver_positions: np.ndarray, travel_times: np.ndarray = None, tolerance: float = LIGHT_TIME_TOLERANCE, max_iterations: int = LIGHT_TIME_MAX_ITERATIONS) -> tuple[np.ndarray, np.ndarray, int]:
+    if travel_times is None:
+        travel_times = np.full(len(times), NOMINAL_TRAVEL_TIME)
+
+    positions = np.zeros((len(times), 3))
+    iterations = 0
+
+    while iterations < max_iterations:
+        iterations += 1
+
+        positions = sagnac_rotation(positions_at(times - travel_times), travel_times)
+
+        ranges = np.linalg.norm(positions - receiver_positions, axis=1)
+
+        converged = np.max(np.abs(ranges / SPEED_OF_LIGHT - travel_times), initial=0) < tolerance
+
+        travel_times = ranges / SPEED_OF_LIGHT
+
+        if converged:
+            break
+
+    return (positions, travel_times, iterations)
+
+# One satellite holding the ephemerides of several satellites of the same class, system and orbit mode one after another
+# returns the satellite and the index of the first ephemeris of every satellite in it
+def concatenate_satellites(satellites: list[GPSSatellite | GlonassSatellite]) -> tuple[GPSSatellite | GlonassSatellite, np.ndarray]:
+    offsets = np.cumsum([0] + [len(gps.times_of_ephemeris) for gps in satellites])[:-1]
+
+    times_of_ephemeris = np.concatenate([gps.times_of_ephemeris for gps in satellites])
+
+    if isinstance(satellites[0], GlonassSatellite):
+        positions = np.concatenate([gps.positions for gps in satellites])
+        velocities = np.concatenate([gps.velocities for gps in satellites])
+        accelerations = np.concatenate([gps.accelerations for gps in satellites])
+
+        return (GlonassSatellite(0, np.zeros(0), np.zeros(0), times_of_ephemeris, positions, velocities, accelerations, satellites[0].orbit_mode), offsets)
+
+    perturbations = np.zeros(len(times_of_ephemeris), dtype=[(name, np.float64) for name in PERTURBATION_FIELDS])
+
+    for name in PERTURBATION_FIELDS:
+        perturbations[name] = np.concatenate([gps.perturbations[name] for gps in satellites])
+
+    elements = [np.concatenate([getattr(gps, name) for gps in satellites]) for name in ("eccentricities", "inclinations", "mean_anomalies", "semi_major_axes", "right_ascension_of_ascending_node", "arguments_of_periapsis")]
+
+    return (GPSSatellite(0, np.zeros(0), np.zeros(0), *elements, times_of_ephemeris, perturbations, satellites[0].orbit_mode, satellites[0].system), offsets)
+
+# Returns a function giving the ECEF positions (N, 3) of signals at any times (N,)
+# signal n comes from the satellite satellites[n] of gps_list and uses the ephemeris nearest to times[n]
+# satellites of the same class, system and orbit mode are propagated together, so every call takes one pass per group
+def signal_positions(gps_list: list[GPSSatellite | GlonassSatellite], satellites: np.ndarray, times: np.ndarray):
+    groups = {}
+
+    for (column, gps) in enumerate(gps_list):
+        groups.setdefault((type(gps), gps.system, gps.orbit_mode), []).append(column)
+
+    batches = []
+
+    for columns in groups.values():
+        (combined, offsets) = concatenate_satellites([gps_list[column] for column in columns])
+
+        rows = np.flatnonzero(np.isin(satellites, columns))
+
+        indices = np.empty(len(rows), dtype=int)
+
+        # the ephemeris of every signal is chosen once, at its reception time
+        for (k, column) in enumerate(columns):
+            signals = np.flatnonzero(satellites[rows] == column)
+
+            indices[signals] = offsets[k] + gps_list[column].ephemeris_indices(times[rows[signals]])
+
+        batches.append((rows, combined, indices))
+
+    def positions_at(transmission_times: np.ndarray) -> np.ndarray:
+        positions = np.zeros((len(transmission_times), 3))
+
+        for (rows, combined, indices) in batches:
+            positions[rows] = combined.ecef_at(transmission_times[rows], indices)
+
+        return positions
+
+    return positions_at
+
+# Corrects the stacked satellite positions (E, S, 3) of stack_epochs for the signal travel time and the earth rotation during it
+# travel times start from the pseudoranges and are iterated on the ranges to the receiver positions (E, 3),
+# returns the satellite positions at the transmission of every signal in the ECEF frame at its reception
+def correct_light_time(gps_list: list[GPSSatellite | GlonassSatellite], times: np.ndarray, pseudoranges: np.ndarray, mask: np.ndarray, receiver_positions: np.ndarray) -> np.ndarray:
+    (epochs, satellites) = np.nonzero(mask)
+
+    positions_at = signal_positions(gps_list, satellites, times[epochs])
+
+    (positions, travel_times, iterations) = transmitted_positions(positions_at, times[epochs], receiver_positions[epochs], pseudoranges[epochs, satellites] / SPEED_OF_LIGHT)
+
+    INSTRUMENTATION.count("light_time_iterations", iterations)
+
+    ecefs = np.zeros(mask.shape + (3,))
+    ecefs[epochs, satellites] = positions
+
+    return ecefs
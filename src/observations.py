@@ -0,0 +1,233 @@
+import numpy as np
+
+from rtcm import *
+from satellites import *
+
+# Row layout of pseudorange observations, satellites are integer indices into ObservationStore.svs
+# times and times of ephemeris are continuous GPS times (seconds since the GPS epoch)
+OBSERVATION_DTYPE = np.dtype([
+    ("satellite", np.int32),
+    ("time", np.float64),
+    ("pseudorange", np.float64),
+])
+
+# Row layout of ephemerides
+EPHEMERIS_DTYPE = np.dtype([
+    ("satellite", np.int32),
+    ("eccentricity", np.float64),
+    ("inclination", np.float64),
+    ("mean_anomaly", np.float64),
+    ("semi_major_axis", np.float64),
+    ("right_ascension_of_ascending_node", np.float64),
+    ("argument_of_periapsis", np.float64),
+    ("time_of_ephemeris", np.float64),
+] + [(name, np.float64) for name in PERTURBATION_FIELDS])
+
+# Row layout of GLONASS ephemerides
+GLONASS_EPHEMERIS_DTYPE = np.dtype([
+    ("satellite", np.int32),
+    ("time_of_ephemeris", np.float64),
+    ("position", np.float64, 3),
+    ("velocity", np.float64, 3),
+    ("acceleration", np.float64, 3),
+    ("clock_bias", np.float64),
+    ("relative_frequency_bias", np.float64),
+    ("frequency_channel", np.int32),
+])
+
+# Returns the ephemeris row of a RTCM 1019, 1045 or 1046 message for a satellite index
+def ephemeris_row(satellite: int, message: RTCM1019 | RTCM1045) -> tuple:
+    return (satellite, message.eccentricity, message.inclination, message.mean_anomaly, message.semi_major_axis, message.right_ascension_of_ascending_node, message.argument_of_periapsis, message.gps_time_of_ephemeris) + tuple(getattr(message, name) for name in PERTURBATION_FIELDS)
+
+# Returns the GLONASS ephemeris row of a RTCM 1020 message for a satellite index
+def glonass_ephemeris_row(satellite: int, message: RTCM1020) -> tuple:
+    return (satellite, message.gps_time_of_ephemeris, message.position, message.velocity, message.acceleration, message.clock_bias, message.relative_frequency_bias, message.frequency_channel)
+
+# Returns a structured array with the single ephemeris row of an ephemeris message
+def ephemeris_array(satellite: int, message: RTCM1019 | RTCM1020 | RTCM1045) -> np.ndarray:
+    if message.system == "R":
+        return np.array([glonass_ephemeris_row(satellite, message)], dtype=GLONASS_EPHEMERIS_DTYPE)
+
+    return np.array([ephemeris_row(satellite, message)], dtype=EPHEMERIS_DTYPE)
+
+# Creates the satellite object of a satellite system from its observation and ephemeris rows
+def satellite_from_views(system: str, sv: int, observations: np.ndarray, ephemerides: np.ndarray) -> GPSSatellite | GlonassSatellite:
+    if system == "R":
+        return GlonassSatellite.from_views(sv, observations, ephemerides)
+
+    return GPSSatellite.from_views(sv, observations, ephemerides, system)
+
+# Structured NumPy array with amortized O(1) appends
+class GrowableArray:
+    # Constructor
+    def __init__(self, dtype: np.dtype, capacity: int = 1024) -> None:
+        # Preallocated rows, only the first size rows are used
+        self.data: np.ndarray = np.empty(capacity, dtype=dtype)
+
+        # Number of used rows
+        self.size: int = 0
+
+    # Number of used rows
+    def __len__(self) -> int:
+        return self.size
+
+    # Makes room for at least n more rows by doubling the capacity
+    def reserve(self, n: int):
+        if self.size + n <= len(self.data):
+            return
+
+        capacity = max(2 * len(self.data), self.size + n)
+
+        data = np.empty(capacity, dtype=self.data.dtype)
+        data[:self.size] = self.data[:self.size]
+
+        self.data = data
+
+    # Appends one row given as a tuple of field values
+    def append(self, row: tuple):
+        self.reserve(1)
+
+        self.data[self.size] = row
+        self.size += 1
+
+    # Appends a structured array of rows
+    def extend(self, rows: np.ndarray):
+        self.reserve(len(rows))
+
+        self.data[self.size:self.size + len(rows)] = rows
+        self.size += len(rows)
+
+    # Returns the used rows without copying
+    def view(self) -> np.ndarray:
+        return self.data[:self.size]
+
+# Sorts rows by satellite and returns (rows, offsets) so that the rows of satellite i are rows[offsets[i]:offsets[i + 1]]
+def group_by_satellite(rows: np.ndarray, num_satellites: int) -> tuple[np.ndarray, np.ndarray]:
+    # stable sort keeps the rows of every satellite in the order they were received
+    rows = rows[np.argsort(rows["satellite"], kind="stable")]
+
+    offsets = np.searchsorted(rows["satellite"], np.arange(num_satellites + 1))
+
+    return (rows, offsets)
+
+# Columnar store of pseudorange observations and deduplicated ephemerides of all satellites
+# satellites of all systems share the observation rows and are keyed by (system, sv)
+class ObservationStore:
+    # Constructor
+    def __init__(self) -> None:
+        # Satellite identification number of every satellite index
+        self.svs: list[int] = []
+
+        # Satellite system of every satellite index
+        self.systems: list[str] = []
+
+        # Satellite index of every (system, satellite identification number)
+        self.satellite_indices: dict[tuple[str, int], int] = {}
+
+        # Pseudorange observations of all satellites in the order they were received
+        self.observations: GrowableArray = GrowableArray(OBSERVATION_DTYPE)
+
+        # Keplerian ephemerides of GPS and Galileo satellites in the order they were received
+        self.ephemerides: GrowableArray = GrowableArray(EPHEMERIS_DTYPE)
+
+        # State vector ephemerides of GLONASS satellites in the order they were received
+        self.glonass_ephemerides: GrowableArray = GrowableArray(GLONASS_EPHEMERIS_DTYPE)
+
+        # (system, sv, time of ephemeris) of every stored ephemeris
+        self.ephemeris_keys: set[tuple[str, int, float]] = set()
+
+        # Number of dropped duplicate ephemeris messages
+        self.duplicate_ephemerides: int = 0
+
+    # Returns the satellite index of a satellite of a system, adding it if it is new
+    def satellite_index(self, sv: int, system: str = "G") -> int:
+        index = self.satellite_indices.get((system, sv))
+
+        if index is None:
+            index = len(self.svs)
+
+            self.satellite_indices[(system, sv)] = index
+            self.svs.append(sv)
+            self.systems.append(system)
+
+        return index
+
+    # Adds the pseudoranges of a RTCM 1002 or MSM message
+    def add_observations(self, message: RTCM1002 | RTCMMSM):
+        rows = np.empty(len(message.svs), dtype=OBSERVATION_DTYPE)
+
+        rows["satellite"] = [self.satellite_index(sv, message.system) for sv in message.svs]
+        rows["time"] = message.gps_time
+        rows["pseudorange"] = message.pseudoranges
+
+        self.observations.extend(rows)
+
+    # Adds the ephemeris of a RTCM 1019, 1020, 1045 or 1046 message unless the same ephemeris was already stored
+    def add_ephemeris(self, message: RTCM1019 | RTCM1020 | RTCM1045):
+        key = (message.system, message.sv, message.gps_time_of_ephemeris)
+
+        if key in self.ephemeris_keys:
+            self.duplicate_ephemerides += 1
+
+            return
+
+        self.ephemeris_keys.add(key)
+
+        satellite = self.satellite_index(message.sv, message.system)
+
+        if message.system == "R":
+            self.glonass_ephemerides.append(glonass_ephemeris_row(satellite, message))
+        else:
+            self.ephemerides.append(ephemeris_row(satellite, message))
+
+    # Adds an observation or ephemeris message
+    def add(self, message: RTCM1002 | RTCMMSM | RTCM1019 | RTCM1020 | RTCM1045):
+        if isinstance(message, OBSERVATION_MESSAGES):
+            self.add_observations(message)
+        else:
+            self.add_ephemeris(message)
+
+    # Returns the observations, ephemerides and GLONASS ephemerides sorted by satellite index with their offsets
+    # as (observations, observation_offsets, ephemerides, ephemeris_offsets, glonass_ephemerides, glonass_ephemeris_offsets)
+    def grouped(self) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        (observations, observation_offsets) = group_by_satellite(self.observations.view(), len(self.svs))
+        (ephemerides, ephemeris_offsets) = group_by_satellite(self.ephemerides.view(), len(self.svs))
+        (glonass_ephemerides, glonass_ephemeris_offsets) = group_by_satellite(self.glonass_ephemerides.view(), len(self.svs))
+
+        return (observations, observation_offsets, ephemerides, ephemeris_offsets, glonass_ephemerides, glonass_ephemeris_offsets)
+
+    # Returns (observations, ephemerides) lists with a zero-copy view per satellite index
+    # the ephemerides of GLONASS satellites are GLONASS ephemeris rows
+    def satellite_views(self) -> tuple[list[np.ndarray], list[np.ndarray]]:
+        return split_by_satellite(self.systems, *self.grouped())
+
+    # Creates satellite objects sorted by system and sv for every satellite with at least one ephemeris
+    def to_gps(self) -> list[GPSSatellite | GlonassSatellite]:
+        return grouped_to_gps(self.svs, self.systems, *self.grouped())
+
+# Returns (observations, ephemerides) lists with a zero-copy view per satellite index of rows grouped by satellite
+# GLONASS satellites get their views of the GLONASS ephemeris rows
+def split_by_satellite(systems: list[str], observations: np.ndarray, observation_offsets: np.ndarray, ephemerides: np.ndarray, ephemeris_offsets: np.ndarray, glonass_ephemerides: np.ndarray, glonass_ephemeris_offsets: np.ndarray) -> tuple[list[np.ndarray], list[np.ndarray]]:
+    observation_views = [observations[observation_offsets[i]:observation_offsets[i + 1]] for i in range(0, len(observation_offsets) - 1)]
+
+    ephemeris_views = []
+
+    for i in range(0, len(ephemeris_offsets) - 1):
+        if systems[i] == "R":
+            ephemeris_views.append(glonass_ephemerides[glonass_ephemeris_offsets[i]:glonass_ephemeris_offsets[i + 1]])
+        else:
+            ephemeris_views.append(ephemerides[ephemeris_offsets[i]:ephemeris_offsets[i + 1]])
+
+    return (observation_views, ephemeris_views)
+
+# Creates satellite objects sorted by system and sv from rows grouped by satellite, for every satellite with at least one ephemeris
+def grouped_to_gps(svs: list[int], systems: list[str], observations: np.ndarray, observation_offsets: np.ndarray, ephemerides: np.ndarray, ephemeris_offsets: np.ndarray, glonass_ephemerides: np.ndarray, glonass_ephemeris_offsets: np.ndarray) -> list[GPSSatellite | GlonassSatellite]:
+    (observation_views, ephemeris_views) = split_by_satellite(systems, observations, observation_offsets, ephemerides, ephemeris_offsets, glonass_ephemerides, glonass_ephemeris_offsets)
+
+    gps_list: list[GPSSatellite | GlonassSatellite] = []
+
+    for i in sorted(range(0, len(svs)), key=lambda i: (SYSTEMS.index(systems[i]), svs[i])):
+        if len(ephemeris_views[i]) > 0:
+            gps_list.append(satellite_from_views(str(systems[i]), int(svs[i]), observation_views[i], ephemeris_views[i]))
+
+    return gps_list
@@ -0,0 +1,223 @@
+import numpy as np
+
+from satellites import *
+
+# Degree of the Chebyshev polynomial of every table segment
+ORBIT_TABLE_DEGREE = 12
+
+# Length of the table segments before they are split to meet the tolerance (seconds)
+ORBIT_TABLE_SEGMENT = 7200.0
+
+# Largest position error of a table against direct evaluation at the check points of every segment (meters)
+# continuous GPS times only resolve about 0.2 microseconds, so tables can not be trusted much below a millimeter
+ORBIT_TABLE_TOLERANCE = 0.01
+
+# Largest size of the coefficients and segment bounds of one table (bytes)
+ORBIT_TABLE_MEMORY = 2 ** 20
+
+# Direct ECI positions (N, 3) of a satellite at any times, computed like position_eci but without POSITION_CACHE
+def direct_positions_eci(gps: GPSSatellite | GlonassSatellite, times: np.ndarray) -> np.ndarray:
+    satellite = gps.with_measurements(np.zeros(len(times)), times)
+
+    # GLONASS and the "full" mode propagate ECEF positions, which position_eci rotates to the inertial frame at GPS time zero
+    if isinstance(gps, GlonassSatellite) or gps.orbit_mode == "full":
+        return ecef_to_gps_inertial(satellite.compute_position_ecef(), times)
+
+    return satellite.compute_position_eci()
+
+# Converts ECI positions of a satellite at some times to ECEF, the inverse of the inertial frame of its orbit mode
+def inertial_to_ecef(gps: GPSSatellite | GlonassSatellite, eci: np.ndarray, times: np.ndarray) -> np.ndarray:
+    if isinstance(gps, GlonassSatellite) or gps.orbit_mode == "full":
+        return rotate_about_z(eci, EARTH_ROTATION_RATE * np.asarray(times))
+
+    return eci_to_ecef(eci, times)
+
+# Chebyshev nodes of the first kind as angles, the nodes are the cosines of the angles
+def chebyshev_angles(degree: int) -> np.ndarray:
+    return np.pi * (np.arange(degree + 1) + 0.5) / (degree + 1)
+
+# Evaluates the Chebyshev series of segments at points (N,) in [-1, 1]
+# coefficients is (segments, degree + 1, 3) and segments gives the segment of every point
+# the points are sorted by segment, so every segment is one matrix product instead of gathering coefficients per point
+def chebyshev_values(coefficients: np.ndarray, segments: np.ndarray, points: np.ndarray) -> np.ndarray:
+    order = np.argsort(segments, kind="stable")
+
+    segments = segments[order]
+    points = points[order]
+
+    # Chebyshev polynomials of every degree at the points by their recurrence, one contiguous row per degree
+    polynomials = np.empty((coefficients.shape[1], len(points)))
+    polynomials[0] = 1
+
+    if len(polynomials) > 1:
+        polynomials[1] = points
+
+    for k in range(2, len(polynomials)):
+        np.multiply(2 * points, polynomials[k - 1], out=polynomials[k])
+        polynomials[k] -= polynomials[k - 2]
+
+    starts = np.flatnonzero(np.diff(segments, prepend=-1))
+    ends = np.append(starts[1:], len(points))
+
+    values = np.empty((len(points), 3))
+
+    for (start, end) in zip(starts, ends):
+        values[start:end] = polynomials[:, start:end].T @ coefficients[segments[start]]
+
+    unsorted = np.empty((len(points), 3))
+    unsorted[order] = values
+
+    return unsorted
+
+# Precomputed orbit of a satellite that answers position queries at any times by Chebyshev interpolation
+# the orbit is sampled from position_eci at Chebyshev nodes of every segment, segments end where the nearest ephemeris
+# changes, and segments whose error at the points between the nodes is above the tolerance are split in half
+# until every segment meets the tolerance, a ValueError is raised if that needs more memory than the budget
+class OrbitTable:
+    # Constructor, builds the table of a satellite from start to end (continuous GPS time)
+    def __init__(self, gps: GPSSatellite | GlonassSatellite, start: float, end: float, degree: int = ORBIT_TABLE_DEGREE, tolerance: float = ORBIT_TABLE_TOLERANCE, memory_budget: int = ORBIT_TABLE_MEMORY, segment: float = ORBIT_TABLE_SEGMENT) -> None:
+        # Satellite whose orbit is tabulated
+        self.satellite: GPSSatellite | GlonassSatellite = gps
+
+        # Time span of the table (seconds)
+        self.start: float = start
+        self.end: float = end
+
+        # Degree of the Chebyshev polynomials
+        self.degree: int = degree
+
+        # Largest allowed error at the check points (meters)
+        self.tolerance: float = tolerance
+
+        # Largest allowed size of the table (bytes)
+        self.memory_budget: int = memory_budget
+
+        # Start and end time of every segment in ascending order (seconds)
+        self.segment_starts: np.ndarray = np.zeros(0)
+        self.segment_ends: np.ndarray = np.zeros(0)
+
+        # Chebyshev coefficients of the ECI coordinates of every segment, shape (segments, degree + 1, 3)
+        self.coefficients: np.ndarray = np.zeros((0, degree + 1, 3))
+
+        # Largest error of any segment at its check points (meters)
+        self.max_error: float = 0.0
+
+        # Direct position evaluations used to build the table
+        self.evaluations: int = 0
+
+        if degree < 1:
+            raise ValueError(f"Orbit table needs a polynomial degree of at least 1, got {degree}")
+
+        if end <= start:
+            raise ValueError(f"Orbit table needs an end time after its start time, got {start} to {end}")
+
+        self.build(segment)
+
+    # Size of the coefficients and segment bounds (bytes)
+    def nbytes(self) -> int:
+        return self.coefficients.nbytes + self.segment_starts.nbytes + self.segment_ends.nbytes
+
+    # Size of a table with some number of segments (bytes)
+    def segments_nbytes(self, segments: int) -> int:
+        return segments * ((self.degree + 1) * 3 + 2) * 8
+
+    # Segment bounds of the first pass, at multiples of the segment length and where the nearest ephemeris changes
+    def initial_bounds(self, segment: float) -> np.ndarray:
+        times_of_ephemeris = np.unique(self.satellite.times_of_ephemeris)
+
+        switches = (times_of_ephemeris[1:] + times_of_ephemeris[:-1]) / 2
+
+        bounds = np.concatenate((np.arange(self.start, self.end, segment), switches[(switches > self.start) & (switches < self.end)], [self.end]))
+
+        return np.unique(bounds)
+
+    # Fits the segments from starts to ends, returns their coefficients and their largest errors at the check points
+    def fit_segments(self, starts: np.ndarray, ends: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        centers = (starts + ends)[:, np.newaxis] / 2
+        half_lengths = (ends - starts)[:, np.newaxis] / 2
+
+        node_angles = chebyshev_angles(self.degree)
+
+        # check points halfway between the nodes, where the interpolation error peaks
+        # the segment ends are left out since the direct evaluation may switch ephemeris exactly there
+        check_points = np.cos(np.pi * np.arange(1, self.degree + 1) / (self.degree + 1))
+
+        node_times = centers + half_lengths * np.cos(node_angles)
+        check_times = centers + half_lengths * check_points
+
+        # one direct evaluation for the nodes and check points of all segments
+        positions = direct_positions_eci(self.satellite, np.concatenate((node_times.ravel(), check_times.ravel())))
+
+        self.evaluations += len(positions)
+
+        node_positions = positions[0:node_times.size].reshape(node_times.shape + (3,))
+        check_positions = positions[node_times.size:].reshape(check_times.shape + (3,))
+
+        # discrete Chebyshev transform of the node positions
+        transform = np.cos(np.outer(np.arange(self.degree + 1), node_angles)) * 2 / (self.degree + 1)
+        transform[0] /= 2
+
+        coefficients = np.einsum("kj,sjc->skc", transform, node_positions)
+
+        interpolated = chebyshev_values(coefficients, np.repeat(np.arange(len(starts)), len(check_points)), np.tile(check_points, len(starts)))
+
+        errors = np.linalg.norm(interpolated.reshape(check_positions.shape) - check_positions, axis=2)
+
+        return (coefficients, np.max(errors, axis=1, initial=0))
+
+    # Builds the segments, splitting the segments that miss the tolerance until all of them meet it
+    def build(self, segment: float):
+        bounds = self.initial_bounds(segment)
+
+        (pending_starts, pending_ends) = (bounds[:-1], bounds[1:])
+
+        starts = []
+        ends = []
+        coefficients = []
+        errors = []
+
+        while len(pending_starts) > 0:
+            if self.segments_nbytes(sum(len(part) for part in starts) + len(pending_starts)) > self.memory_budget:
+                raise ValueError(f"Orbit table of {self.satellite.system}{self.satellite.sv:02d} needs more than {self.memory_budget} bytes to meet a tolerance of {self.tolerance} m")
+
+            (pending_coefficients, pending_errors) = self.fit_segments(pending_starts, pending_ends)
+
+            accurate = pending_errors <= self.tolerance
+
+            starts.append(pending_starts[accurate])
+            ends.append(pending_ends[accurate])
+            coefficients.append(pending_coefficients[accurate])
+            errors.append(pending_errors[accurate])
+
+            # failing segments are split at their middle
+            middles = (pending_starts[~accurate] + pending_ends[~accurate]) / 2
+
+            (pending_starts, pending_ends) = (np.concatenate((pending_starts[~accurate], middles)), np.concatenate((middles, pending_ends[~accurate])))
+
+        starts = np.concatenate(starts)
+        order = np.argsort(starts)
+
+        self.segment_starts = starts[order]
+        self.segment_ends = np.concatenate(ends)[order]
+        self.coefficients = np.concatenate(coefficients)[order]
+        self.max_error = float(np.max(np.concatenate(errors), initial=0))
+
+    # Interpolated ECI positions (N, 3) at times within the span of the table, in the frame of position_eci
+    def position_eci(self, times: np.ndarray) -> np.ndarray:
+        times = np.asarray(times, dtype=float)
+
+        if np.any((times < self.start) | (times > self.end)):
+            raise ValueError(f"Orbit table only covers the times from {self.start} to {self.end}")
+
+        segments = np.clip(np.searchsorted(self.segment_starts, times, side="right") - 1, 0, len(self.segment_starts) - 1)
+
+        starts = self.segment_starts[segments]
+        ends = self.segment_ends[segments]
+
+        points = (2 * times - starts - ends) / (ends - starts)
+
+        return chebyshev_values(self.coefficients, segments, points)
+
+    # Interpolated ECEF positions (N, 3) at times within the span of the table
+    def position_ecef(self, times: np.ndarray) -> np.ndarray:
+        return inertial_to_ecef(self.satellite, self.position_eci(times), times)
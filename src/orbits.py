@@ -0,0 +1,189 @@
+import numpy as np
+
+from constants import *
+from frames import *
+
+# Orbit propagation modes of GPSSatellite
+# "series": truncated series from mean to true anomaly, Keplerian orbit in the simplified frames
+# "kepler": Kepler's equation solved iteratively, Keplerian orbit in the simplified frames
+# "full": IS-GPS-200 propagation with all ephemeris corrections, directly in ECEF
+ORBIT_MODES = ("series", "kepler", "full")
+
+# Ephemeris parameters used only by the "full" mode, named like the RTCM1019 attributes
+PERTURBATION_FIELDS = (
+    "mean_motion_correction",
+    "rate_of_right_ascension",
+    "rate_of_inclination",
+    "radius_sine_correction",
+    "radius_cosine_correction",
+    "latitude_sine_correction",
+    "latitude_cosine_correction",
+    "inclination_sine_correction",
+    "inclination_cosine_correction",
+)
+
+# Gravitational parameter of the Keplerian ephemerides of every satellite system (m^3 / s^2)
+GRAVITATIONAL_PARAMETERS = {"G": MU_GPS, "E": MU_GALILEO}
+
+# Step of the numerical integration of GLONASS orbits (seconds)
+GLONASS_INTEGRATION_STEP = 60
+
+# Convergence tolerance of the eccentric anomaly (radians)
+KEPLER_TOLERANCE = 1e-12
+
+# Maximum iterations of the eccentric anomaly solver
+KEPLER_MAX_ITERATIONS = 20
+
+# True anomaly from mean anomaly with a series expansion in eccentricity, accurate to O(e^4)
+# (https://en.wikipedia.org/wiki/Equation_of_the_center#Series_expansion)
+def true_anomaly_series(mean_anomalies: np.ndarray, eccentricities: np.ndarray) -> np.ndarray:
+    return mean_anomalies + (2 * eccentricities - 1/4 * eccentricities ** 3) * np.sin(mean_anomalies) + 5/4 * eccentricities ** 2 * np.sin(2 * mean_anomalies) + 13/12 * eccentricities ** 3 * np.sin(3 * mean_anomalies)
+
+# Solves Kepler's equation M = E - e sin(E) for the eccentric anomaly with Newton's or Halley's method
+# only elements that have not converged are updated, returns (eccentric anomalies, iterations)
+def eccentric_anomaly(mean_anomalies: np.ndarray, eccentricities: np.ndarray, tolerance: float = KEPLER_TOLERANCE, max_iterations: int = KEPLER_MAX_ITERATIONS, method: str = "newton") -> tuple[np.ndarray, int]:
+    (mean_anomalies, eccentricities) = np.broadcast_arrays(np.asarray(mean_anomalies, dtype=float), np.asarray(eccentricities, dtype=float))
+
+    mean_anomalies = mean_anomalies.ravel()
+    eccentricities = eccentricities.ravel()
+
+    # starting guess, good for the small eccentricities of GPS orbits
+    eccentric_anomalies = mean_anomalies + eccentricities * np.sin(mean_anomalies)
+
+    active = np.arange(len(mean_anomalies))
+
+    iterations = 0
+
+    while len(active) > 0 and iterations < max_iterations:
+        iterations += 1
+
+        E = eccentric_anomalies[active]
+        e = eccentricities[active]
+
+        f = E - e * np.sin(E) - mean_anomalies[active]
+        df = 1 - e * np.cos(E)
+
+        if method == "newton":
+            step = f / df
+        elif method == "halley":
+            step = 2 * f * df / (2 * df ** 2 - f * e * np.sin(E))
+        else:
+            raise ValueError(f"Unknown method \"{method}\", choose from: newton, halley")
+
+        eccentric_anomalies[active] = E - step
+
+        active = active[np.abs(step) > tolerance]
+
+    return (eccentric_anomalies, iterations)
+
+# True anomaly from eccentric anomaly
+def true_anomaly_from_eccentric(eccentric_anomalies: np.ndarray, eccentricities: np.ndarray) -> np.ndarray:
+    return 2 * np.arctan2(np.sqrt(1 + eccentricities) * np.sin(eccentric_anomalies / 2), np.sqrt(1 - eccentricities) * np.cos(eccentric_anomalies / 2))
+
+# True anomaly from mean anomaly by solving Kepler's equation
+def true_anomaly_kepler(mean_anomalies: np.ndarray, eccentricities: np.ndarray, tolerance: float = KEPLER_TOLERANCE, method: str = "newton") -> np.ndarray:
+    (eccentric_anomalies, iterations) = eccentric_anomaly(mean_anomalies, eccentricities, tolerance, method=method)
+
+    return true_anomaly_from_eccentric(eccentric_anomalies.reshape(np.shape(mean_anomalies)), eccentricities)
+
+# Satellite ECEF positions (N, 3) at GPS times (N,) following IS-GPS-200 (table 20-IV)
+# times and times of ephemeris may be times of week or continuous GPS times
+# elements holds one value per time of every RTCM1019 orbit parameter, named like the GPSSatellite attributes
+# Galileo ephemerides use the same algorithm with the Galileo gravitational parameter
+def propagate_ecef(times: np.ndarray, elements: dict[str, np.ndarray], tolerance: float = KEPLER_TOLERANCE, gravitational_parameter: float = MU_GPS) -> np.ndarray:
+    # time from ephemeris reference epoch, accounting for the beginning or end of week crossover
+    time_differences = times - elements["time_of_ephemeris"]
+    time_differences = (time_differences + SECONDS_PER_WEEK / 2) % SECONDS_PER_WEEK - SECONDS_PER_WEEK / 2
+
+    semi_major_axes = elements["semi_major_axis"]
+    eccentricities = elements["eccentricity"]
+
+    # corrected mean motion and mean anomaly
+    mean_motion = np.sqrt(gravitational_parameter / semi_major_axes ** 3) + elements["mean_motion_correction"]
+    mean_anomalies = elements["mean_anomaly"] + mean_motion * time_differences
+
+    (eccentric_anomalies, iterations) = eccentric_anomaly(mean_anomalies, eccentricities, tolerance)
+
+    true_anomalies = true_anomaly_from_eccentric(eccentric_anomalies, eccentricities)
+
+    # argument of latitude and second harmonic perturbations
+    argument_of_latitude = true_anomalies + elements["argument_of_periapsis"]
+
+    sin_2u = np.sin(2 * argument_of_latitude)
+    cos_2u = np.cos(2 * argument_of_latitude)
+
+    argument_of_latitude = argument_of_latitude + elements["latitude_sine_correction"] * sin_2u + elements["latitude_cosine_correction"] * cos_2u
+    radius = semi_major_axes * (1 - eccentricities * np.cos(eccentric_anomalies)) + elements["radius_sine_correction"] * sin_2u + elements["radius_cosine_correction"] * cos_2u
+    inclination = elements["inclination"] + elements["rate_of_inclination"] * time_differences + elements["inclination_sine_correction"] * sin_2u + elements["inclination_cosine_correction"] * cos_2u
+
+    # positions in the orbital plane
+    x = radius * np.cos(argument_of_latitude)
+    y = radius * np.sin(argument_of_latitude)
+
+    # corrected longitude of ascending node
+    longitude = elements["right_ascension_of_ascending_node"] + (elements["rate_of_right_ascension"] - EARTH_ROTATION_RATE) * time_differences - EARTH_ROTATION_RATE * (elements["time_of_ephemeris"] % SECONDS_PER_WEEK)
+
+    ecef = np.empty((len(times), 3))
+
+    ecef[:, 0] = x * np.cos(longitude) - y * np.cos(inclination) * np.sin(longitude)
+    ecef[:, 1] = x * np.sin(longitude) + y * np.cos(inclination) * np.cos(longitude)
+    ecef[:, 2] = y * np.sin(inclination)
+
+    return ecef
+
+# Converts ECEF coordinates of propagate_ecef to an inertial frame aligned with ECEF at GPS time zero
+# with continuous GPS times the frame is the same for all weeks
+def ecef_to_gps_inertial(ecef: np.ndarray, times: np.ndarray) -> np.ndarray:
+    return rotate_about_z(ecef, -EARTH_ROTATION_RATE * np.asarray(times))
+
+# Time derivatives of GLONASS satellite states (N, 6) of position and velocity in the rotating PZ-90 frame
+# following the GLONASS interface control document (appendix A.3.1.2), with the J2 term of the gravity field
+def glonass_derivatives(states: np.ndarray, accelerations: np.ndarray) -> np.ndarray:
+    (x, y, z) = (states[:, 0], states[:, 1], states[:, 2])
+    (vx, vy) = (states[:, 3], states[:, 4])
+
+    r2 = x ** 2 + y ** 2 + z ** 2
+    r = np.sqrt(r2)
+
+    # 3/2 J2 mu ae^2 / r^5 and 5 z^2 / r^2
+    a = 1.5 * J2_GLONASS * MU_GLONASS * EARTH_RADIUS_GLONASS ** 2 / (r2 * r2 * r)
+    b = 5 * z ** 2 / r2
+
+    c = -MU_GLONASS / (r2 * r) - a * (1 - b)
+
+    omega = EARTH_ROTATION_RATE_GLONASS
+
+    derivatives = np.empty(states.shape)
+
+    derivatives[:, 0:3] = states[:, 3:6]
+    derivatives[:, 3] = (c + omega ** 2) * x + 2 * omega * vy + accelerations[:, 0]
+    derivatives[:, 4] = (c + omega ** 2) * y - 2 * omega * vx + accelerations[:, 1]
+    derivatives[:, 5] = (c - 2 * a) * z + accelerations[:, 2]
+
+    return derivatives
+
+# Integrates GLONASS satellite states (N, 6) over time differences (N,) with fourth order Runge-Kutta steps
+# every state takes its own steps of at most step seconds, all states are integrated at once
+def integrate_glonass(states: np.ndarray, accelerations: np.ndarray, time_differences: np.ndarray, step: float = GLONASS_INTEGRATION_STEP) -> np.ndarray:
+    states = np.array(states, dtype=float)
+    remaining = np.array(time_differences, dtype=float)
+
+    active = np.flatnonzero(remaining != 0)
+
+    while len(active) > 0:
+        h = np.clip(remaining[active], -step, step)[:, np.newaxis]
+
+        s = states[active]
+        a = accelerations[active]
+
+        k1 = glonass_derivatives(s, a)
+        k2 = glonass_derivatives(s + h / 2 * k1, a)
+        k3 = glonass_derivatives(s + h / 2 * k2, a)
+        k4 = glonass_derivatives(s + h * k3, a)
+
+        states[active] = s + h / 6 * (k1 + 2 * k2 + 2 * k3 + k4)
+        remaining[active] -= h[:, 0]
+
+        active = active[remaining[active] != 0]
+
+    return states
@@ -1,4 +1,7 @@
 import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
 
 import numpy as np
 import matplotlib.pyplot as plt
@@ -7,7 +10,8 @@ import matplotlib as mpl
 
 from satellites import *
 from estimation import *
-from spheres import *
+from epochs import *
+from geodesy import *
 
 # disables offsets in matplotlib
 mpl.rcParams['axes.formatter.useoffset'] = False
@@ -15,30 +19,122 @@ mpl.rcParams['axes.formatter.useoffset'] = False
 # sets matplotlib theme
 plt.style.use("Solarize_Light2")
 
-# Function to save plots in plots folder
-def save_plot(plot_file_name, file_name):
-    print(f"Saving plot \"{plot_file_name}\"...")
+# Basemap objects of every resolution, reused between plots and files since the coastlines are slow to load
+BASEMAPS: dict[str, Basemap] = {}
+
+# Returns the cached world map of a resolution
+def get_basemap(resolution: str = 'l') -> Basemap:
+    if resolution not in BASEMAPS:
+        BASEMAPS[resolution] = Basemap(projection='cyl', resolution=resolution, llcrnrlat=-90, urcrnrlat=90, llcrnrlon=-180, urcrnrlon=180)
+
+    return BASEMAPS[resolution]
+
+# Data shared by the plots of a file, computed once before rendering
+class PlotData:
+    # Constructor, only the data needed by the given plots is computed
+    # solve_options are passed on to estimate_fixes (elevation_mask, max_pdop, raim and light_time)
+    def __init__(self, gps_list: list[GPSSatellite], epoch_index: EpochIndex = None, plots: list[str] = None, solve_options: dict = None) -> None:
+        if plots is None:
+            plots = list(PLOTS)
+
+        needs = set()
+
+        for name in plots:
+            needs.update(PLOT_REQUIREMENTS[name])
+
+        # Times and pseudoranges of every satellite
+        self.pseudoranges: list[tuple[np.ndarray, np.ndarray]] = []
+
+        # ECI and ECEF positions of every satellite at its measurements (meters)
+        self.eci: list[np.ndarray] = []
+        self.ecef: list[np.ndarray] = []
+
+        # ECI orbit of every GPS and Galileo satellite over one revolution (kilometers)
+        self.orbits: list[np.ndarray] = []
+
+        # Times, ECEF positions and dilutions of precision of the estimated fixes
+        self.fix_times: np.ndarray = np.zeros(0)
+        self.positions: np.ndarray = np.zeros((0, 3))
+        self.dops: np.ndarray = np.zeros((0, len(DOP_COLUMNS)))
+
+        # Traceback of every section that could not be computed, the plots needing it are not drawn
+        self.errors: dict[str, str] = {}
+
+        if "pseudoranges" in needs:
+            self.compute("pseudoranges", self.compute_pseudoranges, gps_list)
+
+        if "eci" in needs:
+            self.compute("eci", self.compute_eci, gps_list)
+
+        if "ecef" in needs:
+            self.compute("ecef", self.compute_ecef, gps_list)
+
+        if "orbits" in needs:
+            self.compute("orbits", self.compute_orbits, gps_list)
+
+        if "fixes" in needs:
+            self.compute("fixes", self.compute_fixes, gps_list, epoch_index, solve_options)
+
+    # Computes one section of the data, a failure is kept in errors so the plots not needing the section are still drawn
+    def compute(self, section: str, function, *args):
+        try:
+            function(*args)
+        except Exception:
+            self.errors[section] = traceback.format_exc()
+
+    # Times and pseudoranges of every satellite
+    def compute_pseudoranges(self, gps_list: list[GPSSatellite]):
+        self.pseudoranges = [(sat.times_of_pseudoranges, sat.pseudoranges) for sat in gps_list]
+
+    # ECI positions of every satellite at its measurements
+    def compute_eci(self, gps_list: list[GPSSatellite]):
+        self.eci = [sat.position_eci() for sat in gps_list]
+
+    # ECEF positions of every satellite at its measurements
+    def compute_ecef(self, gps_list: list[GPSSatellite]):
+        self.ecef = [sat.position_ecef() for sat in gps_list]
+
+    # ECI orbit of every GPS and Galileo satellite over one revolution
+    def compute_orbits(self, gps_list: list[GPSSatellite]):
+        step_size = 0.01
+
+        mean_anomalies = np.arange(0, 2 * np.pi + step_size, step_size)
+
+        # GLONASS ephemerides have no orbit elements to draw a revolution from
+        for sat in gps_list:
+            if isinstance(sat, GlonassSatellite):
+                continue
+
+            pqw = sat.perifocal_reference_coordinates(mean_anomalies) / 1000
 
-    # Create folder for plots
-    plot_folder_path = "plots"
+            self.orbits.append(sat.earth_centered_initial(pqw))
 
-    if not os.path.exists(plot_folder_path):
-        os.mkdir(plot_folder_path)
+    # Fixes of every epoch solved with the solve options
+    def compute_fixes(self, gps_list: list[GPSSatellite], epoch_index: EpochIndex, solve_options: dict):
+        fixes = estimate_fixes(gps_list, epoch_index, **(solve_options or {}))
 
-    save_path = os.path.join(plot_folder_path, file_name)
+        self.fix_times = fixes.times
+        self.positions = fixes.positions
+        self.dops = fixes.dops
 
-    if not os.path.exists(save_path):
-        os.mkdir(save_path)
+# Function to save plots in plots folder
+def save_plot(plot_file_name, file_name, dpi=600):
+    print(f"Saving plot \"{plot_file_name}\"...")
+
+    # Create folder for plots, plots may be saved from several processes at once
+    save_path = os.path.join("plots", file_name)
+
+    os.makedirs(save_path, exist_ok=True)
 
     # Save plot
     plot_path = os.path.join(save_path, plot_file_name)
 
-    plt.savefig(plot_path, dpi=600)
+    plt.savefig(plot_path, dpi=dpi)
 
     plt.close()
 
 # Plots pseudoranges of satellites
-def plot_pseudoranges(gps_list: list[GPSSatellite], file_name):
+def plot_pseudoranges(data: PlotData, file_name, dpi=600):
     fig = plt.figure()
     
     ax = plt.axes()
@@ -46,17 +142,17 @@ def plot_pseudoranges(gps_list: list[GPSSatellite], file_name):
 
     plt.title("Pseudorange measurements")
     
-    plt.xlabel("Time of week (s)")
+    plt.xlabel("GPS time (s)")
     plt.ylabel("Pseudorange (km)")
 
-    for sat in gps_list:
-        plt.scatter(sat.times_of_pseudoranges, np.array(sat.pseudoranges) / 1000, s=1)
+    for (times, pseudoranges) in data.pseudoranges:
+        plt.scatter(times, np.array(pseudoranges) / 1000, s=1)
 
     plot_file_name = "pseudoranges.png"
-    save_plot(plot_file_name, file_name)
+    save_plot(plot_file_name, file_name, dpi)
 
 # Plots the satellite positions in the Earth Centered Inertial (ECI) reference frame
-def plot_satellite_positions_eci(gps_list: list[GPSSatellite], file_name):
+def plot_satellite_positions_eci(data: PlotData, file_name, dpi=600):
     fig = plt.figure()
     ax = fig.add_subplot(projection='3d')
     ax.ticklabel_format(style='plain')
@@ -67,16 +163,16 @@ def plot_satellite_positions_eci(gps_list: list[GPSSatellite], file_name):
     ax.set_ylabel('Y (km)')
     ax.set_zlabel('Z (km)')
 
-    for i in range(0, len(gps_list)):
-        eci = gps_list[i].position_eci() / 1000
+    for i in range(0, len(data.eci)):
+        eci = data.eci[i] / 1000
 
         ax.scatter(eci[:, 0], eci[:, 1], eci[:, 2], s = 1)
 
     plot_file_name = "satellite_positions_eci.png"
-    save_plot(plot_file_name, file_name)
+    save_plot(plot_file_name, file_name, dpi)
 
 # Plots the satellite positions in the Earth Centered Earth Fixed (ECEF) reference frame
-def plot_satellite_positions_ecef(gps_list: list[GPSSatellite], file_name):
+def plot_satellite_positions_ecef(data: PlotData, file_name, dpi=600):
     fig = plt.figure()
 
     ax = fig.add_subplot(projection='3d')
@@ -88,16 +184,16 @@ def plot_satellite_positions_ecef(gps_list: list[GPSSatellite], file_name):
     ax.set_ylabel('Y (km)')
     ax.set_zlabel('Z (km)')
 
-    for i in range(0, len(gps_list)):
-        eci = gps_list[i].position_ecef() / 1000
+    for i in range(0, len(data.ecef)):
+        eci = data.ecef[i] / 1000
 
         ax.scatter(eci[:, 0], eci[:, 1], eci[:, 2], s=1)
 
     plot_file_name = "satellite_positions_ecef.png"
-    save_plot(plot_file_name, file_name)
+    save_plot(plot_file_name, file_name, dpi)
 
 # Plots the users position in the ECEF frames
-def plot_position_ecef(gps_list: list[GPSSatellite], file_name):
+def plot_position_ecef(data: PlotData, file_name, dpi=600):
     fig = plt.figure()
     ax = fig.add_subplot(projection='3d')
 
@@ -109,19 +205,15 @@ def plot_position_ecef(gps_list: list[GPSSatellite], file_name):
     ax.set_ylabel('Y (km)')
     ax.set_zlabel('Z (km)')
 
-    estimated_positions = estimate_positions(gps_list)
+    estimated_positions = data.positions
 
     ax.scatter(estimated_positions[:, 0] / 1000, estimated_positions[:, 1] / 1000, estimated_positions[:, 2] / 1000)
 
     plot_file_name = "position_ecef.png"
-    save_plot(plot_file_name, file_name)
+    save_plot(plot_file_name, file_name, dpi)
 
 # Plots satellite orbits in the ECI frame
-def plot_orbits_eci(gps_list: list[GPSSatellite], file_name):
-    step_size = 0.01
-
-    mean_anomalies = np.arange(0, 2 * np.pi + step_size, step_size)
-
+def plot_orbits_eci(data: PlotData, file_name, dpi=600):
     fig = plt.figure()
     ax = fig.add_subplot(projection='3d')
     ax.ticklabel_format(style='plain')
@@ -132,40 +224,36 @@ def plot_orbits_eci(gps_list: list[GPSSatellite], file_name):
     ax.set_ylabel('Y (km)')
     ax.set_zlabel('Z (km)')
 
-    for i in range(0, len(gps_list)):
-        pqw = gps_list[i].perifocal_reference_coordinates(mean_anomalies) / 1000
-
-        eci = gps_list[i].earth_centered_initial(pqw)
-
+    for eci in data.orbits:
         ax.plot(np.copy(eci[:, 0]), np.copy(eci[:, 1]), np.copy(eci[:, 2]), linewidth=1)
 
     plot_file_name = "orbits_eci.png"
-    save_plot(plot_file_name, file_name)
+    save_plot(plot_file_name, file_name, dpi)
 
-# Plots the users spherical coordinates on a map
-def plot_positions_map(gps_list: list[GPSSatellite], file_name):
+# Plots the users WGS-84 geodetic coordinates on a map
+def plot_positions_map(data: PlotData, file_name, dpi=600):
     fig = plt.figure()
 
-    m = Basemap(projection='cyl', resolution='l', llcrnrlat=-90, urcrnrlat=90, llcrnrlon=-180, urcrnrlon=180)
+    m = get_basemap('l')
 
-    plt.title("User spherical coordinates on map")
+    plt.title("User geodetic coordinates on map")
 
     m.drawcoastlines(linewidth=0.25)
     m.drawcountries(linewidth=0.25)
     m.fillcontinents(color='green', lake_color='aqua')
     m.drawmapboundary(fill_color='aqua')
 
-    estimated_positions = estimate_positions(gps_list)
-    cords = spherical_geo(estimated_positions)
-    x, y = m(cords[:, 0], cords[:, 1])
+    estimated_positions = data.positions
+    geodetic = ecef_to_geodetic(estimated_positions)
+    x, y = m(np.degrees(geodetic[:, 1]), np.degrees(geodetic[:, 0]))
 
     m.scatter(x, y, marker='o', color='red', s=1)
 
     plot_file_name = "positions_map.png"
-    save_plot(plot_file_name, file_name)
+    save_plot(plot_file_name, file_name, dpi)
 
 # Plots user estimated user coordinates for each measurement in the ECEF frame
-def plot_coordinates_ecef(gps_list: list[GPSSatellite], file_name):
+def plot_coordinates_ecef(data: PlotData, file_name, dpi=600):
     fig = plt.figure()
 
     ax = fig.add_subplot()
@@ -173,12 +261,11 @@ def plot_coordinates_ecef(gps_list: list[GPSSatellite], file_name):
 
     plt.title("User ECEF coordinates")
 
-    ax.set_xlabel('Time of week (s)')
+    ax.set_xlabel('GPS time (s)')
     ax.set_ylabel("Coordinates (km)")
 
-    estimated_positions = estimate_positions(gps_list)
-
-    all_times = pseudorange_times(gps_list)
+    estimated_positions = data.positions
+    all_times = data.fix_times
 
     plt.scatter(x=all_times, y=estimated_positions[:, 0] / 1000, s=1)
     plt.scatter(x=all_times, y=estimated_positions[:, 1] / 1000, s=1)
@@ -187,41 +274,101 @@ def plot_coordinates_ecef(gps_list: list[GPSSatellite], file_name):
     ax.legend(('x', 'y', 'z'), loc='upper right')
 
     plot_file_name = "coordinates_ecef.png"
-    save_plot(plot_file_name, file_name)
+    save_plot(plot_file_name, file_name, dpi)
 
-# Tries to saves one of every plot for each rtcm file
-def plot_everything(gps_list: list[GPSSatellite], file_name):
-    try:
-        plot_pseudoranges(gps_list, file_name)
-    except:
-        print(f"Could not draw plot for file: \"{file_name}\"")
+# Plots the dilutions of precision of the fixes
+def plot_dop(data: PlotData, file_name, dpi=600):
+    fig = plt.figure()
 
-    try:
-        plot_satellite_positions_eci(gps_list, file_name)
-    except:
-        print(f"Could not draw plot for file: \"{file_name}\"")
+    ax = fig.add_subplot()
+    ax.ticklabel_format(style='plain')
 
-    try:
-        plot_satellite_positions_ecef(gps_list, file_name)
-    except:
-        print(f"Could not draw plot for file: \"{file_name}\"")
+    plt.title("Dilution of precision")
+
+    ax.set_xlabel('GPS time (s)')
+    ax.set_ylabel("DOP")
+
+    for column in range(0, len(DOP_COLUMNS)):
+        plt.scatter(x=data.fix_times, y=data.dops[:, column], s=1)
+
+    ax.legend([name.upper() for name in DOP_COLUMNS], loc='upper right')
+
+    plot_file_name = "dop.png"
+    save_plot(plot_file_name, file_name, dpi)
+
+# Every plot by name
+PLOTS = {
+    "pseudoranges": plot_pseudoranges,
+    "satellite_positions_eci": plot_satellite_positions_eci,
+    "satellite_positions_ecef": plot_satellite_positions_ecef,
+    "orbits_eci": plot_orbits_eci,
+    "coordinates_ecef": plot_coordinates_ecef,
+    "position_ecef": plot_position_ecef,
+    "positions_map": plot_positions_map,
+    "dop": plot_dop,
+}
+
+# PlotData fields needed by every plot
+PLOT_REQUIREMENTS = {
+    "pseudoranges": ("pseudoranges",),
+    "satellite_positions_eci": ("eci",),
+    "satellite_positions_ecef": ("ecef",),
+    "orbits_eci": ("orbits",),
+    "coordinates_ecef": ("fixes",),
+    "position_ecef": ("fixes",),
+    "positions_map": ("fixes",),
+    "dop": ("fixes",),
+}
+
+# Draws one plot and returns its name, rendering time and error traceback (None if it succeeded)
+def render_plot(name: str, data: PlotData, file_name, dpi=600) -> dict:
+    start = time.perf_counter()
+
+    error = None
+
+    # plots whose data could not be computed fail with the traceback of the data
+    for section in PLOT_REQUIREMENTS[name]:
+        if section in data.errors:
+            return {"plot": name, "seconds": 0.0, "error": f"Could not compute the \"{section}\" data of the plot:\n{data.errors[section]}"}
 
     try:
-        plot_orbits_eci(gps_list, file_name)
-    except:
-        print(f"Could not draw plot for file: \"{file_name}\"")
+        PLOTS[name](data, file_name, dpi)
+    except Exception:
+        error = traceback.format_exc()
 
-    try:
-        plot_coordinates_ecef(gps_list, file_name)
-    except:
-        print(f"Could not draw plot for file: \"{file_name}\"")
+        plt.close("all")
 
-    try:
-        plot_position_ecef(gps_list, file_name)
-    except:
-        print(f"Could not draw plot for file: \"{file_name}\"")
+    return {"plot": name, "seconds": time.perf_counter() - start, "error": error}
 
-    try:
-        plot_positions_map(gps_list, file_name)
-    except:
-        print(f"Could not draw plot for file: \"{file_name}\"")
+# Makes plot worker processes render without a display
+def init_plot_worker():
+    mpl.use("Agg")
+
+# Saves the selected plots (all by default) for a rtcm file, in parallel worker processes when workers > 1
+# returns the rendering time and error of every plot
+def plot_everything(gps_list: list[GPSSatellite], file_name, epoch_index: EpochIndex = None, plots: list[str] = None, dpi=600, workers=1, solve_options: dict = None) -> list[dict]:
+    if plots is None:
+        plots = list(PLOTS)
+
+    for name in plots:
+        if name not in PLOTS:
+            raise ValueError(f"Unknown plot \"{name}\", choose from: {', '.join(PLOTS)}")
+
+    if epoch_index is None:
+        epoch_index = EpochIndex(gps_list)
+
+    data = PlotData(gps_list, epoch_index, plots, solve_options)
+
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_plot_worker) as executor:
+            results = list(executor.map(render_plot, plots, [data] * len(plots), [file_name] * len(plots), [dpi] * len(plots)))
+    else:
+        results = [render_plot(name, data, file_name, dpi) for name in plots]
+
+    for result in results:
+        if result["error"] is None:
+            print(f"Drew plot \"{result['plot']}\" for file \"{file_name}\" in {result['seconds']:.2f} s")
+        else:
+            print(f"Could not draw plot \"{result['plot']}\" for file \"{file_name}\":\n{result['error']}")
+
+    return results
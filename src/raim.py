@@ -0,0 +1,69 @@
+from statistics import NormalDist
+
+import numpy as np
+
+# Standard deviation of the pseudorange errors assumed by the fault detection test (meters)
+# only holds for pseudoranges corrected for the satellite clocks, whose uncorrected errors reach tens of kilometers
+PSEUDORANGE_SIGMA = 10.0
+
+# Probability that the test detects a fault in an epoch without one
+FALSE_ALARM_PROBABILITY = 1e-3
+
+# Gauss-Newton iterations of the solutions without one satellite, which start from the solution with every satellite
+EXCLUSION_ITERATIONS = 3
+
+# Thresholds of the chi-square distribution with some degrees of freedom that are exceeded with a probability
+# Wilson-Hilferty approximation, the degrees of freedom must be at least one
+def chi_square_thresholds(degrees_of_freedom: np.ndarray, probability: float = FALSE_ALARM_PROBABILITY) -> np.ndarray:
+    degrees_of_freedom = np.asarray(degrees_of_freedom, dtype=float)
+
+    quantile = NormalDist().inv_cdf(1 - probability)
+
+    spread = 2 / (9 * degrees_of_freedom)
+
+    return degrees_of_freedom * (1 - spread + quantile * np.sqrt(spread)) ** 3
+
+# Sum of the squared post-fit residuals of every epoch in units of the pseudorange variance
+def chi_square_statistics(residuals: np.ndarray, mask: np.ndarray, sigma: float = PSEUDORANGE_SIGMA) -> np.ndarray:
+    return np.sum(np.where(mask, residuals, 0) ** 2, axis=1) / sigma ** 2
+
+# Number of redundant measurements of every epoch, satellites minus position and clock bias unknowns
+# observed is the (E, K) array of satellite systems observed in every epoch
+def degrees_of_freedom(mask: np.ndarray, observed: np.ndarray) -> np.ndarray:
+    return np.count_nonzero(mask, axis=1) - 3 - np.count_nonzero(observed, axis=1)
+
+# Epochs whose test statistic is above the threshold, epochs without redundant measurements can not be tested
+def detect_faults(statistics: np.ndarray, degrees: np.ndarray, probability: float = FALSE_ALARM_PROBABILITY) -> np.ndarray:
+    testable = degrees >= 1
+
+    faulty = np.zeros(len(statistics), dtype=bool)
+    faulty[testable] = statistics[testable] > chi_square_thresholds(degrees[testable], probability)
+
+    return faulty
+
+# Measurement masks with one satellite excluded, one for every satellite of some epochs
+# returns (epochs, excluded satellites, masks), the candidates of an epoch are next to each other
+def exclusion_candidates(mask: np.ndarray, epochs: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    (rows, satellites) = np.nonzero(mask[epochs])
+
+    masks = mask[epochs[rows]]
+    masks[np.arange(len(rows)), satellites] = False
+
+    return (epochs[rows], satellites, masks)
+
+# Chooses the candidate of every epoch with the smallest test statistic relative to its threshold
+# returns the epochs in ascending order and the index of the chosen candidate of each, -1 if no candidate passes the test
+def choose_exclusions(candidate_epochs: np.ndarray, statistics: np.ndarray, degrees: np.ndarray, probability: float = FALSE_ALARM_PROBABILITY) -> tuple[np.ndarray, np.ndarray]:
+    ratios = np.full(len(statistics), np.inf)
+
+    testable = degrees >= 1
+    ratios[testable] = statistics[testable] / chi_square_thresholds(degrees[testable], probability)
+
+    # candidates sorted by epoch and then by ratio, the first candidate of every epoch is the best
+    order = np.lexsort((ratios, candidate_epochs))
+
+    (epochs, first) = np.unique(candidate_epochs[order], return_index=True)
+
+    best = order[first]
+
+    return (epochs, np.where(ratios[best] <= 1, best, -1))
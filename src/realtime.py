@@ -0,0 +1,211 @@
+import argparse
+import asyncio
+import sys
+import time
+from typing import AsyncIterator
+
+from pyrtcm.rtcmhelpers import calc_crc24q
+
+from streaming import *
+
+# Fix of a single epoch solved in real time
+class RealtimeFix:
+    # Constructor
+    def __init__(self, time: float, position: np.ndarray, clock_bias: float, num_satellites: int, latency: float, dops: np.ndarray = None) -> None:
+        # Continuous GPS time (seconds since the GPS epoch)
+        self.time: float = time
+
+        # Estimated receiver ECEF position (meters)
+        self.position: np.ndarray = position
+
+        # Estimated receiver clock bias (meters)
+        self.clock_bias: float = clock_bias
+
+        # Number of satellites used in the fix
+        self.num_satellites: int = num_satellites
+
+        # Time from receiving the last message of the epoch to the solved fix (seconds)
+        self.latency: float = latency
+
+        # Dilutions of precision of the fix, columns are DOP_COLUMNS
+        self.dops: np.ndarray = dops
+
+# Reads the next valid RTCM3 frame from a stream, skipping bytes until a frame with a valid checksum is found
+async def read_frame(reader: asyncio.StreamReader) -> bytes:
+    while True:
+        preamble = await reader.readexactly(1)
+
+        if preamble[0] != 0xD3:
+            continue
+
+        header = await reader.readexactly(2)
+
+        # 6 reserved bits followed by the 10 bit message length
+        if header[0] & 0xFC != 0:
+            continue
+
+        length = (header[0] & 0x03) << 8 | header[1]
+
+        body = await reader.readexactly(length + 3)
+
+        raw_data = preamble + header + body
+
+        if calc_crc24q(raw_data) == 0:
+            return raw_data
+
+# Opens a TCP connection to a RTCM source such as a NTRIP caster or the replay server
+# the writer must be kept for as long as the reader is used, the connection closes with it
+async def open_tcp(host: str, port: int) -> tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+    return await asyncio.open_connection(host, port)
+
+# Opens a pipe, FIFO or serial device (or sys.stdin.buffer) as a RTCM source
+async def open_pipe(pipe) -> asyncio.StreamReader:
+    loop = asyncio.get_running_loop()
+
+    reader = asyncio.StreamReader()
+
+    await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), pipe)
+
+    return reader
+
+# Solves a fix for every epoch of a RTCM byte stream as soon as the epoch is complete
+class RealtimeEngine:
+    # Constructor
+    def __init__(self) -> None:
+        # Resolves the times of week of the messages to continuous GPS time
+        self.time_base: GPSTimeBase = GPSTimeBase()
+
+        # Groups messages into epochs and keeps the ephemeris of every satellite
+        self.assembler: EpochAssembler = EpochAssembler()
+
+        # Latest solved position, used for the satellite elevations of the next epoch (ECEF, meters)
+        self.position: np.ndarray = None
+
+        # Time when the latest observation message was received
+        self.received: float = None
+
+        # Statistics
+        self.epochs_solved: int = 0
+        self.epochs_skipped: int = 0
+        self.total_latency: float = 0
+        self.max_latency: float = 0
+
+    # Processes a raw RTCM message received at a given time (time.perf_counter) and returns the solved fixes
+    def process(self, raw_data: bytes, received: float) -> list[RealtimeFix]:
+        message = decode_message(raw_data)
+
+        if message is None:
+            return []
+
+        fixes = []
+
+        # messages received before the GPS week is known are held back by the time base
+        for message in self.time_base.add(message):
+            fixes.extend(self.process_message(message, received))
+
+        return fixes
+
+    # Processes a message with a resolved time and returns the solved fixes
+    def process_message(self, message: RTCM1002 | RTCMMSM | RTCM1019 | RTCM1020 | RTCM1045, received: float) -> list[RealtimeFix]:
+        previous_received = self.received
+
+        if isinstance(message, OBSERVATION_MESSAGES):
+            self.received = received
+
+        fixes = []
+
+        for epoch in self.assembler.add(message):
+            # epochs completed by a message of a newer epoch were last updated by the previous message
+            if epoch.time == message.gps_time:
+                epoch_received = received
+            else:
+                epoch_received = previous_received
+
+            fix = self.solve(epoch, epoch_received)
+
+            if fix is not None:
+                fixes.append(fix)
+
+        return fixes
+
+    # Solves the fix of one epoch
+    def solve(self, epoch: ObservationEpoch, received: float) -> RealtimeFix | None:
+        if len(epoch.svs) < 4:
+            self.epochs_skipped += 1
+
+            return None
+
+        fixes = compute_fixes(epochs_to_gps([epoch]), receiver_position=self.position)
+
+        # epochs with several satellite systems need one more satellite per system
+        if len(fixes.times) == 0:
+            self.epochs_skipped += 1
+
+            return None
+
+        latency = time.perf_counter() - received
+
+        self.position = fixes.positions[0]
+
+        self.epochs_solved += 1
+        self.total_latency += latency
+        self.max_latency = max(self.max_latency, latency)
+
+        return RealtimeFix(epoch.time, fixes.positions[0], fixes.clock_biases[0], len(epoch.svs), latency, fixes.dops[0])
+
+    # Yields fixes from a RTCM byte stream until the stream ends
+    async def run(self, reader: asyncio.StreamReader) -> AsyncIterator[RealtimeFix]:
+        while True:
+            try:
+                raw_data = await read_frame(reader)
+            except asyncio.IncompleteReadError:
+                break
+
+            for fix in self.process(raw_data, time.perf_counter()):
+                yield fix
+
+        # solve the held back messages and the last epoch
+        for message in self.time_base.flush():
+            for fix in self.process_message(message, self.received):
+                yield fix
+
+        epoch = self.assembler.flush()
+
+        if epoch is not None:
+            fix = self.solve(epoch, self.received)
+
+            if fix is not None:
+                yield fix
+
+    # Mean latency of the solved epochs (seconds)
+    def mean_latency(self) -> float:
+        if self.epochs_solved == 0:
+            return 0
+
+        return self.total_latency / self.epochs_solved
+
+async def main():
+    parser = argparse.ArgumentParser(description="Real-time GPS positioning from a RTCM3 byte stream, reads stdin by default")
+    parser.add_argument("--tcp", metavar="HOST:PORT", help="read RTCM data from a TCP server")
+    parser.add_argument("--pipe", metavar="PATH", help="read RTCM data from a pipe, FIFO or serial device")
+    args = parser.parse_args()
+
+    if args.tcp is not None:
+        (host, port) = args.tcp.rsplit(":", 1)
+        (reader, writer) = await open_tcp(host, int(port))
+    elif args.pipe is not None:
+        reader = await open_pipe(open(args.pipe, "rb"))
+    else:
+        reader = await open_pipe(sys.stdin.buffer)
+
+    engine = RealtimeEngine()
+
+    async for fix in engine.run(reader):
+        (x, y, z) = fix.position
+
+        print(f"{gps_week(fix.time)} {time_of_week(fix.time):.3f} x={x:.1f} y={y:.1f} z={z:.1f} satellites={fix.num_satellites} pdop={fix.dops[1]:.1f} latency={fix.latency * 1000:.2f} ms")
+
+    print(f"Solved {engine.epochs_solved} epochs, skipped {engine.epochs_skipped}, mean latency {engine.mean_latency() * 1000:.2f} ms, max latency {engine.max_latency * 1000:.2f} ms")
+
+if __name__ == "__main__":
+    asyncio.run(main())
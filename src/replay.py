@@ -0,0 +1,82 @@
+import argparse
+import asyncio
+from typing import Iterator
+
+from pyrtcm import RTCMReader
+
+from rtcm import *
+
+# Reads a RTCM file and yields the raw bytes of every message
+def read_frames(data_path: str) -> Iterator[bytes]:
+    with open(data_path, "rb") as stream:
+        rtr = RTCMReader(stream, parsed=0)
+
+        for (raw_data, parsed_data) in rtr:
+            yield raw_data
+
+# Returns the time of week of a raw RTCM 1002 or GPS/Galileo MSM message (seconds) or None for other messages
+def frame_time_of_week(raw_data: bytes) -> float | None:
+    # message header after the 3 byte frame header: DF002 (12 bits), DF003 (12 bits), DF004 (30 bits)
+    header = int.from_bytes(raw_data[3:10], "big")
+
+    # GPS and Galileo MSM messages have their time of week at the same place, GLONASS messages do not
+    number = header >> 44
+
+    if number != 1002 and not (MSM_SYSTEMS.get(number // 10) in ("G", "E") and number % 10 in MSM_TYPES):
+        return None
+
+    return (header >> 2 & (2 ** 30 - 1)) / 1000
+
+# Sends the messages of a RTCM file to a client, paced by the observation message times
+# a rate of 2 replays twice as fast as real time, a rate of 0 replays as fast as possible
+async def replay(data_path: str, writer: asyncio.StreamWriter, rate: float = 1.0):
+    loop = asyncio.get_running_loop()
+
+    start = loop.time()
+    first_time_of_week = None
+
+    try:
+        for raw_data in read_frames(data_path):
+            time_of_week = frame_time_of_week(raw_data)
+
+            if time_of_week is not None and rate > 0:
+                if first_time_of_week is None:
+                    first_time_of_week = time_of_week
+
+                delay = (time_of_week - first_time_of_week) / rate - (loop.time() - start)
+
+                if delay > 0:
+                    await asyncio.sleep(delay)
+
+            writer.write(raw_data)
+            await writer.drain()
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+# Starts a TCP server replaying a RTCM file to every client that connects
+# port 0 picks a free port, which can be read from server.sockets[0].getsockname()
+async def serve_replay(data_path: str, host: str = "127.0.0.1", port: int = 0, rate: float = 1.0) -> asyncio.Server:
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        await replay(data_path, writer, rate)
+
+    return await asyncio.start_server(handle, host, port)
+
+async def main():
+    parser = argparse.ArgumentParser(description="Replays a recorded RTCM file over TCP")
+    parser.add_argument("data_path", help="path to RTCM file")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on")
+    parser.add_argument("--port", type=int, default=2101, help="port to listen on")
+    parser.add_argument("--rate", type=float, default=1.0, help="replay speed relative to real time, 0 for as fast as possible")
+    args = parser.parse_args()
+
+    server = await serve_replay(args.data_path, args.host, args.port, args.rate)
+
+    print(f"Replaying \"{args.data_path}\" on {args.host}:{args.port}")
+
+    async with server:
+        await server.serve_forever()
+
+if __name__ == "__main__":
+    asyncio.run(main())
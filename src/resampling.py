@@ -0,0 +1,144 @@
+import numpy as np
+
+from satellites import *
+from instrumentation import *
+
+# Spacing of the common epoch grid (seconds)
+RESAMPLE_INTERVAL = 1.0
+
+# Longest time between two measurements of a satellite that are still in the same arc (seconds)
+# shorter gaps are filled on the grid, longer gaps split the measurements into separate arcs
+MAX_GAP = 5.0
+
+# Fastest change of a pseudorange within an arc (meters per second), faster changes split the arc
+# satellite range rates stay below 1 km/s, so this catches receiver clock jumps and millisecond ambiguity slips
+MAX_RANGE_RATE = 2000.0
+
+# Measurements in the sliding window of the polynomial smoother, a window of 1 only moves measurements onto the grid
+SMOOTHING_WINDOW = 9
+
+# Degree of the polynomial fitted to every window, the window needs at least one more measurement than the degree
+SMOOTHING_DEGREE = 2
+
+# Offset of the epoch grid from GPS time zero, the median of the measurement times modulo the interval
+# so jittered time tags land on the grid point they were meant for
+def grid_offset(times: np.ndarray, interval: float = RESAMPLE_INTERVAL) -> float:
+    if len(times) == 0:
+        return 0.0
+
+    return float(np.median(np.mod(times, interval)))
+
+# Splits the sorted measurements of a satellite into arcs at gaps and discontinuities
+# returns the arc number of every measurement, starting at zero
+def detect_arcs(times: np.ndarray, pseudoranges: np.ndarray, max_gap: float = MAX_GAP, max_range_rate: float = MAX_RANGE_RATE) -> np.ndarray:
+    steps = np.diff(times)
+
+    breaks = (steps > max_gap) | (np.abs(np.diff(pseudoranges)) > max_range_rate * steps)
+
+    return np.concatenate(([0], np.cumsum(breaks)))[0:len(times)]
+
+# Grid times covered by arcs and the measurement of the same arc nearest to each of them
+# an arc covers the grid points within half an interval of its measurements, returns (grid times, nearest measurements)
+def arc_grid(times: np.ndarray, starts: np.ndarray, ends: np.ndarray, offset: float, interval: float = RESAMPLE_INTERVAL) -> tuple[np.ndarray, np.ndarray]:
+    first = np.ceil((times[starts] - offset) / interval - 0.5).astype(int)
+    last = np.floor((times[ends] - offset) / interval + 0.5).astype(int)
+
+    counts = np.maximum(last - first + 1, 0)
+
+    # arc of every grid point and its position within the arc
+    arcs = np.repeat(np.arange(len(starts)), counts)
+    steps = np.arange(np.sum(counts)) - np.repeat(np.cumsum(counts) - counts, counts)
+
+    grid_times = offset + (first[arcs] + steps) * interval
+
+    after = np.clip(np.searchsorted(times, grid_times), starts[arcs], ends[arcs])
+    before = np.clip(after - 1, starts[arcs], ends[arcs])
+
+    nearest = np.where(np.abs(times[after] - grid_times) < np.abs(times[before] - grid_times), after, before)
+
+    return (grid_times, nearest)
+
+# Evaluates polynomials fitted by least squares to windows of measurements at some times
+# the window of each evaluation starts half a window before its nearest measurement and is kept inside the arc
+# times are relative to the nearest measurement so the fits stay well conditioned
+def fit_windows(times: np.ndarray, pseudoranges: np.ndarray, nearest: np.ndarray, starts: np.ndarray, ends: np.ndarray, evaluation_times: np.ndarray, window: int = SMOOTHING_WINDOW, degree: int = SMOOTHING_DEGREE) -> np.ndarray:
+    first = np.maximum(np.minimum(nearest - window // 2, ends - window + 1), starts)
+
+    indices = first[:, np.newaxis] + np.arange(window)
+
+    inside = indices <= ends[:, np.newaxis]
+
+    indices = np.minimum(indices, ends[:, np.newaxis])
+
+    time_differences = times[indices] - times[nearest][:, np.newaxis]
+    range_differences = np.where(inside, pseudoranges[indices] - pseudoranges[nearest][:, np.newaxis], 0)
+
+    powers = np.arange(degree + 1)
+
+    design_matrices = np.where(inside[:, :, np.newaxis], time_differences[:, :, np.newaxis] ** powers, 0)
+
+    transposed = np.swapaxes(design_matrices, 1, 2)
+
+    coefficients = np.linalg.solve(transposed @ design_matrices, transposed @ range_differences[:, :, np.newaxis])[:, :, 0]
+
+    return pseudoranges[nearest] + np.sum(coefficients * (evaluation_times - times[nearest])[:, np.newaxis] ** powers, axis=1)
+
+# Merges measurements of a satellite with the same time tag into one with their mean pseudorange
+# a satellite reported in both 1002 and MSM messages has two measurements per epoch, which would make the fits singular
+# returns the sorted (times, pseudoranges) with distinct times
+def merge_duplicate_times(times: np.ndarray, pseudoranges: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    (unique_times, inverse, counts) = np.unique(times, return_inverse=True, return_counts=True)
+
+    return (unique_times, np.bincount(inverse, weights=pseudoranges, minlength=len(unique_times)) / np.maximum(counts, 1))
+
+# Resamples the pseudoranges of one satellite onto the epoch grid in one pass over its arrays
+# arcs with fewer distinct measurement times than polynomial coefficients can not be fitted and are dropped
+# returns (pseudoranges, grid times) and counts arcs, filled epochs, merged and dropped measurements in INSTRUMENTATION
+def resample_measurements(times: np.ndarray, pseudoranges: np.ndarray, offset: float, interval: float = RESAMPLE_INTERVAL, window: int = SMOOTHING_WINDOW, degree: int = SMOOTHING_DEGREE, max_gap: float = MAX_GAP, max_range_rate: float = MAX_RANGE_RATE) -> tuple[np.ndarray, np.ndarray]:
+    measurements = len(times)
+
+    (times, pseudoranges) = merge_duplicate_times(times, pseudoranges)
+
+    INSTRUMENTATION.count("resampling_measurements_merged", measurements - len(times))
+
+    arcs = detect_arcs(times, pseudoranges, max_gap, max_range_rate)
+
+    starts = np.flatnonzero(np.diff(arcs, prepend=-1))
+    ends = np.append(starts[1:], len(times)) - 1
+
+    long_enough = ends - starts + 1 > degree
+
+    INSTRUMENTATION.count("resampling_arcs", int(np.count_nonzero(long_enough)))
+    INSTRUMENTATION.count("resampling_measurements_dropped", int(np.sum(ends[~long_enough] - starts[~long_enough] + 1)))
+
+    starts = starts[long_enough]
+    ends = ends[long_enough]
+
+    (grid_times, nearest) = arc_grid(times, starts, ends, offset, interval)
+
+    arc_indices = np.searchsorted(starts, nearest, side="right") - 1
+
+    INSTRUMENTATION.count("resampling_epochs_filled", int(len(grid_times) - len(np.unique(nearest))))
+
+    resampled = fit_windows(times, pseudoranges, nearest, starts[arc_indices], ends[arc_indices], grid_times, window, degree)
+
+    return (resampled, grid_times)
+
+# Resamples the pseudoranges of every satellite onto one epoch grid, smoothing them with sliding polynomial fits
+# measurements with slightly different time tags end up in the same epoch and short gaps are filled,
+# so fewer epochs have too few satellites; returns new satellites sharing the ephemerides of the old ones
+def resample_satellites(gps_list: list[GPSSatellite | GlonassSatellite], interval: float = RESAMPLE_INTERVAL, window: int = SMOOTHING_WINDOW, degree: int = SMOOTHING_DEGREE, max_gap: float = MAX_GAP, max_range_rate: float = MAX_RANGE_RATE) -> list[GPSSatellite | GlonassSatellite]:
+    if window < degree + 1:
+        raise ValueError(f"Smoothing window of {window} measurements is too short for a polynomial of degree {degree}")
+
+    offset = grid_offset(np.concatenate([gps.times_of_pseudoranges for gps in gps_list] + [np.zeros(0)]), interval)
+
+    resampled_list = []
+
+    for gps in gps_list:
+        (pseudoranges, times) = resample_measurements(gps.times_of_pseudoranges, gps.pseudoranges, offset, interval, window, degree, max_gap, max_range_rate)
+
+        if len(times) > 0:
+            resampled_list.append(gps.with_measurements(pseudoranges, times))
+
+    return resampled_list
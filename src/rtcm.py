@@ -1,7 +1,80 @@
 import math
+
+import numpy as np
+from pyrtcm import RTCMReader
 from pyrtcm.rtcmmessage import RTCMMessage
 
+from constants import *
+from instrumentation import *
+
+# Satellite system of the MSM message numbers 107x, 108x and 109x
+MSM_SYSTEMS = {107: "G", 108: "R", 109: "E"}
+
+# MSM types whose pseudoranges are decoded
+MSM_TYPES = (4, 5, 7)
+
+# MSM signal IDs (DF395, starting at 1) of the L1/E1/G1 signals of every system, the only signals whose pseudoranges are used
+# GPS L1 C/A, P, Z-tracking and L1C, GLONASS G1 C/A and P, Galileo E1 A, B, C, B+C and A+B+C
+MSM_L1_SIGNALS = {"G": (2, 3, 4, 30, 31, 32), "R": (2, 3), "E": (2, 3, 4, 5, 6)}
+
+# Pseudorange ambiguity step of RTCM 1002 messages (meters)
+AMBIGUITY_STEP = 299792.458
+
+# Cached data field names of the satellites in a RTCM 1002 message, DF006 allows at most 31 satellites
+DF009_NAMES = tuple(f"DF009_{i:02d}" for i in range(1, 32))
+DF011_NAMES = tuple(f"DF011_{i:02d}" for i in range(1, 32))
+DF014_NAMES = tuple(f"DF014_{i:02d}" for i in range(1, 32))
+
+# Returns the message number of a raw RTCM3 message
+def message_type(raw_data: bytes) -> int:
+    # DF002 is the first 12 bits after the 3 byte frame header
+    return raw_data[3] << 4 | raw_data[4] >> 4
+
+# Returns the payload of a raw RTCM3 message without the frame header and CRC
+def message_payload(raw_data: bytes) -> bytes:
+    length = (raw_data[1] & 0x03) << 8 | raw_data[2]
+
+    return raw_data[3:3 + length]
+
+# Converts a GLONASS day of week and time of day (seconds, Moscow time) to GPS time of week (seconds)
+def glonass_time_of_week(day: int, time_of_day: float) -> float:
+    return (day * 86400 + time_of_day - GLONASS_UTC_OFFSET + GPS_UTC_LEAP_SECONDS) % SECONDS_PER_WEEK
+
+# Reads unsigned and two's complement signed integers from the bits of a message payload
+class BitReader:
+    # Constructor
+    def __init__(self, payload: bytes) -> None:
+        # Payload as one integer
+        self.value: int = int.from_bytes(payload, "big")
+
+        # Number of bits in the payload
+        self.bits: int = len(payload) * 8
+
+        # Number of bits read so far
+        self.position: int = 0
+
+    # Reads the next integer of some width
+    def read(self, width: int, signed: bool = False) -> int:
+        value = self.value >> (self.bits - self.position - width) & ((1 << width) - 1)
+
+        self.position += width
+
+        if signed and value >> (width - 1):
+            value -= 1 << width
+
+        return value
+
+    # Skips some bits
+    def skip(self, width: int):
+        self.position += width
+
 class RTCM1002:
+    # Satellite system of the message
+    system: str = "G"
+
+    # Continuous GPS time (seconds since the GPS epoch), set by a GPSTimeBase from the time of week
+    gps_time: float = None
+
     # Constructs a class for a RTCM1002 message
     def __init__(self, message: RTCMMessage) -> None:
         # number of satellites in message
@@ -10,61 +83,56 @@ class RTCM1002:
         # Time in GPS week (seconds)
         self.time_of_week: float = message.DF004 / 1000
 
-        # list of satellite identification numbers
-        self.svs = []
-
-        # list of integer ambiguities (dimensionless)
-        self.ambiguities = []
-
-        # list of pseudorange reminders (meters)
-        self.reminders = []
-
-        # list of calculated pseudoranges (meters)
-        self.pseudoranges = []
-
-        # get satellite identification numbers
-        for i in range(1, self.num_satellites + 1):
-            # generate sv DF attribute
-            if i < 10:
-                attribute: str = f"DF009_0{i}"
-            elif i >= 10:
-                attribute: str = f"DF009_{i}"
-
-            # get sv and append to list
-            sv = message.__getattribute__(attribute)
-            self.svs.append(sv)
-
-        # get pseudorange reminders
-        for i in range(1, self.num_satellites + 1):
-            # generate pseudorange reminder DF attribute
-            if i < 10:
-                attribute: str = f"DF011_0{i}"
-            elif i >= 10:
-                attribute: str = f"DF011_{i}"
-
-            # get pseudorange reminder and append to list
-            reminder = message.__getattribute__(attribute)
-            self.reminders.append(reminder)
-
-        # get integer ambiguities
-        for i in range(1, self.num_satellites + 1):
-            # generate integer ambiguity DF attribute
-            if i < 10:
-                attribute: str = f"DF014_0{i}"
-            elif i >= 10:
-                attribute: str = f"DF014_{i}"
-
-            # get integer ambiguity and append to list
-            ambiguity = message.__getattribute__(attribute)
-            self.ambiguities.append(ambiguity)
-
-        # calculate pseudoranges from ambiguities and reminders
-        for i in range(0, self.num_satellites + 0):
-            # calculate pseudorange for satellite
-            pseudorange = self.ambiguities[i] * 299792.458 + self.reminders[i]
-
-            # add pseudorange to list
-            self.pseudoranges.append(pseudorange)
+        # More messages follow for the same epoch
+        self.synchronous: bool = message.DF005 == 1
+
+        # satellite identification numbers
+        self.svs: np.ndarray = np.array([getattr(message, name) for name in DF009_NAMES[:self.num_satellites]], dtype=int)
+
+        # pseudorange reminders (meters)
+        self.reminders: np.ndarray = np.array([getattr(message, name) for name in DF011_NAMES[:self.num_satellites]], dtype=float)
+
+        # integer ambiguities (dimensionless)
+        self.ambiguities: np.ndarray = np.array([getattr(message, name) for name in DF014_NAMES[:self.num_satellites]], dtype=int)
+
+        # calculated pseudoranges (meters)
+        self.pseudoranges: np.ndarray = self.ambiguities * AMBIGUITY_STEP + self.reminders
+
+    # Decodes a raw RTCM 1002 message directly from its bits without parsing it with pyrtcm
+    @classmethod
+    def from_raw(cls, raw_data: bytes) -> "RTCM1002":
+        self = cls.__new__(cls)
+
+        length = (raw_data[1] & 0x03) << 8 | raw_data[2]
+
+        payload = int.from_bytes(raw_data[3:3 + length], "big")
+        bits = length * 8
+
+        # header: DF002 (12), DF003 (12), DF004 (30), DF005 (1), DF006 (5), DF007 (1), DF008 (3)
+        header = payload >> (bits - 64)
+
+        self.num_satellites = header >> 4 & 0x1F
+        self.time_of_week = (header >> 10 & 0x3FFFFFFF) / 1000
+        self.synchronous = header >> 9 & 1 == 1
+
+        svs = []
+        reminders = []
+        ambiguities = []
+
+        # 74 bits per satellite: DF009 (6), DF010 (1), DF011 (24), DF012 (20), DF013 (7), DF014 (8), DF015 (8)
+        for i in range(0, self.num_satellites):
+            satellite = payload >> (bits - 64 - 74 * (i + 1)) & (2 ** 74 - 1)
+
+            svs.append(satellite >> 68)
+            reminders.append(satellite >> 43 & 0xFFFFFF)
+            ambiguities.append(satellite >> 8 & 0xFF)
+
+        self.svs = np.array(svs, dtype=int)
+        self.reminders = np.array(reminders) * 0.02
+        self.ambiguities = np.array(ambiguities, dtype=int)
+        self.pseudoranges = self.ambiguities * AMBIGUITY_STEP + self.reminders
+
+        return self
 
     # print values of message
     def print_values(self):
@@ -75,6 +143,113 @@ class RTCM1002:
         print(f"prs: {self.pseudoranges}")
         print(f"tow: {self.time_of_week}")
 
+# Pseudoranges of a multiple signal message (MSM4, MSM5 or MSM7) of any satellite system
+# one pseudorange is kept per satellite, from the first valid L1/E1/G1 signal in the signal mask (MSM_L1_SIGNALS)
+# satellites without a valid L1/E1/G1 signal are left out and counted in INSTRUMENTATION
+class RTCMMSM:
+    # Continuous GPS time (seconds since the GPS epoch), set by a GPSTimeBase from the time of week
+    gps_time: float = None
+
+    # Decodes a raw MSM message directly from its bits
+    @classmethod
+    def from_raw(cls, raw_data: bytes) -> "RTCMMSM":
+        self = cls.__new__(cls)
+
+        # Message number
+        self.message_number: int = message_type(raw_data)
+
+        # Satellite system of the message
+        self.system: str = MSM_SYSTEMS[self.message_number // 10]
+
+        # MSM type
+        self.msm: int = self.message_number % 10
+
+        reader = BitReader(message_payload(raw_data))
+
+        # DF002, DF003
+        reader.skip(24)
+
+        # Time in GPS week (seconds), None if a GLONASS message does not know its day of week
+        if self.system == "R":
+            # DF416, DF034
+            day = reader.read(3)
+            time_of_day = reader.read(27) / 1000
+
+            self.time_of_week: float = glonass_time_of_week(day, time_of_day) if day < 7 else None
+        else:
+            # DF004 and DF248, Galileo system time has the same time of week as GPS time
+            self.time_of_week: float = reader.read(30) / 1000
+
+        # More messages follow for the same epoch (DF393)
+        self.synchronous: bool = reader.read(1) == 1
+
+        # DF409, DF001, DF411, DF412, DF417, DF418
+        reader.skip(3 + 7 + 2 + 2 + 1 + 3)
+
+        # DF394 and DF395, the first bit is satellite or signal 1
+        satellite_mask = reader.read(64)
+        signal_mask = reader.read(32)
+
+        svs = [i + 1 for i in range(0, 64) if satellite_mask >> (63 - i) & 1]
+        signals = [j + 1 for j in range(0, 32) if signal_mask >> (31 - j) & 1]
+        num_signals = len(signals)
+
+        l1_signals = [signal in MSM_L1_SIGNALS[self.system] for signal in signals]
+
+        # DF396
+        cell_mask = reader.read(len(svs) * num_signals)
+
+        extended = self.msm in (5, 7)
+
+        # satellite data: DF397 (8), extended satellite information (4) in MSM5 and MSM7, DF398 (10)
+        rough_milliseconds = [reader.read(8) for _ in svs]
+
+        if extended:
+            reader.skip(4 * len(svs))
+
+        rough_fractions = [reader.read(10) for _ in svs]
+
+        # DF399 (14) in MSM5 and MSM7
+        if extended:
+            reader.skip(14 * len(svs))
+
+        # signal data starts with DF400 (15 bits, 2^-24 ms) or DF405 in MSM7 (20 bits, 2^-29 ms)
+        (fine_width, fine_scale) = (20, 2 ** -29) if self.msm == 7 else (15, 2 ** -24)
+
+        pseudoranges = {}
+        cell = 0
+
+        for i in range(0, len(svs)):
+            for j in range(0, num_signals):
+                if not cell_mask >> (len(svs) * num_signals - 1 - (i * num_signals + j)) & 1:
+                    continue
+
+                fine = reader.read(fine_width, signed=True)
+
+                cell += 1
+
+                # the smallest value and a rough range of 255 ms mark invalid measurements
+                # other frequencies than L1 are skipped, their inter-frequency biases would mix into the pseudoranges of a satellite
+                if not l1_signals[j] or fine == -2 ** (fine_width - 1) or rough_milliseconds[i] == 255 or svs[i] in pseudoranges:
+                    continue
+
+                milliseconds = rough_milliseconds[i] + rough_fractions[i] / 1024 + fine * fine_scale
+
+                pseudoranges[svs[i]] = milliseconds * SPEED_OF_LIGHT / 1000
+
+        INSTRUMENTATION.count("msm_satellites_without_l1", len(svs) - len(pseudoranges))
+
+        # number of satellites with a pseudorange
+        self.num_satellites: int = len(pseudoranges)
+
+        # satellite identification numbers
+        self.svs: np.ndarray = np.array(list(pseudoranges.keys()), dtype=int)
+
+        # pseudoranges (meters)
+        self.pseudoranges: np.ndarray = np.array(list(pseudoranges.values()), dtype=float)
+
+        return self
+
 class RTCM1006:
     def __init__(self, message: RTCMMessage) -> None:
         pass
@@ -84,13 +259,19 @@ class RTCM1013:
         pass
 
 class RTCM1019:
+    # Satellite system of the message
+    system: str = "G"
+
+    # Reference time of ephemeris in continuous GPS time (seconds since the GPS epoch), set by a GPSTimeBase
+    gps_time_of_ephemeris: float = None
+
     # Constructs a class for a RTCM1019 message
     def __init__(self, message: RTCMMessage) -> None:
         # Satellite identification number
         self.sv: int = message.DF009
 
-        # Eccentricity (dimensionless)
-        self.eccentricity: float = message.DF090 * 2 ** -33
+        # Eccentricity (dimensionless), pyrtcm already applies the 2^-33 scale factor
+        self.eccentricity: float = message.DF090
 
         # Inclination (radians)
         self.inclination: float = message.DF097 * math.pi
@@ -116,6 +297,30 @@ class RTCM1019:
         # Time since last GPS epoch (seconds)
         self.time_since_epoch: float = self.week_number * 604800 + self.time_of_week
 
+        # Reference time of ephemeris in GPS week (seconds)
+        self.time_of_ephemeris: float = message.DF093
+
+        # Mean motion difference (radians / s)
+        self.mean_motion_correction: float = message.DF087 * math.pi
+
+        # Rate of right ascension (radians / s)
+        self.rate_of_right_ascension: float = message.DF100 * math.pi
+
+        # Rate of inclination (radians / s)
+        self.rate_of_inclination: float = message.DF079 * math.pi
+
+        # Harmonic correction amplitudes of the orbit radius (meters)
+        self.radius_sine_correction: float = message.DF086
+        self.radius_cosine_correction: float = message.DF098
+
+        # Harmonic correction amplitudes of the argument of latitude (radians)
+        self.latitude_sine_correction: float = message.DF091
+        self.latitude_cosine_correction: float = message.DF089
+
+        # Harmonic correction amplitudes of the inclination (radians)
+        self.inclination_sine_correction: float = message.DF096
+        self.inclination_cosine_correction: float = message.DF094
+
     # prints values of the message for debugging purposes
     def print_values(self) -> None:
         print(f"sv: {self.sv}")
@@ -126,4 +331,140 @@ class RTCM1019:
         print(f"OMEGA: {self.right_ascension_of_ascending_node}")
         print(f"omega: {self.argument_of_periapsis}")
         print(f"week: {self.week_number}")
-        print(f"toe: {self.time_of_week}")
+        print(f"toc: {self.time_of_week}")
+        print(f"toe: {self.time_of_ephemeris}")
+
+# GLONASS ephemeris with the satellite state vector at the reference time
+class RTCM1020:
+    # Satellite system of the message
+    system: str = "R"
+
+    # Reference time of ephemeris in continuous GPS time (seconds since the GPS epoch), set by a GPSTimeBase
+    gps_time_of_ephemeris: float = None
+
+    # Constructs a class for a RTCM1020 message
+    def __init__(self, message: RTCMMessage) -> None:
+        # Satellite slot number
+        self.sv: int = message.DF038
+
+        # Frequency channel number
+        self.frequency_channel: int = message.DF040 - 7
+
+        # Reference time tb converted from 15 minute intervals of the Moscow day to seconds of the GPS day
+        self.time_of_ephemeris: float = (message.DF110 * 900 - GLONASS_UTC_OFFSET + GPS_UTC_LEAP_SECONDS) % 86400
+
+        # PZ-90 position (meters), velocity (meters / s) and lunisolar acceleration (meters / s^2) at the reference time
+        self.position: tuple[float, float, float] = (message.DF112 * 1000, message.DF115 * 1000, message.DF118 * 1000)
+        self.velocity: tuple[float, float, float] = (message.DF111 * 1000, message.DF114 * 1000, message.DF117 * 1000)
+        self.acceleration: tuple[float, float, float] = (message.DF113 * 1000, message.DF116 * 1000, message.DF119 * 1000)
+
+        # Satellite clock bias (seconds) and relative frequency bias (dimensionless)
+        self.clock_bias: float = message.DF124 * 2 ** -30
+        self.relative_frequency_bias: float = message.DF121 * 2 ** -40
+
+    # prints values of the message for debugging purposes
+    def print_values(self) -> None:
+        print(f"sv: {self.sv}")
+        print(f"channel: {self.frequency_channel}")
+        print(f"tb: {self.time_of_ephemeris}")
+        print(f"position: {self.position}")
+        print(f"velocity: {self.velocity}")
+        print(f"acceleration: {self.acceleration}")
+
+# Galileo F/NAV ephemeris, the attributes are named like the RTCM1019 attributes
+class RTCM1045:
+    # Satellite system of the message
+    system: str = "E"
+
+    # Reference time of ephemeris in continuous GPS time (seconds since the GPS epoch), set by a GPSTimeBase
+    gps_time_of_ephemeris: float = None
+
+    # Constructs a class for a RTCM1045 or RTCM1046 message
+    def __init__(self, message: RTCMMessage) -> None:
+        # Satellite identification number
+        self.sv: int = message.DF252
+
+        # Eccentricity (dimensionless)
+        self.eccentricity: float = message.DF301
+
+        # Inclination (radians)
+        self.inclination: float = message.DF308 * math.pi
+
+        # Mean anomaly (radians)
+        self.mean_anomaly: float = message.DF299 * math.pi
+
+        # Semi major axis (meters)
+        self.semi_major_axis: float = message.DF303 ** 2
+
+        # Right ascension of ascending node (radians)
+        self.right_ascension_of_ascending_node: float = message.DF306 * math.pi
+
+        # Argument of periapsis (radians)
+        self.argument_of_periapsis: float = message.DF310 * math.pi
+
+        # Galileo week number, which started 1024 weeks after the GPS week number
+        self.week_number: float = message.DF289
+
+        # Time of week (seconds)
+        self.time_of_week: float = message.DF293
+
+        # Time since last GPS epoch (seconds)
+        self.time_since_epoch: float = (self.week_number + 1024) * 604800 + self.time_of_week
+
+        # Reference time of ephemeris in week (seconds)
+        self.time_of_ephemeris: float = message.DF304
+
+        # Mean motion difference (radians / s)
+        self.mean_motion_correction: float = message.DF298 * math.pi
+
+        # Rate of right ascension (radians / s)
+        self.rate_of_right_ascension: float = message.DF311 * math.pi
+
+        # Rate of inclination (radians / s)
+        self.rate_of_inclination: float = message.DF292 * math.pi
+
+        # Harmonic correction amplitudes of the orbit radius (meters)
+        self.radius_sine_correction: float = message.DF297
+        self.radius_cosine_correction: float = message.DF309
+
+        # Harmonic correction amplitudes of the argument of latitude (radians)
+        self.latitude_sine_correction: float = message.DF302
+        self.latitude_cosine_correction: float = message.DF300
+
+        # Harmonic correction amplitudes of the inclination (radians)
+        self.inclination_sine_correction: float = message.DF307
+        self.inclination_cosine_correction: float = message.DF305
+
+# Galileo I/NAV ephemeris, with the same orbit parameters as the F/NAV ephemeris
+class RTCM1046(RTCM1045):
+    pass
+
+# Observation and ephemeris message classes of all satellite systems
+OBSERVATION_MESSAGES = (RTCM1002, RTCMMSM)
+EPHEMERIS_MESSAGES = (RTCM1019, RTCM1020, RTCM1045)
+
+# Decodes a raw RTCM3 message into an observation or ephemeris object, returns None for other messages
+# 1002 and MSM messages take the fast path straight from the raw bits
+def decode_message(raw_data: bytes) -> RTCM1002 | RTCMMSM | RTCM1019 | RTCM1020 | RTCM1045 | None:
+    identity = message_type(raw_data)
+
+    if identity == 1002:
+        return RTCM1002.from_raw(raw_data)
+    elif identity == 1019:
+        return RTCM1019(RTCMReader.parse(raw_data))
+    elif identity == 1020:
+        return RTCM1020(RTCMReader.parse(raw_data))
+    elif identity == 1045:
+        return RTCM1045(RTCMReader.parse(raw_data))
+    elif identity == 1046:
+        return RTCM1046(RTCMReader.parse(raw_data))
+    elif identity // 10 in MSM_SYSTEMS and identity % 10 in MSM_TYPES:
+        message = RTCMMSM.from_raw(raw_data)
+
+        # GLONASS messages without a day of week can not be placed in time
+        if message.time_of_week is None:
+            return None
+
+        return message
+
+    return None
@@ -1,57 +1,118 @@
+import copy
+
 import numpy as np
 from constants import *
+from cache import *
+from frames import *
+from orbits import *
+
+# Cache of satellite positions keyed by satellite, ephemerides and measurement times
+POSITION_CACHE = LRUCache(256)
 
 # Class containing information collected from a specific GPS satellite
+# Galileo satellites have the same Keplerian ephemerides and use this class with system "E"
 class GPSSatellite:
     # Constructor
-    def __init__(self, sv, pseudoranges, times_of_pseudoranges, eccentricities, inclinations, mean_anomalies, semi_major_axes, right_ascension_of_ascending_node, arguments_of_periapsis, times_of_ephemeris) -> None:
+    def __init__(self, sv, pseudoranges, times_of_pseudoranges, eccentricities, inclinations, mean_anomalies, semi_major_axes, right_ascension_of_ascending_node, arguments_of_periapsis, times_of_ephemeris, perturbations=None, orbit_mode="series", system="G") -> None:
+        # Satellite system, one of SYSTEMS
+        self.system: str = system
+
         # Identification number of satellite
         self.sv: int = sv
 
         # Distances to receiver (meters)
-        self.pseudoranges: np.ndarray = np.array(pseudoranges)
+        self.pseudoranges: np.ndarray = np.asarray(pseudoranges)
 
-        # Time of pseudorange measurements
-        self.times_of_pseudoranges: np.ndarray = np.array(times_of_pseudoranges)
+        # Continuous GPS time of pseudorange measurements (seconds)
+        self.times_of_pseudoranges: np.ndarray = np.asarray(times_of_pseudoranges)
 
         # Eccentricity of satellite orbit
-        self.eccentricities: np.ndarray = np.array(eccentricities)
+        self.eccentricities: np.ndarray = np.asarray(eccentricities)
 
         # Inclination
-        self.inclinations: np.ndarray = np.array(inclinations)
+        self.inclinations: np.ndarray = np.asarray(inclinations)
 
         # Mean anomaly
-        self.mean_anomalies: np.ndarray = np.array(mean_anomalies)
+        self.mean_anomalies: np.ndarray = np.asarray(mean_anomalies)
 
         # Semi major axis
-        self.semi_major_axes: np.ndarray = np.array(semi_major_axes)
+        self.semi_major_axes: np.ndarray = np.asarray(semi_major_axes)
 
         # Right ascension of ascending nodes
-        self.right_ascension_of_ascending_node: np.ndarray = np.array(right_ascension_of_ascending_node)
+        self.right_ascension_of_ascending_node: np.ndarray = np.asarray(right_ascension_of_ascending_node)
 
         # Argument of peripsis
-        self.arguments_of_periapsis: np.ndarray = np.array(arguments_of_periapsis)
+        self.arguments_of_periapsis: np.ndarray = np.asarray(arguments_of_periapsis)
+
+        # Reference time of ephemeris in continuous GPS time (seconds)
+        self.times_of_ephemeris: np.ndarray = np.asarray(times_of_ephemeris)
+
+        # Structured array with the PERTURBATION_FIELDS of every ephemeris, zero if not given
+        if perturbations is None:
+            perturbations = np.zeros(len(self.times_of_ephemeris), dtype=[(name, np.float64) for name in PERTURBATION_FIELDS])
+
+        self.perturbations: np.ndarray = perturbations
+
+        # Orbit propagation mode, one of ORBIT_MODES
+        self.orbit_mode: str = orbit_mode
+
+    # Wraps per satellite observation and ephemeris rows of an ObservationStore without copying them
+    @classmethod
+    def from_views(cls, sv: int, observations: np.ndarray, ephemerides: np.ndarray, system: str = "G") -> "GPSSatellite":
+        return cls(sv, observations["pseudorange"], observations["time"], ephemerides["eccentricity"], ephemerides["inclination"], ephemerides["mean_anomaly"], ephemerides["semi_major_axis"], ephemerides["right_ascension_of_ascending_node"], ephemerides["argument_of_periapsis"], ephemerides["time_of_ephemeris"], ephemerides[list(PERTURBATION_FIELDS)], system=system)
+
+    # Copy of the satellite with other pseudorange measurements, sharing the ephemerides
+    def with_measurements(self, pseudoranges: np.ndarray, times_of_pseudoranges: np.ndarray) -> "GPSSatellite":
+        satellite = copy.copy(self)
+
+        satellite.pseudoranges = np.asarray(pseudoranges)
+        satellite.times_of_pseudoranges = np.asarray(times_of_pseudoranges)
+
+        return satellite
+
+    # Returns the index of the ephemeris whose time of ephemeris is nearest to each time
+    def ephemeris_indices(self, times: np.ndarray) -> np.ndarray:
+        times = np.asarray(times)
+
+        if len(self.times_of_ephemeris) == 1:
+            return np.zeros(times.shape, dtype=int)
+
+        # ephemerides are stored in the order they were received
+        order = np.argsort(self.times_of_ephemeris, kind="stable")
+        sorted_times = self.times_of_ephemeris[order]
+
+        # candidates before and after every time
+        after = np.clip(np.searchsorted(sorted_times, times), 1, len(sorted_times) - 1)
+        before = after - 1
+
+        nearest = np.where(sorted_times[after] - times < times - sorted_times[before], after, before)
+
+        return order[nearest]
 
-        # Time of ephemeris measurement
-        self.times_of_ephemeris: np.ndarray = np.array(times_of_ephemeris)
+    # Calculates true anomaly of satellite, using the ephemerides given by indices (the first ephemeris by default)
+    def true_anomaly(self, time_differences: np.ndarray, indices: np.ndarray = 0) -> np.ndarray:
+        eccentricities = self.eccentricities[indices]
 
-    # Calculates true anomaly of satellite
-    def true_anomaly(self, time_differences: np.ndarray) -> np.ndarray:
         # calculate mean motion, n (degrees / s)
-        mean_motion = np.sqrt(MU / self.semi_major_axes[0] ** 3)
+        mean_motion = np.sqrt(MU / self.semi_major_axes[indices] ** 3)
 
         # calculate new mean anomaly after some time difference
-        mean_anomaly = self.mean_anomalies[0] + mean_motion * time_differences
+        mean_anomaly = self.mean_anomalies[indices] + mean_motion * time_differences
 
-        # true anomaly approximation (https://en.wikipedia.org/wiki/True_anomaly#From_the_eccentric_anomaly)
-        true_anomaly = mean_anomaly + (2 * self.eccentricities[0] - 1/4 * self.eccentricities[0] ** 3) * np.sin(mean_anomaly) + 5/4 * self.eccentricities[0] ** 2 * np.sin(2 * mean_anomaly) + 13/12 * self.eccentricities[0] * np.sin(3 * mean_anomaly)
+        if self.orbit_mode == "series":
+            # true anomaly approximation (https://en.wikipedia.org/wiki/True_anomaly#From_the_eccentric_anomaly)
+            true_anomaly = true_anomaly_series(mean_anomaly, eccentricities)
+        else:
+            true_anomaly = true_anomaly_kepler(mean_anomaly, eccentricities)
 
         return true_anomaly
 
     # Calculates satellite position coordinates in the perifocal reference system
-    def perifocal_reference_coordinates(self, true_anomalies: np.ndarray) -> np.ndarray:
+    def perifocal_reference_coordinates(self, true_anomalies: np.ndarray, indices: np.ndarray = 0) -> np.ndarray:
+        eccentricities = self.eccentricities[indices]
+
         # distance from focal point to satellite
-        radius = (self.semi_major_axes[0] * (1 - self.eccentricities[0] ** 2)) / (1 + self.eccentricities[0] * np.cos(true_anomalies))
+        radius = (self.semi_major_axes[indices] * (1 - eccentricities ** 2)) / (1 + eccentricities * np.cos(true_anomalies))
 
         # calculate coordinates on ellipse
         p = radius * np.cos(true_anomalies)
@@ -63,80 +124,189 @@ class GPSSatellite:
 
         return pqw
 
+    # Rotation matrix from perifocal to earth centered inertial coordinates of every ephemeris, shape (K, 3, 3)
+    def perifocal_rotations(self) -> np.ndarray:
+        return perifocal_to_eci_matrices(self.arguments_of_periapsis, self.inclinations, self.right_ascension_of_ascending_node)
+
     # Converts the perifocal reference coordinates to earth centered inertial coordinates
-    def earth_centered_initial(self, pqw: np.ndarray) -> np.ndarray:
-        # first rotation matrix around z-axis
-        Rz = np.matrix([
-            [np.cos(-self.arguments_of_periapsis[0]), -np.sin(-self.arguments_of_periapsis[0]), 0],
-            [np.sin(-self.arguments_of_periapsis[0]), np.cos(-self.arguments_of_periapsis[0]), 0],
-            [0, 0, 1]
-        ])
-
-        # perform first rotation
-        pqw_r1 = np.matmul(pqw, Rz)
-
-        # second rotation matrix around x-axis
-        Rx = np.matrix([
-            [1, 0, 0],
-            [0, np.cos(-self.inclinations[0]), -np.sin(-self.inclinations[0])],
-            [0, np.sin(-self.inclinations[0]), np.cos(-self.inclinations[0])]
-        ])
-
-        # perform second rotation
-        pqw_r2 = np.matmul(pqw_r1, Rx)
-
-        # third rotation matrix around z-axis
-        Rz = np.matrix([
-            [np.cos(-self.right_ascension_of_ascending_node[0]), -np.sin(-self.right_ascension_of_ascending_node[0]), 0],
-            [np.sin(-self.right_ascension_of_ascending_node[0]), np.cos(-self.right_ascension_of_ascending_node[0]), 0],
-            [0, 0, 1]
-        ])
-
-        # perform third rotation
-        pqw_r3 = np.matmul(pqw_r2, Rz)
-
-        return pqw_r3
+    # using the ephemerides given by indices (the first ephemeris by default)
+    def earth_centered_initial(self, pqw: np.ndarray, indices: np.ndarray = 0) -> np.ndarray:
+        rotations = self.perifocal_rotations()
+
+        return rotate_rows(pqw, rotations, indices)
 
     # Converts the centered inertial coordinates to earth centered earth fixed coordinates
     def earth_centered_earth_fixed(self, eci: np.ndarray) -> np.ndarray:
-        ecefs = []
+        return eci_to_ecef(eci, self.times_of_pseudoranges)
+
+    # Returns the orbit parameters of the ephemerides given by indices, named like the RTCM1019 attributes
+    def orbit_elements(self, indices: np.ndarray) -> dict[str, np.ndarray]:
+        elements = {
+            "eccentricity": self.eccentricities[indices],
+            "inclination": self.inclinations[indices],
+            "mean_anomaly": self.mean_anomalies[indices],
+            "semi_major_axis": self.semi_major_axes[indices],
+            "right_ascension_of_ascending_node": self.right_ascension_of_ascending_node[indices],
+            "argument_of_periapsis": self.arguments_of_periapsis[indices],
+            "time_of_ephemeris": self.times_of_ephemeris[indices],
+        }
+
+        for name in PERTURBATION_FIELDS:
+            elements[name] = self.perturbations[name][indices]
+
+        return elements
+
+    # Key identifying the satellite, its ephemerides, its measurement times and the orbit mode in caches
+    def cache_key(self) -> tuple:
+        elements = np.stack([self.eccentricities, self.inclinations, self.mean_anomalies, self.semi_major_axes, self.right_ascension_of_ascending_node, self.arguments_of_periapsis])
+
+        return (self.system, self.sv, array_digest(self.times_of_ephemeris), array_digest(elements), array_digest(self.perturbations), array_digest(self.times_of_pseudoranges), self.orbit_mode)
 
-        for i in range(0, len(self.times_of_pseudoranges)):
-            # calculates angle based on soloar day (not sidirial day) 
-            # needs to be fixed in the future
-            theta = self.times_of_pseudoranges[i] / 86400 % 1 * 2 * np.pi
+    # Calculate satellite ECEF position for every pseudorange measurement, cached in POSITION_CACHE
+    def position_ecef(self):
+        return POSITION_CACHE.get_or_compute(("ecef",) + self.cache_key(), self.compute_position_ecef)
+
+    # Calculate ECI position for every pseudorange measurement, cached in POSITION_CACHE
+    def position_eci(self):
+        return POSITION_CACHE.get_or_compute(("eci",) + self.cache_key(), self.compute_position_eci)
+
+    # ECI positions at any times using the ephemerides given by indices, in the "series" and "kepler" modes
+    def eci_at(self, times: np.ndarray, indices: np.ndarray) -> np.ndarray:
+        time_differences = times - self.times_of_ephemeris[indices]
 
-            Rz = np.matrix([
-                [np.cos(theta), -np.sin(theta), 0],
-                [np.sin(theta), np.cos(theta), 0],
-                [0, 0, 1]
-            ])
+        true_anomalies = self.true_anomaly(time_differences, indices)
 
-            # perform rotation to ecef
-            ecef = np.matmul(eci[i], Rz)
+        pqw = self.perifocal_reference_coordinates(true_anomalies, indices)
 
-            ecefs.append(np.copy(ecef)[0])
+        return self.earth_centered_initial(pqw, indices)
 
-        ecefs = np.array(ecefs)
+    # ECEF positions at any times using the ephemerides given by indices, without POSITION_CACHE
+    def ecef_at(self, times: np.ndarray, indices: np.ndarray) -> np.ndarray:
+        if self.orbit_mode == "full":
+            return propagate_ecef(times, self.orbit_elements(indices), gravitational_parameter=GRAVITATIONAL_PARAMETERS[self.system])
 
-        return ecefs
+        return eci_to_ecef(self.eci_at(times, indices), times)
 
     # Calculate satellite ECEF position for every pseudorange measurement
-    def position_ecef(self):
-        eci = self.position_eci()
+    def compute_position_ecef(self):
+        if self.orbit_mode == "full":
+            ecef = self.ecef_at(self.times_of_pseudoranges, self.ephemeris_indices(self.times_of_pseudoranges))
+        else:
+            eci = self.position_eci()
+
+            ecef = self.earth_centered_earth_fixed(eci)
 
-        ecef = self.earth_centered_earth_fixed(eci)
+        freeze(ecef)
 
         return ecef
 
-    # Calculate ECI position
+    # Calculate ECI position, every measurement uses the ephemeris nearest in time
+    # in the "full" mode the ECI frame is the ECEF frame at GPS time zero
+    def compute_position_eci(self):
+        if self.orbit_mode == "full":
+            eci = ecef_to_gps_inertial(self.position_ecef(), self.times_of_pseudoranges)
+
+            freeze(eci)
+
+            return eci
+
+        eci = self.eci_at(self.times_of_pseudoranges, self.ephemeris_indices(self.times_of_pseudoranges))
+
+        freeze(eci)
+
+        return eci
+
+# Class containing information collected from a specific GLONASS satellite
+# GLONASS ephemerides are state vectors, so positions are integrated numerically instead of using orbit elements
+class GlonassSatellite:
+    # Constructor
+    def __init__(self, sv, pseudoranges, times_of_pseudoranges, times_of_ephemeris, positions, velocities, accelerations, orbit_mode="series") -> None:
+        # Satellite system
+        self.system: str = "R"
+
+        # Slot number of satellite
+        self.sv: int = sv
+
+        # Distances to receiver (meters)
+        self.pseudoranges: np.ndarray = np.asarray(pseudoranges)
+
+        # Continuous GPS time of pseudorange measurements (seconds)
+        self.times_of_pseudoranges: np.ndarray = np.asarray(times_of_pseudoranges)
+
+        # Reference times of the ephemerides in continuous GPS time (seconds)
+        self.times_of_ephemeris: np.ndarray = np.asarray(times_of_ephemeris)
+
+        # PZ-90 positions, velocities and lunisolar accelerations at the reference times, shape (K, 3)
+        self.positions: np.ndarray = np.asarray(positions)
+        self.velocities: np.ndarray = np.asarray(velocities)
+        self.accelerations: np.ndarray = np.asarray(accelerations)
+
+        # Orbit propagation mode, GLONASS orbits are always integrated numerically
+        self.orbit_mode: str = orbit_mode
+
+    # Wraps per satellite observation and GLONASS ephemeris rows of an ObservationStore without copying them
+    @classmethod
+    def from_views(cls, sv: int, observations: np.ndarray, ephemerides: np.ndarray) -> "GlonassSatellite":
+        return cls(sv, observations["pseudorange"], observations["time"], ephemerides["time_of_ephemeris"], ephemerides["position"], ephemerides["velocity"], ephemerides["acceleration"])
+
+    # Copy of the satellite with other pseudorange measurements, sharing the ephemerides
+    def with_measurements(self, pseudoranges: np.ndarray, times_of_pseudoranges: np.ndarray) -> "GlonassSatellite":
+        satellite = copy.copy(self)
+
+        satellite.pseudoranges = np.asarray(pseudoranges)
+        satellite.times_of_pseudoranges = np.asarray(times_of_pseudoranges)
+
+        return satellite
+
+    # Time from the reference time of the ephemerides given by indices to each time (seconds)
+    def time_differences(self, times: np.ndarray, indices: np.ndarray) -> np.ndarray:
+        return np.asarray(times) - self.times_of_ephemeris[indices]
+
+    # Returns the index of the ephemeris whose reference time is nearest to each time
+    def ephemeris_indices(self, times: np.ndarray) -> np.ndarray:
+        times = np.asarray(times)
+
+        nearest = np.zeros(times.shape, dtype=int)
+        distances = np.abs(self.time_differences(times, nearest))
+
+        for i in range(1, len(self.times_of_ephemeris)):
+            candidate = np.abs(self.time_differences(times, np.full(times.shape, i)))
+
+            nearest = np.where(candidate < distances, i, nearest)
+            distances = np.minimum(candidate, distances)
+
+        return nearest
+
+    # Key identifying the satellite, its ephemerides and its measurement times in caches
+    def cache_key(self) -> tuple:
+        return (self.system, self.sv, array_digest(self.times_of_ephemeris), array_digest(self.positions), array_digest(self.times_of_pseudoranges))
+
+    # Calculate satellite ECEF position for every pseudorange measurement, cached in POSITION_CACHE
+    def position_ecef(self):
+        return POSITION_CACHE.get_or_compute(("ecef",) + self.cache_key(), self.compute_position_ecef)
+
+    # Calculate ECI position for every pseudorange measurement, cached in POSITION_CACHE
     def position_eci(self):
-        time_differences = self.times_of_pseudoranges - self.times_of_ephemeris[0]
+        return POSITION_CACHE.get_or_compute(("eci",) + self.cache_key(), self.compute_position_eci)
+
+    # ECEF positions at any times integrated from the ephemerides given by indices, without POSITION_CACHE
+    def ecef_at(self, times: np.ndarray, indices: np.ndarray) -> np.ndarray:
+        states = np.hstack([self.positions[indices], self.velocities[indices]])
 
-        true_anomalies = self.true_anomaly(time_differences)
+        return integrate_glonass(states, self.accelerations[indices], self.time_differences(times, indices))[:, 0:3]
+
+    # Calculate satellite ECEF position for every pseudorange measurement by integrating from the nearest ephemeris
+    def compute_position_ecef(self):
+        ecef = self.ecef_at(self.times_of_pseudoranges, self.ephemeris_indices(self.times_of_pseudoranges))
+
+        freeze(ecef)
+
+        return ecef
 
-        pqw = self.perifocal_reference_coordinates(true_anomalies)
+    # Calculate ECI position in the ECEF frame at GPS time zero
+    def compute_position_eci(self):
+        eci = ecef_to_gps_inertial(self.position_ecef(), self.times_of_pseudoranges)
 
-        eci = self.earth_centered_initial(pqw)
+        freeze(eci)
 
         return eci
\ No newline at end of file
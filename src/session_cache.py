@@ -0,0 +1,143 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from parsing import *
+
+# Folder containing the cached sessions
+CACHE_FOLDER = "cache"
+
+# Version of the cache layout, cached sessions of other versions are rebuilt
+CACHE_VERSION = 5
+
+# Arrays of a cached session, saved as one .npy file each
+SESSION_ARRAYS = ("svs", "systems", "observations", "observation_offsets", "ephemerides", "ephemeris_offsets", "glonass_ephemerides", "glonass_ephemeris_offsets")
+
+# Returns the SHA-256 digest of a file, read in chunks
+def file_digest(data_path: str) -> str:
+    digest = hashlib.sha256()
+
+    with open(data_path, "rb") as stream:
+        for chunk in iter(lambda: stream.read(1 << 20), b""):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+# Returns the metadata of a cached session, or None if there is no usable cache
+def read_metadata(cache_path: str) -> dict | None:
+    metadata_path = os.path.join(cache_path, "metadata.json")
+
+    if not os.path.exists(metadata_path):
+        return None
+
+    with open(metadata_path) as metadata_file:
+        metadata = json.load(metadata_file)
+
+    if metadata.get("version") != CACHE_VERSION:
+        return None
+
+    return metadata
+
+# Writes the metadata of a cached session, which marks the cache as complete
+def write_metadata(cache_path: str, data_path: str, digest: str, counters: dict[str, int]):
+    stat = os.stat(data_path)
+
+    metadata = {
+        "version": CACHE_VERSION,
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "sha256": digest,
+        "counters": counters,
+    }
+
+    with open(os.path.join(cache_path, "metadata.json"), "w") as metadata_file:
+        json.dump(metadata, metadata_file, indent=4)
+
+# Saves the observations and ephemerides of a store grouped by satellite and the counters of parsing them
+def save_session(store: ObservationStore, cache_path: str, data_path: str, digest: str, counters: dict[str, int]):
+    os.makedirs(cache_path, exist_ok=True)
+
+    # an incomplete cache has no metadata
+    metadata_path = os.path.join(cache_path, "metadata.json")
+
+    if os.path.exists(metadata_path):
+        os.remove(metadata_path)
+
+    (observations, observation_offsets, ephemerides, ephemeris_offsets, glonass_ephemerides, glonass_ephemeris_offsets) = store.grouped()
+
+    arrays = {
+        "svs": np.array(store.svs, dtype=np.int32),
+        "systems": np.array(store.systems, dtype="U1"),
+        "observations": observations,
+        "observation_offsets": observation_offsets,
+        "ephemerides": ephemerides,
+        "ephemeris_offsets": ephemeris_offsets,
+        "glonass_ephemerides": glonass_ephemerides,
+        "glonass_ephemeris_offsets": glonass_ephemeris_offsets,
+    }
+
+    for name in SESSION_ARRAYS:
+        np.save(os.path.join(cache_path, f"{name}.npy"), arrays[name])
+
+    write_metadata(cache_path, data_path, digest, counters)
+
+# Opens a cached session as satellite objects backed by memory-mapped arrays
+# the counters of parsing the session are counted with a "cached_" prefix, since nothing is decoded on a cache hit
+def load_session(cache_path: str, metadata: dict) -> list[GPSSatellite | GlonassSatellite]:
+    INSTRUMENTATION.count("session_cache_hits")
+
+    for (name, amount) in metadata["counters"].items():
+        INSTRUMENTATION.count(f"cached_{name}", amount)
+
+    arrays = {}
+
+    for name in SESSION_ARRAYS:
+        arrays[name] = np.load(os.path.join(cache_path, f"{name}.npy"), mmap_mode="r")
+
+    return grouped_to_gps(list(arrays["svs"]), list(arrays["systems"]), arrays["observations"], arrays["observation_offsets"], arrays["ephemerides"], arrays["ephemeris_offsets"], arrays["glonass_ephemerides"], arrays["glonass_ephemeris_offsets"])
+
+# Returns the GPS satellites of a RTCM file, from the session cache when the file is unchanged
+# the cache is rebuilt when the size, modification time and contents of the file no longer match
+def load_gps(data_path: str, file_name: str) -> list[GPSSatellite]:
+    cache_path = os.path.join(CACHE_FOLDER, file_name)
+
+    metadata = read_metadata(cache_path)
+
+    stat = os.stat(data_path)
+
+    if metadata is not None and metadata["size"] == stat.st_size and metadata["mtime_ns"] == stat.st_mtime_ns:
+        print("Loading cached RTCM data...")
+
+        return load_session(cache_path, metadata)
+
+    digest = file_digest(data_path)
+
+    # the file was touched but not changed
+    if metadata is not None and metadata["sha256"] == digest:
+        write_metadata(cache_path, data_path, digest, metadata["counters"])
+
+        print("Loading cached RTCM data...")
+
+        return load_session(cache_path, metadata)
+
+    print("Parsing RTCM data...")
+
+    store = ObservationStore()
+
+    decoded = INSTRUMENTATION.counters.get("messages_decoded", 0)
+
+    for message in read_messages(data_path):
+        store.add(message)
+
+    INSTRUMENTATION.count("duplicate_ephemerides_dropped", store.duplicate_ephemerides)
+
+    counters = {
+        "messages_decoded": INSTRUMENTATION.counters.get("messages_decoded", 0) - decoded,
+        "duplicate_ephemerides_dropped": store.duplicate_ephemerides,
+    }
+
+    save_session(store, cache_path, data_path, digest, counters)
+
+    return store.to_gps()
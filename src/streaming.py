@@ -0,0 +1,166 @@
+from typing import Iterable, Iterator
+
+import numpy as np
+
+from parsing import *
+from estimation import *
+
+# Pseudorange measurements of one epoch together with the ephemerides valid when they were received
+class ObservationEpoch:
+    # Constructor
+    def __init__(self, time: float, svs: np.ndarray, pseudoranges: np.ndarray, ephemerides: list[RTCM1019 | RTCM1020 | RTCM1045], systems: np.ndarray = None) -> None:
+        # Continuous GPS time (seconds since the GPS epoch)
+        self.time: float = time
+
+        # Satellite identification numbers
+        self.svs: np.ndarray = svs
+
+        # Pseudoranges (meters)
+        self.pseudoranges: np.ndarray = pseudoranges
+
+        # Latest ephemeris message of every satellite in the epoch
+        self.ephemerides: list[RTCM1019 | RTCM1020 | RTCM1045] = ephemerides
+
+        # Satellite system of every satellite, GPS if not given
+        self.systems: np.ndarray = systems if systems is not None else np.full(len(svs), "G")
+
+# Groups a stream of RTCM messages into observation epochs while keeping the latest ephemeris of every satellite
+class EpochAssembler:
+    # Constructor
+    def __init__(self) -> None:
+        # Latest ephemeris message of every (system, satellite)
+        self.ephemerides: dict[tuple[str, int], RTCM1019 | RTCM1020 | RTCM1045] = {}
+
+        # Measurements of the epoch currently being assembled
+        self.time: float = None
+        self.svs: list[int] = []
+        self.systems: list[str] = []
+        self.pseudoranges: list[float] = []
+
+    # Adds a message and returns the epochs it completes
+    # an epoch is complete when a message of a new epoch arrives or its last message is flagged as not synchronous
+    def add(self, message: RTCM1002 | RTCMMSM | RTCM1019 | RTCM1020 | RTCM1045) -> list[ObservationEpoch]:
+        if isinstance(message, EPHEMERIS_MESSAGES):
+            self.ephemerides[(message.system, message.sv)] = message
+
+            return []
+
+        epochs = []
+
+        if self.time is not None and message.gps_time != self.time:
+            epochs.append(self.flush())
+
+        self.time = message.gps_time
+        self.svs.extend(message.svs)
+        self.systems.extend([message.system] * len(message.svs))
+        self.pseudoranges.extend(message.pseudoranges)
+
+        if not message.synchronous:
+            epochs.append(self.flush())
+
+        return epochs
+
+    # Returns the epoch currently being assembled, only satellites with a known ephemeris are kept
+    def flush(self) -> ObservationEpoch | None:
+        if self.time is None:
+            return None
+
+        keys = []
+        pseudoranges = []
+        ephemerides = []
+
+        for i in range(0, len(self.svs)):
+            key = (self.systems[i], self.svs[i])
+
+            if key in self.ephemerides and key not in keys:
+                keys.append(key)
+                pseudoranges.append(self.pseudoranges[i])
+                ephemerides.append(self.ephemerides[key])
+
+        svs = np.array([sv for (system, sv) in keys], dtype=int)
+        systems = np.array([system for (system, sv) in keys], dtype="U1")
+
+        epoch = ObservationEpoch(self.time, svs, np.array(pseudoranges), ephemerides, systems)
+
+        self.time = None
+        self.svs = []
+        self.systems = []
+        self.pseudoranges = []
+
+        return epoch
+
+# Yields observation epochs from RTCM messages
+def assemble_epochs(messages: Iterable[RTCM1002 | RTCMMSM | RTCM1019 | RTCM1020 | RTCM1045]) -> Iterator[ObservationEpoch]:
+    assembler = EpochAssembler()
+
+    for message in messages:
+        yield from assembler.add(message)
+
+    epoch = assembler.flush()
+
+    if epoch is not None:
+        yield epoch
+
+# Reads RTCM data from a file and yields observation epochs without keeping the file in memory
+def stream_epochs(data_path: str) -> Iterator[ObservationEpoch]:
+    return assemble_epochs(read_messages(data_path))
+
+# Creates satellite objects from observation epochs, one per satellite and ephemeris
+def epochs_to_gps(epochs: list[ObservationEpoch]) -> list[GPSSatellite | GlonassSatellite]:
+    groups: dict[tuple[str, int, int], tuple[RTCM1019 | RTCM1020 | RTCM1045, list[float], list[float]]] = {}
+
+    for epoch in epochs:
+        for i in range(0, len(epoch.svs)):
+            ephemeris = epoch.ephemerides[i]
+            key = (ephemeris.system, ephemeris.sv, id(ephemeris))
+
+            if key not in groups:
+                groups[key] = (ephemeris, [], [])
+
+            groups[key][1].append(epoch.pseudoranges[i])
+            groups[key][2].append(epoch.time)
+
+    gps_list: list[GPSSatellite | GlonassSatellite] = []
+
+    for (ephemeris, pseudoranges, times_of_pseudoranges) in groups.values():
+        observations = np.zeros(len(pseudoranges), dtype=OBSERVATION_DTYPE)
+        observations["time"] = times_of_pseudoranges
+        observations["pseudorange"] = pseudoranges
+
+        gps = satellite_from_views(ephemeris.system, ephemeris.sv, observations, ephemeris_array(0, ephemeris))
+
+        gps_list.append(gps)
+
+    return gps_list
+
+# Solves fixes incrementally, holding at most chunk_size epochs in memory at a time
+# chunks are solved with compute_fixes since they are never solved twice
+def solve_stream(epochs: Iterable[ObservationEpoch], chunk_size: int = 1024, elevation_mask: float = ELEVATION_MASK, max_pdop: float = MAX_PDOP, raim: bool = False, light_time: bool = True) -> Iterator[Fixes]:
+    chunk: list[ObservationEpoch] = []
+
+    for epoch in epochs:
+        chunk.append(epoch)
+
+        if len(chunk) >= chunk_size:
+            yield compute_fixes(epochs_to_gps(chunk), elevation_mask=elevation_mask, max_pdop=max_pdop, raim=raim, light_time=light_time)
+
+            chunk = []
+
+    if len(chunk) > 0:
+        yield compute_fixes(epochs_to_gps(chunk), elevation_mask=elevation_mask, max_pdop=max_pdop, raim=raim, light_time=light_time)
+
+# Writes streamed fixes and their dilutions of precision to a CSV file as they are solved and returns the number of fixes
+def save_fixes(fixes_stream: Iterable[Fixes], csv_path: str) -> int:
+    count = 0
+
+    with open(csv_path, "w") as csv_file:
+        csv_file.write(",".join(("gps_time", "x", "y", "z", "clock_bias") + DOP_COLUMNS) + "\n")
+
+        for fixes in fixes_stream:
+            rows = np.column_stack([fixes.times, fixes.positions, fixes.clock_biases, fixes.dops])
+
+            np.savetxt(csv_file, rows, delimiter=",", fmt="%.4f")
+
+            count += len(rows)
+
+    return count
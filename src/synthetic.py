@@ -0,0 +1,456 @@
+import math
+import os
+
+import numpy as np
+from pyrtcm.rtcmhelpers import calc_crc24q
+
+from constants import *
+from orbits import *
+from rtcm import *
+from light_time import *
+
+# Default receiver position, roughly Stockholm at sea level (ECEF, meters)
+RECEIVER_POSITION = np.array([3098000.0, 1011000.0, 5463000.0])
+
+# GPS week of the generated data, times are continuous GPS times starting in this week
+GPS_WEEK = 2300
+
+# Time between broadcast ephemerides of every satellite system (seconds)
+EPHEMERIS_INTERVALS = {"G": 7200, "R": 1800, "E": 600}
+
+# Receiver clock bias of every satellite system against GPS time (meters)
+INTER_SYSTEM_BIASES = {"G": 0.0, "R": 30.0, "E": -15.0}
+
+# Semi major axis, inclination and number of orbit planes of the constellation of every satellite system
+CONSTELLATIONS = {
+    "G": (26559700, math.radians(55), 6),
+    "R": (25508200, math.radians(64.8), 3),
+    "E": (29599800, math.radians(56), 3),
+}
+
+# Writes unsigned and two's complement signed integers of any bit width into a bit string
+class BitWriter:
+    # Constructor
+    def __init__(self) -> None:
+        # Bits written so far as one integer
+        self.value: int = 0
+
+        # Number of bits written
+        self.bits: int = 0
+
+    # Appends the lowest bits of an integer, negative integers are written in two's complement
+    def write(self, value: int, width: int):
+        self.value = self.value << width | (int(value) & (2 ** width - 1))
+        self.bits += width
+
+    # Appends an integer in sign-magnitude form, as used by GLONASS data fields
+    def write_sign_magnitude(self, value: int, width: int):
+        self.write(1 if value < 0 else 0, 1)
+        self.write(abs(int(value)), width - 1)
+
+    # Returns the bits padded with zeros to whole bytes
+    def to_bytes(self) -> bytes:
+        padding = -self.bits % 8
+
+        return (self.value << padding).to_bytes((self.bits + padding) // 8, "big")
+
+# Wraps a message payload in a RTCM3 frame: preamble, length, payload and CRC-24Q
+def frame_message(payload: bytes) -> bytes:
+    header = bytes([0xD3, len(payload) >> 8 & 0x03, len(payload) & 0xFF])
+
+    return header + payload + calc_crc24q(header + payload).to_bytes(3, "big")
+
+# Encodes a RTCM 1002 message with the L1 pseudoranges of some satellites at a time of week (seconds)
+def encode_1002(time_of_week: float, svs: np.ndarray, pseudoranges: np.ndarray, synchronous: bool = False, station: int = 0) -> bytes:
+    writer = BitWriter()
+
+    # header: DF002, DF003, DF004, DF005, DF006, DF007, DF008
+    writer.write(1002, 12)
+    writer.write(station, 12)
+    writer.write(round(time_of_week * 1000), 30)
+    writer.write(synchronous, 1)
+    writer.write(len(svs), 5)
+    writer.write(0, 1)
+    writer.write(0, 3)
+
+    for (sv, pseudorange) in zip(svs, pseudoranges):
+        ambiguity = int(pseudorange // AMBIGUITY_STEP)
+
+        # DF009, DF010, DF011, DF012, DF013, DF014, DF015, no phase range and a fixed CNR of 45 dB-Hz
+        writer.write(sv, 6)
+        writer.write(0, 1)
+        writer.write(round((pseudorange - ambiguity * AMBIGUITY_STEP) / 0.02), 24)
+        writer.write(-2 ** 19, 20)
+        writer.write(0, 7)
+        writer.write(ambiguity, 8)
+        writer.write(45 * 4, 8)
+
+    return frame_message(writer.to_bytes())
+
+# Encodes a RTCM 1019 message from a dictionary of ephemeris values named like the RTCM1019 attributes
+# angles are in radians and converted to semicircles, clock corrections are zero
+# the time of ephemeris is a continuous GPS time, written as a 10 bit week number and a time of week
+def encode_1019(sv: int, ephemeris: dict) -> bytes:
+    writer = BitWriter()
+
+    (week, time_of_ephemeris) = divmod(ephemeris["time_of_ephemeris"], SECONDS_PER_WEEK)
+
+    semicircles = lambda name, scale: round(ephemeris.get(name, 0) / math.pi / scale)
+    scaled = lambda name, scale: round(ephemeris.get(name, 0) / scale)
+
+    writer.write(1019, 12)                                                  # DF002
+    writer.write(sv, 6)                                                     # DF009
+    writer.write(int(week) % GPS_WEEK_ROLLOVER, 10)                         # DF076
+    writer.write(0, 4)                                                      # DF077
+    writer.write(1, 2)                                                      # DF078
+    writer.write(semicircles("rate_of_inclination", 2 ** -43), 14)          # DF079
+    writer.write(0, 8)                                                      # DF071
+    writer.write(round(time_of_ephemeris / 16), 16)                         # DF081
+    writer.write(0, 8)                                                      # DF082
+    writer.write(0, 16)                                                     # DF083
+    writer.write(0, 22)                                                     # DF084
+    writer.write(0, 10)                                                     # DF085
+    writer.write(scaled("radius_sine_correction", 2 ** -5), 16)             # DF086
+    writer.write(semicircles("mean_motion_correction", 2 ** -43), 16)       # DF087
+    writer.write(semicircles("mean_anomaly", 2 ** -31), 32)                 # DF088
+    writer.write(scaled("latitude_cosine_correction", 2 ** -29), 16)        # DF089
+    writer.write(scaled("eccentricity", 2 ** -33), 32)                      # DF090
+    writer.write(scaled("latitude_sine_correction", 2 ** -29), 16)          # DF091
+    writer.write(round(math.sqrt(ephemeris["semi_major_axis"]) / 2 ** -19), 32)  # DF092
+    writer.write(round(time_of_ephemeris / 16), 16)                         # DF093
+    writer.write(scaled("inclination_cosine_correction", 2 ** -29), 16)     # DF094
+    writer.write(semicircles("right_ascension_of_ascending_node", 2 ** -31), 32)  # DF095
+    writer.write(scaled("inclination_sine_correction", 2 ** -29), 16)       # DF096
+    writer.write(semicircles("inclination", 2 ** -31), 32)                  # DF097
+    writer.write(scaled("radius_cosine_correction", 2 ** -5), 16)           # DF098
+    writer.write(semicircles("argument_of_periapsis", 2 ** -31), 32)        # DF099
+    writer.write(semicircles("rate_of_right_ascension", 2 ** -43), 24)      # DF100
+    writer.write(0, 8)                                                      # DF101
+    writer.write(0, 6)                                                      # DF102
+    writer.write(0, 1)                                                      # DF103
+    writer.write(0, 1)                                                      # DF137
+
+    return frame_message(writer.to_bytes())
+
+# Encodes a MSM4, MSM5 or MSM7 message with one L1 signal (signal 2) per satellite of a system
+# svs must be in ascending order, time_of_week is GPS time (seconds)
+def encode_msm(system: str, msm: int, time_of_week: float, svs: np.ndarray, pseudoranges: np.ndarray, synchronous: bool = False, station: int = 0) -> bytes:
+    writer = BitWriter()
+
+    number = {"G": 1070, "R": 1080, "E": 1090}[system] + msm
+
+    writer.write(number, 12)
+    writer.write(station, 12)
+
+    if system == "R":
+        # DF416 and DF034 in Moscow time
+        moscow_time = (time_of_week - GPS_UTC_LEAP_SECONDS + GLONASS_UTC_OFFSET) % SECONDS_PER_WEEK
+
+        writer.write(int(moscow_time // 86400), 3)
+        writer.write(round(moscow_time % 86400 * 1000), 27)
+    else:
+        writer.write(round(time_of_week * 1000), 30)
+
+    # DF393, DF409, DF001, DF411, DF412, DF417, DF418
+    writer.write(synchronous, 1)
+    writer.write(0, 3)
+    writer.write(0, 7)
+    writer.write(0, 2)
+    writer.write(0, 2)
+    writer.write(0, 1)
+    writer.write(0, 3)
+
+    # DF394, DF395 and DF396 with every cell present
+    writer.write(sum(1 << (64 - sv) for sv in svs), 64)
+    writer.write(1 << 30, 32)
+    writer.write(2 ** len(svs) - 1, len(svs))
+
+    # rough ranges in 1/1024 ms and the remaining fine ranges
+    milliseconds = np.asarray(pseudoranges) / (SPEED_OF_LIGHT / 1000)
+    rough = np.round(milliseconds * 1024).astype(int)
+    fine = milliseconds - rough / 1024
+
+    extended = msm in (5, 7)
+
+    for value in rough:
+        writer.write(value >> 10, 8)                    # DF397
+
+    if extended:
+        for _ in svs:
+            writer.write(0, 4)                          # extended satellite information
+
+    for value in rough:
+        writer.write(value & 0x3FF, 10)                 # DF398
+
+    if extended:
+        for _ in svs:
+            writer.write(-2 ** 13, 14)                  # DF399, invalid
+
+    if msm == 7:
+        for value in fine:
+            writer.write(round(value / 2 ** -29), 20)   # DF405
+
+        for (width, value) in ((24, -2 ** 23), (10, 0), (1, 0), (10, 45 * 16), (15, -2 ** 14)):
+            for _ in svs:
+                writer.write(value, width)              # DF406, DF407, DF420, DF408, DF404
+    else:
+        for value in fine:
+            writer.write(round(value / 2 ** -24), 15)   # DF400
+
+        fields = [(22, -2 ** 21), (4, 0), (1, 0), (6, 45)] + ([(15, -2 ** 14)] if msm == 5 else [])
+
+        for (width, value) in fields:
+            for _ in svs:
+                writer.write(value, width)              # DF401, DF402, DF420, DF403 and DF404 in MSM5
+
+    return frame_message(writer.to_bytes())
+
+# Encodes a RTCM 1045 message (Galileo F/NAV ephemeris) from a dictionary of ephemeris values named like the RTCM1045 attributes
+# the time of ephemeris is a continuous GPS time, written as a Galileo week number and a time of week
+def encode_1045(sv: int, ephemeris: dict) -> bytes:
+    writer = BitWriter()
+
+    (week, time_of_ephemeris) = divmod(ephemeris["time_of_ephemeris"], SECONDS_PER_WEEK)
+
+    semicircles = lambda name, scale: round(ephemeris.get(name, 0) / math.pi / scale)
+    scaled = lambda name, scale: round(ephemeris.get(name, 0) / scale)
+
+    writer.write(1045, 12)                                                  # DF002
+    writer.write(sv, 6)                                                     # DF252
+    writer.write((int(week) - GALILEO_WEEK_OFFSET) % GALILEO_WEEK_ROLLOVER, 12)  # DF289
+    writer.write(0, 10)                                                     # DF290
+    writer.write(0, 8)                                                      # DF291
+    writer.write(semicircles("rate_of_inclination", 2 ** -43), 14)          # DF292
+    writer.write(round(time_of_ephemeris / 60), 14)                         # DF293
+    writer.write(0, 6)                                                      # DF294
+    writer.write(0, 21)                                                     # DF295
+    writer.write(0, 31)                                                     # DF296
+    writer.write(scaled("radius_sine_correction", 2 ** -5), 16)             # DF297
+    writer.write(semicircles("mean_motion_correction", 2 ** -43), 16)       # DF298
+    writer.write(semicircles("mean_anomaly", 2 ** -31), 32)                 # DF299
+    writer.write(scaled("latitude_cosine_correction", 2 ** -29), 16)        # DF300
+    writer.write(scaled("eccentricity", 2 ** -33), 32)                      # DF301
+    writer.write(scaled("latitude_sine_correction", 2 ** -29), 16)          # DF302
+    writer.write(round(math.sqrt(ephemeris["semi_major_axis"]) / 2 ** -19), 32)  # DF303
+    writer.write(round(time_of_ephemeris / 60), 14)                         # DF304
+    writer.write(scaled("inclination_cosine_correction", 2 ** -29), 16)     # DF305
+    writer.write(semicircles("right_ascension_of_ascending_node", 2 ** -31), 32)  # DF306
+    writer.write(scaled("inclination_sine_correction", 2 ** -29), 16)       # DF307
+    writer.write(semicircles("inclination", 2 ** -31), 32)                  # DF308
+    writer.write(scaled("radius_cosine_correction", 2 ** -5), 16)           # DF309
+    writer.write(semicircles("argument_of_periapsis", 2 ** -31), 32)        # DF310
+    writer.write(semicircles("rate_of_right_ascension", 2 ** -43), 24)      # DF311
+    writer.write(0, 10)                                                     # DF312
+    writer.write(0, 2)                                                      # DF314
+    writer.write(0, 1)                                                      # DF315
+    writer.write(0, 7)                                                      # DF001
+
+    return frame_message(writer.to_bytes())
+
+# Encodes a RTCM 1020 message (GLONASS ephemeris) with a state vector at a reference time tb in GPS seconds of day
+# tb must be a multiple of 15 minutes in Moscow time, returns (message, quantized position, quantized velocity)
+def encode_1020(sv: int, time_of_ephemeris: float, position: np.ndarray, velocity: np.ndarray, frequency_channel: int = 0) -> tuple[bytes, np.ndarray, np.ndarray]:
+    writer = BitWriter()
+
+    position_units = np.round(np.asarray(position) / 1000 / 2 ** -11).astype(int)
+    velocity_units = np.round(np.asarray(velocity) / 1000 / 2 ** -20).astype(int)
+
+    writer.write(1020, 12)                                                  # DF002
+    writer.write(sv, 6)                                                     # DF038
+    writer.write(frequency_channel + 7, 5)                                  # DF040
+    writer.write(0, 1)                                                      # DF104
+    writer.write(0, 1)                                                      # DF105
+    writer.write(0, 2)                                                      # DF106
+    writer.write(0, 12)                                                     # DF107
+    writer.write(0, 1)                                                      # DF108
+    writer.write(0, 1)                                                      # DF109
+    writer.write(round((time_of_ephemeris - GPS_UTC_LEAP_SECONDS + GLONASS_UTC_OFFSET) % 86400 / 900), 7)  # DF110
+
+    for axis in range(0, 3):
+        writer.write_sign_magnitude(velocity_units[axis], 24)               # DF111, DF114, DF117
+        writer.write_sign_magnitude(position_units[axis], 27)               # DF112, DF115, DF118
+        writer.write_sign_magnitude(0, 5)                                   # DF113, DF116, DF119
+
+    writer.write(0, 1)                                                      # DF120
+    writer.write_sign_magnitude(0, 11)                                      # DF121
+    writer.write(0, 2)                                                      # DF122
+    writer.write(0, 1)                                                      # DF123
+    writer.write_sign_magnitude(0, 22)                                      # DF124
+    writer.write_sign_magnitude(0, 5)                                       # DF125
+    writer.write(0, 5)                                                      # DF126
+    writer.write(0, 1)                                                      # DF127
+    writer.write(0, 4)                                                      # DF128
+    writer.write(0, 11)                                                     # DF129
+    writer.write(0, 2)                                                      # DF130
+    writer.write(0, 1)                                                      # DF131
+    writer.write(0, 11)                                                     # DF132
+    writer.write_sign_magnitude(0, 32)                                      # DF133
+    writer.write(0, 5)                                                      # DF134
+    writer.write_sign_magnitude(0, 22)                                      # DF135
+    writer.write(0, 1)                                                      # DF136
+    writer.write(0, 7)                                                      # DF001
+
+    return (frame_message(writer.to_bytes()), position_units * 2 ** -11 * 1000, velocity_units * 2 ** -20 * 1000)
+
+# Keplerian orbits of a constellation of a satellite system, one dictionary of elements per satellite
+# the elements are referenced to the time of ephemeris and do not drift, so every broadcast ephemeris describes the same orbit
+def synthetic_orbits(num_satellites: int, time_of_ephemeris: float, seed: int = 0, system: str = "G") -> list[dict]:
+    rng = np.random.default_rng(seed + SYSTEMS.index(system))
+
+    (semi_major_axis, inclination, num_planes) = CONSTELLATIONS[system]
+
+    slots = math.ceil(num_satellites / num_planes)
+
+    orbits = []
+
+    for i in range(0, num_satellites):
+        plane = i % num_planes
+        slot = i // num_planes
+
+        orbit = {
+            "eccentricity": rng.uniform(0.001, 0.02),
+            "inclination": inclination + rng.normal(0, 0.01),
+            "mean_anomaly": (2 * math.pi * slot / slots + 2 * math.pi / num_planes / slots * plane + rng.normal(0, 0.05) + math.pi) % (2 * math.pi) - math.pi,
+            "semi_major_axis": semi_major_axis + rng.normal(0, 1000),
+            "right_ascension_of_ascending_node": (2 * math.pi / num_planes * plane + math.pi) % (2 * math.pi) - math.pi,
+            "argument_of_periapsis": rng.uniform(-math.pi, math.pi),
+            "time_of_ephemeris": time_of_ephemeris,
+        }
+
+        for name in PERTURBATION_FIELDS:
+            orbit[name] = 0.0
+
+        orbits.append(orbit)
+
+    return orbits
+
+# Ephemeris of an orbit moved to another reference time (continuous GPS time)
+def move_ephemeris(orbit: dict, time_of_ephemeris: float, gravitational_parameter: float = MU_GPS) -> dict:
+    ephemeris = dict(orbit)
+
+    mean_motion = math.sqrt(gravitational_parameter / orbit["semi_major_axis"] ** 3)
+
+    ephemeris["mean_anomaly"] = (orbit["mean_anomaly"] + mean_motion * (time_of_ephemeris - orbit["time_of_ephemeris"]) + math.pi) % (2 * math.pi) - math.pi
+
+    # the longitude of the ascending node is given at the start of the week of the time of ephemeris
+    weeks = time_of_ephemeris // SECONDS_PER_WEEK - orbit["time_of_ephemeris"] // SECONDS_PER_WEEK
+
+    ephemeris["right_ascension_of_ascending_node"] = (orbit["right_ascension_of_ascending_node"] - EARTH_ROTATION_RATE * weeks * SECONDS_PER_WEEK + math.pi) % (2 * math.pi) - math.pi
+    ephemeris["time_of_ephemeris"] = time_of_ephemeris
+
+    return ephemeris
+
+# Returns a function giving the ECEF positions (N, 3) of a Keplerian orbit at times (N,)
+def keplerian_positions(orbit: dict, gravitational_parameter: float = MU_GPS):
+    return lambda times: propagate_ecef(times, {name: np.full(len(times), value) for (name, value) in orbit.items()}, gravitational_parameter=gravitational_parameter)
+
+# Returns a function giving the ECEF positions (N, 3) of a GLONASS orbit integrated from a state at a reference time
+def glonass_positions(reference_time: float, position: np.ndarray, velocity: np.ndarray):
+    def positions(times: np.ndarray) -> np.ndarray:
+        states = np.tile(np.concatenate([position, velocity]), (len(times), 1))
+
+        return integrate_glonass(states, np.zeros((len(times), 3)), times - reference_time)[:, 0:3]
+
+    return positions
+
+# Broadcast ephemeris messages of one satellite at the epochs where a new ephemeris starts, as {epoch: message}
+# also returns the function giving the true positions of the satellite
+def broadcast_ephemerides(system: str, sv: int, orbit: dict, times: np.ndarray) -> tuple[dict[int, bytes], object]:
+    interval = EPHEMERIS_INTERVALS[system]
+
+    messages = {}
+
+    if system == "R":
+        # GLONASS reference times are multiples of 15 minutes in Moscow time, which is a whole number of minutes after GPS time
+        offset = (GLONASS_UTC_OFFSET - GPS_UTC_LEAP_SECONDS) % 900
+        first = times[0] - (times[0] + offset) % 900
+
+        # the true orbit is integrated from one state so all ephemerides describe the same trajectory
+        start_position = keplerian_positions(orbit)(np.array([first]))[0]
+        start_velocity = (keplerian_positions(orbit)(np.array([first + 0.5]))[0] - keplerian_positions(orbit)(np.array([first - 0.5]))[0])
+
+        positions_at = glonass_positions(first, start_position, start_velocity)
+
+        for epoch in np.flatnonzero(np.diff(np.floor((times - first) / interval), prepend=-1) > 0):
+            reference_time = first + np.floor((times[epoch] - first) / interval) * interval
+
+            # velocity by central differences of the integrated trajectory
+            (position, before, after) = positions_at(np.array([reference_time, reference_time - 0.5, reference_time + 0.5]))
+
+            (message, position, velocity) = encode_1020(sv, reference_time % 86400, position, after - before)
+
+            messages[int(epoch)] = message
+
+        return (messages, positions_at)
+
+    gravitational_parameter = GRAVITATIONAL_PARAMETERS[system]
+    granularity = 60 if system == "E" else 16
+
+    for epoch in np.flatnonzero(np.diff(np.floor((times - times[0]) / interval), prepend=-1) > 0):
+        ephemeris = move_ephemeris(orbit, times[epoch] - times[epoch] % granularity, gravitational_parameter)
+
+        messages[int(epoch)] = encode_1045(sv, ephemeris) if system == "E" else encode_1019(sv, ephemeris)
+
+    return (messages, keplerian_positions(orbit, gravitational_parameter))
+
+# Writes a synthetic RTCM file observing every satellite of some constellations from a fixed receiver
+# rate is epochs per second, receiver clock bias (meters) and drift (meters / s) are added to the pseudoranges
+# GPS observations are RTCM 1002 messages unless an MSM type is given, other systems always use MSM (MSM4 by default)
+# start is a continuous GPS time, so sessions may cross a week boundary
+# returns the ground truth: epoch times, receiver position, clock biases and inter-system biases
+def generate_session(path: str, num_satellites: int = 8, duration: float = 600, rate: float = 1, receiver_position: np.ndarray = RECEIVER_POSITION, clock_bias: float = 3000.0, clock_drift: float = 0.1, noise: float = 0.0, start: float = GPS_WEEK * SECONDS_PER_WEEK + 345600, seed: int = 0, systems: tuple[str, ...] = ("G",), msm: int = None) -> dict:
+    rng = np.random.default_rng(seed)
+
+    times = start + np.arange(0, int(duration * rate)) / rate
+    clock_biases = clock_bias + clock_drift * (times - start)
+
+    svs = np.arange(1, num_satellites + 1)
+
+    pseudoranges = {}
+    ephemeris_messages: dict[int, list[bytes]] = {}
+
+    for system in systems:
+        orbits = synthetic_orbits(num_satellites, start - start % 16, seed, system)
+
+        pseudoranges[system] = np.zeros((len(times), num_satellites))
+
+        for i in range(0, num_satellites):
+            (messages, positions_at) = broadcast_ephemerides(system, svs[i], orbits[i], times)
+
+            for (epoch, message) in messages.items():
+                ephemeris_messages.setdefault(epoch, []).append(message)
+
+            (positions, travel_times, iterations) = transmitted_positions(positions_at, times, receiver_position)
+
+            pseudoranges[system][:, i] = travel_times * SPEED_OF_LIGHT + clock_biases + INTER_SYSTEM_BIASES[system]
+
+            if noise > 0:
+                pseudoranges[system][:, i] += rng.normal(0, noise, len(times))
+
+    folder = os.path.dirname(path)
+
+    if folder != "":
+        os.makedirs(folder, exist_ok=True)
+
+    with open(path, "wb") as stream:
+        for epoch in range(0, len(times)):
+            for message in ephemeris_messages.get(epoch, []):
+                stream.write(message)
+
+            time_of_week = times[epoch] % SECONDS_PER_WEEK
+
+            # all but the last observation message of an epoch are flagged as synchronous
+            for (k, system) in enumerate(systems):
+                synchronous = k < len(systems) - 1
+
+                if system == "G" and msm is None:
+                    stream.write(encode_1002(time_of_week, svs, pseudoranges[system][epoch], synchronous))
+                else:
+                    stream.write(encode_msm(system, msm or 4, time_of_week, svs, pseudoranges[system][epoch], synchronous))
+
+    return {
+        "times": times,
+        "position": np.asarray(receiver_position, dtype=float),
+        "clock_biases": clock_biases,
+        "inter_system_biases": {system: INTER_SYSTEM_BIASES[system] for system in systems},
+    }
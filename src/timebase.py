@@ -0,0 +1,119 @@
+import time
+from typing import Iterable, Iterator
+
+import numpy as np
+
+from constants import *
+from rtcm import *
+
+# Continuous GPS time is the number of seconds since the GPS epoch (float64)
+# unlike times of week it keeps increasing across week boundaries, so the epochs of a multi-day session form one sorted time axis
+
+# Continuous GPS time of a week number and a time of week (seconds)
+def gps_time(week: int | np.ndarray, time_of_week: float | np.ndarray) -> float | np.ndarray:
+    return week * SECONDS_PER_WEEK + time_of_week
+
+# GPS week number of continuous GPS times
+def gps_week(times: float | np.ndarray) -> int | np.ndarray:
+    return np.floor_divide(times, SECONDS_PER_WEEK).astype(int)
+
+# Time of week of continuous GPS times (seconds)
+def time_of_week(times: float | np.ndarray) -> float | np.ndarray:
+    return np.mod(times, SECONDS_PER_WEEK)
+
+# GPS week number of the system clock, used to resolve the rollover of RTCM week numbers
+def current_gps_week() -> int:
+    return int((time.time() - GPS_EPOCH_UNIX + GPS_UTC_LEAP_SECONDS) // SECONDS_PER_WEEK)
+
+# Resolves week numbers that roll over after some number of weeks to the full week number nearest to a reference week
+def resolve_week(week: int, reference_week: int, rollover: int = GPS_WEEK_ROLLOVER) -> int:
+    return week + round((reference_week - week) / rollover) * rollover
+
+# Places times that repeat with some period (times of week, times of day) at the continuous GPS times nearest to a reference time
+# the times are shifted by whole periods so times that are equal stay exactly equal
+def resolve_periodic(times: float | np.ndarray, reference: float, period: float = SECONDS_PER_WEEK) -> float | np.ndarray:
+    periods = np.round((reference - np.asarray(times)) / period)
+
+    return periods * period + times
+
+# Resolves the times of week of RTCM messages to continuous GPS time in the order the messages are received
+# every time is placed nearest to the latest observation time, so rollovers within and between weeks are followed
+# the first week comes from the week number of a GPS or Galileo ephemeris, messages received before it are held back
+class GPSTimeBase:
+    # Constructor
+    def __init__(self, reference_week: int = None, max_pending: int = 4096) -> None:
+        # Week used to resolve the rollover of ephemeris week numbers, the week of the system clock by default
+        self.reference_week: int = reference_week if reference_week is not None else current_gps_week()
+
+        # Latest resolved observation time or the first time of ephemeris, None until a week number is known
+        self.reference: float = None
+
+        # Messages received before the week was known, in the order they were received
+        self.pending: list[RTCM1002 | RTCMMSM | RTCM1019 | RTCM1020 | RTCM1045] = []
+
+        # Maximum number of held back messages, after which the reference week is assumed
+        self.max_pending: int = max_pending
+
+    # Adds a message and returns the messages whose times were resolved by it, in the order they were received
+    def add(self, message: RTCM1002 | RTCMMSM | RTCM1019 | RTCM1020 | RTCM1045) -> list[RTCM1002 | RTCMMSM | RTCM1019 | RTCM1020 | RTCM1045]:
+        if self.reference is None:
+            self.pending.append(message)
+
+            if isinstance(message, (RTCM1019, RTCM1045)):
+                self.reference = self.time_of_ephemeris_week(message)
+            elif len(self.pending) > self.max_pending:
+                self.reference = gps_time(self.reference_week, 0)
+            else:
+                return []
+
+            return self.flush()
+
+        self.resolve(message)
+
+        return [message]
+
+    # Resolves and returns the held back messages, assuming the reference week if no week number was received
+    def flush(self) -> list[RTCM1002 | RTCMMSM | RTCM1019 | RTCM1020 | RTCM1045]:
+        if self.reference is None:
+            self.reference = gps_time(self.reference_week, 0)
+
+        messages = self.pending
+
+        self.pending = []
+
+        for message in messages:
+            self.resolve(message)
+
+        return messages
+
+    # Continuous GPS time of ephemeris of a GPS or Galileo ephemeris, using its week number
+    def time_of_ephemeris_week(self, message: RTCM1019 | RTCM1045) -> float:
+        if isinstance(message, RTCM1045):
+            week = resolve_week(message.week_number, self.reference_week - GALILEO_WEEK_OFFSET, GALILEO_WEEK_ROLLOVER) + GALILEO_WEEK_OFFSET
+        else:
+            week = resolve_week(message.week_number, self.reference_week)
+
+        # the time of ephemeris may belong to the week before or after the week of transmission
+        return resolve_periodic(message.time_of_ephemeris, gps_time(week, message.time_of_week))
+
+    # Sets the continuous GPS time of a message from the current reference time
+    def resolve(self, message: RTCM1002 | RTCMMSM | RTCM1019 | RTCM1020 | RTCM1045):
+        if isinstance(message, OBSERVATION_MESSAGES):
+            message.gps_time = resolve_periodic(message.time_of_week, self.reference)
+
+            self.reference = message.gps_time
+        elif isinstance(message, RTCM1020):
+            # GLONASS reference times are times of day
+            message.gps_time_of_ephemeris = resolve_periodic(message.time_of_ephemeris, self.reference, SECONDS_PER_DAY)
+        else:
+            message.gps_time_of_ephemeris = resolve_periodic(message.time_of_ephemeris, self.reference)
+
+# Resolves the times of a stream of RTCM messages and yields the messages in the order they were received
+def resolve_times(messages: Iterable[RTCM1002 | RTCMMSM | RTCM1019 | RTCM1020 | RTCM1045], time_base: GPSTimeBase = None) -> Iterator[RTCM1002 | RTCMMSM | RTCM1019 | RTCM1020 | RTCM1045]:
+    if time_base is None:
+        time_base = GPSTimeBase()
+
+    for message in messages:
+        yield from time_base.add(message)
+
+    yield from time_base.flush()
@@ -0,0 +1,84 @@
+import numpy as np
+
+from geodesy import *
+
+# Satellites below this elevation are not used in fixes (degrees)
+ELEVATION_MASK = 10.0
+
+# Epochs with a position dilution of precision above this are not solved, None to solve every epoch
+MAX_PDOP = None
+
+# Columns of the dilution of precision arrays
+# geometric, position, horizontal, vertical and time (clock bias of the first observed system)
+DOP_COLUMNS = ("gdop", "pdop", "hdop", "vdop", "tdop")
+
+# Azimuths and elevations (radians) of the padded satellites of every epoch seen from receiver positions, shape (E, S, 2)
+# ecefs is (E, S, 3) and receiver_positions is (E, 3) or one position (3,), padded satellites get NaN
+def satellite_directions(ecefs: np.ndarray, mask: np.ndarray, receiver_positions: np.ndarray) -> np.ndarray:
+    receiver_positions = np.asarray(receiver_positions)
+
+    if receiver_positions.ndim == 2:
+        receiver_positions = receiver_positions[:, np.newaxis, :]
+
+    directions = azimuth_elevation(ecefs, receiver_positions)
+
+    directions[~mask] = np.nan
+
+    return directions
+
+# Removes satellites below an elevation mask (degrees) from the measurement mask of every epoch
+def mask_elevations(mask: np.ndarray, elevations: np.ndarray, elevation_mask: float = ELEVATION_MASK) -> np.ndarray:
+    return mask & (elevations >= np.radians(elevation_mask))
+
+# Dilution of precision of every epoch, shape (E, len(DOP_COLUMNS))
+# systems gives the system index of every satellite like in solve_epochs, each observed system adds a clock bias column
+# epochs that do not have enough satellites get infinite dilutions
+def dilution_of_precision(ecefs: np.ndarray, mask: np.ndarray, receiver_positions: np.ndarray, systems: np.ndarray = None) -> np.ndarray:
+    if systems is None:
+        systems = np.zeros(mask.shape[1], dtype=int)
+
+    num_systems = int(np.max(systems, initial=0)) + 1
+
+    receiver_positions = np.broadcast_to(receiver_positions, (mask.shape[0], 3))
+
+    line_of_sight_vectors = ecefs - receiver_positions[:, np.newaxis, :]
+
+    ranges = np.linalg.norm(line_of_sight_vectors, axis=2)
+
+    # padded satellites get a unit range to avoid division by zero
+    ranges[~mask] = 1
+
+    # geometry matrices with the line of sight in local east, north, up coordinates so the position block is already rotated
+    geodetic = ecef_to_geodetic(receiver_positions)
+
+    geometry_matrices = np.zeros(mask.shape + (3 + num_systems,))
+
+    rotate_to_enu(line_of_sight_vectors / ranges[:, :, np.newaxis], geodetic[:, np.newaxis, 0], geodetic[:, np.newaxis, 1], out=geometry_matrices[:, :, 0:3])
+    geometry_matrices[:, np.arange(mask.shape[1]), 3 + systems] = 1
+    geometry_matrices[~mask] = 0
+
+    normal_matrices = np.swapaxes(geometry_matrices, 1, 2) @ geometry_matrices
+
+    # unobserved systems get a unit diagonal so their zero clock columns do not make the matrices singular
+    observed = np.zeros((mask.shape[0], num_systems), dtype=bool)
+    observed[np.nonzero(mask)[0], systems[np.nonzero(mask)[1]]] = True
+
+    clock_diagonals = normal_matrices[:, np.arange(3, 3 + num_systems), np.arange(3, 3 + num_systems)]
+    normal_matrices[:, np.arange(3, 3 + num_systems), np.arange(3, 3 + num_systems)] = np.where(observed, clock_diagonals, 1)
+
+    enough = np.count_nonzero(mask, axis=1) >= 3 + np.count_nonzero(observed, axis=1)
+
+    variances = np.full((mask.shape[0], 3 + num_systems), np.inf)
+    variances[enough] = np.diagonal(np.linalg.pinv(normal_matrices[enough], hermitian=True), axis1=1, axis2=2)
+
+    dops = np.empty((mask.shape[0], len(DOP_COLUMNS)))
+
+    clock_variances = np.where(observed, variances[:, 3:], 0)
+
+    dops[:, 0] = np.sqrt(np.sum(variances[:, 0:3], axis=1) + np.sum(clock_variances, axis=1))
+    dops[:, 1] = np.sqrt(np.sum(variances[:, 0:3], axis=1))
+    dops[:, 2] = np.sqrt(variances[:, 0] + variances[:, 1])
+    dops[:, 3] = np.sqrt(variances[:, 2])
+    dops[:, 4] = np.sqrt(variances[np.arange(mask.shape[0]), 3 + np.argmax(observed, axis=1)])
+
+    return dops
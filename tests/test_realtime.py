@@ -0,0 +1,62 @@
+import asyncio
+
+import numpy as np
+
+from realtime import *
+from replay import *
+from synthetic import *
+
+# Satellites in the synthetic session, enough for every epoch to pass the elevation mask and the PDOP limit
+NUM_SATELLITES = 16
+
+# Length of the synthetic session (seconds)
+DURATION = 60
+
+# Largest distance allowed between a streamed fix and the batch fix of the same epoch (meters)
+POSITION_TOLERANCE = 0.01
+
+# Replays a recording to a real-time engine over TCP, as fast as possible, and returns the engine and its fixes
+async def replay_to_engine(path: str) -> tuple[RealtimeEngine, list[RealtimeFix]]:
+    server = await serve_replay(path, rate=0)
+
+    (host, port) = server.sockets[0].getsockname()[0:2]
+
+    async with server:
+        (reader, writer) = await open_tcp(host, port)
+
+        engine = RealtimeEngine()
+
+        fixes = [fix async for fix in engine.run(reader)]
+
+        writer.close()
+
+    return (engine, fixes)
+
+def test_realtime_replay(tmp_path):
+    path = str(tmp_path / "session.rtcm3")
+
+    truth = generate_session(path, num_satellites=NUM_SATELLITES, duration=DURATION)
+
+    (engine, fixes) = asyncio.run(replay_to_engine(path))
+
+    # one fix per epoch, in time order
+    times = np.array([fix.time for fix in fixes])
+
+    assert np.array_equal(times, truth["times"])
+    assert engine.epochs_solved == len(fixes)
+    assert engine.epochs_skipped == 0
+
+    latencies = np.array([fix.latency for fix in fixes])
+
+    assert np.all(np.isfinite(latencies))
+    assert np.all(latencies >= 0)
+    assert engine.max_latency == np.max(latencies)
+
+    # the streamed fixes match the batch solution of the same session
+    batch = estimate_fixes(sort_gps(*parse_data(path)))
+
+    assert np.array_equal(batch.times, times)
+
+    positions = np.array([fix.position for fix in fixes])
+
+    assert np.max(np.linalg.norm(positions - batch.positions, axis=1)) < POSITION_TOLERANCE